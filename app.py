@@ -1,18 +1,195 @@
-from flask import Flask, render_template, jsonify, request, Response, stream_with_context
+import time
+_IMPORT_T0 = time.perf_counter()
+from flask import Flask, render_template, jsonify, request, Response, stream_with_context, g, has_request_context
 from flask import send_file
-import sqlite3, pandas as pd, joblib, json, os, socket, time
+import sqlite3, pandas as pd, json, os, socket, threading
 from typing import Optional
-import requests
+from contextlib import contextmanager
 from datetime import timedelta
 import numpy as np
-from sklearn.linear_model import LinearRegression, Ridge, Lasso
+# scikit-learn, joblib and requests are imported where they are used: they are only needed once a
+# model is loaded or fitted, or an external API is called, and dominate import time otherwise.
+try:
+    import orjson  # optional: serializes numpy arrays directly on the JSON path
+except ImportError:
+    orjson = None
 
 app = Flask(__name__, template_folder="templates")
-MODEL = joblib.load("models/model.joblib")
-with open("models/metrics.json","r") as f:
-    METRICS = json.load(f)
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+class Metrics:
+    """Process-local counters, histograms and callback gauges rendered in the Prometheus text format
+    (served by /metrics). Labels are passed as a tuple of (name, value) pairs; observe/inc take one lock
+    and a few list updates, cheap enough for the request hot path."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._meta = {}  # name -> (type, help, buckets)
+        self._values = {}  # name -> {labels: float | [bucket counts..., sum, count]}
+        self._gauges = {}  # name -> fn() -> {labels: value}
+
+    def counter(self, name: str, help: str):
+        self._meta[name] = ("counter", help, None)
+        self._values.setdefault(name, {})
+
+    def histogram(self, name: str, help: str, buckets=LATENCY_BUCKETS):
+        self._meta[name] = ("histogram", help, tuple(buckets))
+        self._values.setdefault(name, {})
+
+    def gauge(self, name: str, help: str, fn, kind: str = "gauge"):
+        """Sampled at scrape time: fn() returns {labels: value}. kind='counter' for totals kept elsewhere."""
+        self._meta[name] = (kind, help, None)
+        self._gauges[name] = fn
+
+    def inc(self, name: str, labels: tuple = (), value: float = 1.0):
+        with self._lock:
+            series = self._values[name]
+            series[labels] = series.get(labels, 0.0) + value
+
+    def observe(self, name: str, value: float, labels: tuple = ()):
+        buckets = self._meta[name][2]
+        with self._lock:
+            series = self._values[name]
+            cell = series.get(labels)
+            if cell is None:
+                cell = series[labels] = [0] * (len(buckets) + 2)
+            for i, le in enumerate(buckets):
+                if value <= le:
+                    cell[i] += 1
+            cell[-2] += value
+            cell[-1] += 1
+
+    @staticmethod
+    def _labels(labels: tuple, extra: tuple = ()) -> str:
+        pairs = tuple(labels) + extra
+        if not pairs:
+            return ""
+        esc = lambda v: str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        return "{" + ",".join(f'{k}="{esc(v)}"' for k, v in pairs) + "}"
+
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            values = {name: {k: (list(v) if isinstance(v, list) else v) for k, v in series.items()}
+                      for name, series in self._values.items()}
+        for name, fn in self._gauges.items():
+            try:
+                values[name] = fn()
+            except Exception:
+                values[name] = {}
+        for name, (kind, help, buckets) in self._meta.items():
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, v in values.get(name, {}).items():
+                if kind != "histogram":
+                    lines.append(f"{name}{self._labels(labels)} {float(v):.6g}")
+                    continue
+                for le, n in zip(buckets, v):
+                    lines.append(f"{name}_bucket{self._labels(labels, (('le', f'{le:g}'),))} {n}")
+                lines.append(f"{name}_bucket{self._labels(labels, (('le', '+Inf'),))} {v[-1]}")
+                lines.append(f"{name}_sum{self._labels(labels)} {v[-2]:.6g}")
+                lines.append(f"{name}_count{self._labels(labels)} {v[-1]}")
+        return "\n".join(lines) + "\n"
+
+TELEMETRY = Metrics()
+TELEMETRY.histogram("microgrid_request_seconds", "HTTP request latency until the response headers, by endpoint and status.")
+TELEMETRY.histogram("microgrid_stage_seconds", "Time spent in instrumented stages (load, features, fit, forecast, costs, optimize, encode, ...).")
+TELEMETRY.histogram("microgrid_stream_tick_seconds", "Time to produce one SSE tick.")
+TELEMETRY.histogram("microgrid_stream_tick_lag_seconds", "Delay of SSE tick production past its schedule.")
+TELEMETRY.histogram("microgrid_sqlite_write_seconds", "Duration of one batched live_ticks write (executemany + commit).")
+TELEMETRY.counter("microgrid_sqlite_rows_total", "Rows written to live_ticks.")
+TELEMETRY.counter("microgrid_sqlite_write_errors_total", "Failed live_ticks batch writes.")
+TELEMETRY.histogram("microgrid_external_request_seconds", "Latency of calls to external APIs, by api.")
+TELEMETRY.counter("microgrid_external_errors_total", "Failed calls to external APIs, by api.")
+TELEMETRY.counter("microgrid_stream_errors_total", "SSE producer failures, by stage (state: building the stream, tick: one tick).")
+
+@contextmanager
+def stage(name: str):
+    """Time the block as stage `name`: observed into microgrid_stage_seconds and, inside a request, added
+    to that request's Server-Timing header (repeated stages accumulate)."""
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        dt = time.perf_counter() - t0
+        TELEMETRY.observe("microgrid_stage_seconds", dt, (("stage", name),))
+        if has_request_context():
+            timings = g.setdefault("stage_timings", {})
+            timings[name] = timings.get(name, 0.0) + dt
+
+@app.before_request
+def _start_request_timer():
+    g.request_t0 = time.perf_counter()
+
+@app.after_request
+def _record_request_timing(resp):
+    t0 = g.get("request_t0")
+    if t0 is None:
+        return resp
+    total = time.perf_counter() - t0
+    parts = [f"{name};dur={dt * 1000.0:.2f}" for name, dt in g.get("stage_timings", {}).items()]
+    if g.get("cache_status"):
+        parts.append(f'cache;desc="{g.cache_status}"')
+    parts.append(f"total;dur={total * 1000.0:.2f}")
+    resp.headers["Server-Timing"] = ", ".join(parts)
+    endpoint = request.url_rule.rule if request.url_rule is not None else "unmatched"
+    TELEMETRY.observe("microgrid_request_seconds", total, (("endpoint", endpoint), ("method", request.method), ("status", str(resp.status_code))))
+    return resp
+
+class ModelStore:
+    """Pretrained forecaster (models/model.joblib) and its metrics, loaded on first use. The lock makes
+    concurrent first requests load once. `mmap_mode` (MODEL_MMAP, e.g. "r") is passed to joblib.load so
+    arrays stored uncompressed are memory-mapped and their pages shared by the workers of a host."""
+
+    def __init__(self, model_path: str, metrics_path: str, mmap_mode: Optional[str] = None):
+        self.model_path = model_path
+        self.metrics_path = metrics_path
+        self.mmap_mode = mmap_mode or None
+        self.load_ms = None
+        self._model = None
+        self._metrics = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        with self._lock:
+            if self._model is None:
+                t0 = time.perf_counter()
+                with stage("model_load"):
+                    import joblib
+                    with open(self.metrics_path, "r") as f:
+                        self._metrics = json.load(f)
+                    self._model = joblib.load(self.model_path, mmap_mode=self.mmap_mode)
+                self.load_ms = round((time.perf_counter() - t0) * 1000.0, 1)
+
+    @property
+    def loaded(self) -> bool:
+        return self._model is not None
+
+    @property
+    def model(self):
+        if self._model is None:
+            self._load()
+        return self._model
+
+    @property
+    def metrics(self) -> dict:
+        if self._model is None:
+            self._load()
+        return self._metrics
+
+BASE_MODEL = ModelStore("models/model.joblib", "models/metrics.json", os.environ.get("MODEL_MMAP"))
+
+def __getattr__(name):
+    # app.MODEL / app.METRICS keep working for importers without loading the model at import time
+    if name == "MODEL":
+        return BASE_MODEL.model
+    if name == "METRICS":
+        return BASE_MODEL.metrics
+    raise AttributeError(name)
 
 DB_PATH = "data/consumption.db"
+CSV_PATH = os.path.join("data", "synthetic_consumption.csv")
 VOSK_MODEL_URL = os.environ.get(
     "VOSK_MODEL_PT_URL",
     "https://alphacephei.com/vosk/models/vosk-model-small-pt-0.3.zip",
@@ -77,6 +254,7 @@ def api_vosk_model():
             while attempts < 3:
                 attempts += 1
                 try:
+                    import requests
                     with requests.get(VOSK_MODEL_URL, stream=True, timeout=120) as r:
                         r.raise_for_status()
                         with open(tmp_path, "wb") as f:
@@ -129,64 +307,353 @@ def api_vosk_status():
     except Exception as e:
         return jsonify({"exists": False, "error": str(e)}), 200
 
-def load_source(source: str = "db"):
+def _parse_timestamps(values) -> np.ndarray:
+    """Parse mixed ISO strings (space or 'T' separator, optional offset) into naive int64 epoch-ns."""
+    ts = pd.to_datetime(pd.Series(values), utc=True, errors="coerce", format="ISO8601")
+    ts = ts.dt.tz_convert(None).astype("datetime64[ns]")
+    return ts.to_numpy().view("int64")
+
+def _read_csv_source(path: str) -> pd.DataFrame:
+    # Expecting columns: timestamp, consumption_kW, temperature_C
+    df = pd.read_csv(path)
+    if "timestamp" in df.columns:
+        df["timestamp"] = pd.to_datetime(df["timestamp"])
+    else:
+        # Fallback: create a monotonic timestamp if missing
+        df.insert(0, "timestamp", pd.date_range(end=pd.Timestamp.now(), periods=len(df), freq="H"))
+    if "consumption_kW" not in df.columns:
+        # Try common alternatives
+        for alt in ["consumption", "load", "power_kW"]:
+            if alt in df.columns:
+                df = df.rename(columns={alt: "consumption_kW"})
+                break
+    if "temperature_C" not in df.columns:
+        # Derive a mild diurnal temperature cycle if not provided
+        hours = df["timestamp"].dt.hour
+        df["temperature_C"] = 24 + 3 * np.sin((hours - 6) / 24 * 2 * np.pi)
+    return df[["timestamp", "consumption_kW", "temperature_C"]].sort_values("timestamp")
+
+class SeriesSnapshot:
+    """Read-only view of one store entry. Arrays are views into the entry buffers (no copy);
+    `version` changes whenever the underlying data changes."""
+    __slots__ = ("source", "version", "ts", "consumption_kW", "temperature_C", "site")
+
+    def __init__(self, source: str, version: int, ts: np.ndarray, load: np.ndarray, temp: np.ndarray, site: str = "default"):
+        self.source = source
+        self.site = site
+        self.version = version
+        self.ts = ts  # int64 epoch-ns, sorted ascending
+        self.consumption_kW = load
+        self.temperature_C = temp
+
+    def __len__(self):
+        return int(self.ts.shape[0])
+
+    @property
+    def label(self) -> str:
+        """Cache/registry key of the series: the source, prefixed by the site outside the default one."""
+        return self.source if self.site == "default" else f"{self.site}:{self.source}"
+
+    def frame(self) -> pd.DataFrame:
+        return pd.DataFrame({
+            "timestamp": self.ts.view("datetime64[ns]"),
+            "consumption_kW": self.consumption_kW,
+            "temperature_C": self.temperature_C,
+        }, copy=False)
+
+class _SeriesEntry:
+    """Sorted columnar buffers for one source. Capacity doubles on growth so appends are amortized O(1)
+    and views handed out earlier stay valid (they only ever see the prefix they were cut from)."""
+
+    def __init__(self, source: str, site: str = "default"):
+        self.source = source
+        self.site = site
+        self.lock = threading.Lock()
+        self.n = 0
+        self.ts = np.empty(0, dtype=np.int64)
+        self.load = np.empty(0, dtype=np.float64)
+        self.temp = np.empty(0, dtype=np.float64)
+        self.version = 0
+        self.loaded = False
+        self.fingerprint = None  # db: (data_version, count, max_ts) / csv: (mtime_ns, size)
+        self.conn = None
+
+    def replace(self, ts: np.ndarray, load: np.ndarray, temp: np.ndarray):
+        order = np.argsort(ts, kind="stable")
+        self.ts = np.ascontiguousarray(ts[order], dtype=np.int64)
+        self.load = np.ascontiguousarray(load[order], dtype=np.float64)
+        self.temp = np.ascontiguousarray(temp[order], dtype=np.float64)
+        self.n = len(self.ts)
+        self.version += 1
+        self.loaded = True
+
+    def append(self, ts: np.ndarray, load: np.ndarray, temp: np.ndarray):
+        k = len(ts)
+        if k == 0:
+            return
+        if self.n and ts.min() < self.ts[self.n - 1]:
+            # out-of-order rows: rebuild sorted (rare; live points arrive in time order)
+            self.replace(np.concatenate([self.ts[:self.n], ts]), np.concatenate([self.load[:self.n], load]),
+                         np.concatenate([self.temp[:self.n], temp]))
+            return
+        if self.n + k > len(self.ts):
+            cap = max(self.n + k, 2 * len(self.ts), 1024)
+            for name in ("ts", "load", "temp"):
+                old = getattr(self, name)
+                buf = np.empty(cap, dtype=old.dtype)
+                buf[:self.n] = old[:self.n]
+                setattr(self, name, buf)
+        self.ts[self.n:self.n + k] = ts
+        self.load[self.n:self.n + k] = load
+        self.temp[self.n:self.n + k] = temp
+        self.n += k
+        self.version += 1
+
+    def snapshot(self) -> SeriesSnapshot:
+        views = []
+        for arr in (self.ts, self.load, self.temp):
+            v = arr[:self.n]
+            v.flags.writeable = False
+            views.append(v)
+        return SeriesSnapshot(self.source, self.version, *views, site=self.site)
+
+class TimeSeriesStore:
+    """Process-wide in-memory time-series store with one entry per source.
+    - 'db': `consumption` table; 'ticks': `live_ticks` table; 'csv': the synthetic CSV.
+    DB entries revalidate with `PRAGMA data_version` (one cheap pragma per call) and, when other
+    connections committed, pull only rows newer than the last timestamp; CSV revalidates by mtime/size.
+    In-place rewrites that keep row count and max timestamp unchanged are not detected; call `invalidate`."""
+
+    TABLES = {"db": "consumption", "ticks": "live_ticks"}
+
+    def __init__(self, db_path: str = DB_PATH, csv_path: Optional[str] = CSV_PATH, site: str = "default"):
+        self.db_path = db_path
+        self.csv_path = csv_path
+        self.site = site
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def _entry(self, source: str) -> _SeriesEntry:
+        with self._lock:
+            e = self._entries.get(source)
+            if e is None:
+                e = self._entries[source] = _SeriesEntry(source, self.site)
+            return e
+
+    def snapshot(self, source: str) -> SeriesSnapshot:
+        """Return an up-to-date snapshot; raises if the source cannot be read."""
+        e = self._entry(source)
+        with e.lock:
+            if source == "csv":
+                self._refresh_csv(e)
+            else:
+                self._refresh_db(e, self.TABLES[source])
+            return e.snapshot()
+
+    def invalidate(self, source: Optional[str] = None):
+        with self._lock:
+            entries = list(self._entries.values()) if source is None else [self._entries.get(source)]
+        for e in entries:
+            if e is not None:
+                with e.lock:
+                    e.fingerprint = None
+                    e.loaded = False
+
+    def _refresh_csv(self, e: _SeriesEntry):
+        if not self.csv_path:
+            raise FileNotFoundError(f"site {self.site} has no CSV source")
+        st = os.stat(self.csv_path)
+        fp = (st.st_mtime_ns, st.st_size)
+        if e.loaded and e.fingerprint == fp:
+            return
+        df = _read_csv_source(self.csv_path)
+        e.replace(
+            pd.to_datetime(df["timestamp"]).astype("datetime64[ns]").to_numpy().view("int64"),
+            df["consumption_kW"].astype(float).to_numpy(),
+            df["temperature_C"].astype(float).to_numpy(),
+        )
+        e.fingerprint = fp
+
+    def _refresh_db(self, e: _SeriesEntry, table: str):
+        if e.conn is None:
+            e.conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        try:
+            data_version = e.conn.execute("PRAGMA data_version").fetchone()[0]
+            if e.loaded and e.fingerprint and e.fingerprint[0] == data_version:
+                return
+            # data_version is per file: writes to any table bump it, so check this table's shape first
+            count, max_ts = e.conn.execute(f"SELECT COUNT(*), MAX(timestamp) FROM {table}").fetchone()
+            if e.loaded and e.fingerprint and (count, max_ts) == e.fingerprint[1:]:
+                e.fingerprint = (data_version, count, max_ts)
+                return
+            rows = None
+            if e.loaded and e.fingerprint and e.fingerprint[2] is not None and count > e.n:
+                rows = e.conn.execute(
+                    f"SELECT timestamp, consumption_kW, temperature_C FROM {table} WHERE timestamp > ? ORDER BY timestamp ASC",
+                    (e.fingerprint[2],),
+                ).fetchall()
+                if e.n + len(rows) != count:
+                    rows = None
+            if rows is not None:
+                e.append(*self._columns(rows))
+            else:
+                rows = e.conn.execute(
+                    f"SELECT timestamp, consumption_kW, temperature_C FROM {table} ORDER BY timestamp ASC"
+                ).fetchall()
+                e.replace(*self._columns(rows))
+            e.fingerprint = (data_version, count, max_ts)
+        except Exception:
+            # drop the connection so the next call starts clean (e.g. file replaced)
+            try:
+                e.conn.close()
+            except Exception:
+                pass
+            e.conn = None
+            raise
+
+    @staticmethod
+    def _columns(rows: list):
+        if not rows:
+            return np.empty(0, dtype=np.int64), np.empty(0), np.empty(0)
+        ts_raw, load, temp = zip(*rows)
+        ts = _parse_timestamps(ts_raw)
+        load = np.array(load, dtype=np.float64)
+        temp = np.array([24.0 if t is None else t for t in temp], dtype=np.float64)
+        ok = ts != np.iinfo(np.int64).min  # NaT
+        return ts[ok], load[ok], temp[ok]
+
+STORE = TimeSeriesStore()
+
+class Site:
+    """One microgrid: its storage partition (SQLite file with `consumption`/`live_ticks`, optional CSV)
+    and battery/PV parameters used as defaults by the dashboard, stream and optimizers."""
+    FIELDS = ("name", "db_path", "csv_path", "cap_kwh", "batt_limit_kw", "pv_factor", "soc_min_pct", "soc_init_pct")
+    __slots__ = ("id",) + FIELDS
+
+    def __init__(self, id: str, name: Optional[str] = None, db_path: str = DB_PATH, csv_path: Optional[str] = None,
+                 cap_kwh: float = 10.0, batt_limit_kw: float = 2.0, pv_factor: float = 1.0,
+                 soc_min_pct: float = 0.0, soc_init_pct: float = 50.0):
+        self.id = id
+        self.name = name or id
+        self.db_path = db_path
+        self.csv_path = csv_path
+        self.cap_kwh = float(cap_kwh)
+        self.batt_limit_kw = float(batt_limit_kw)
+        self.pv_factor = float(pv_factor)
+        self.soc_min_pct = float(soc_min_pct)
+        self.soc_init_pct = float(soc_init_pct)
+
+    def to_dict(self) -> dict:
+        return {"id": self.id, **{f: getattr(self, f) for f in self.FIELDS if f not in ("db_path", "csv_path")}}
+
+class SiteRegistry:
+    """Sites served by this process, from SITES_CONFIG (JSON):
+      {"data_dir": "data/sites",
+       "sites": [{"id": "norte", "name": "...", "cap_kwh": 13.5, "batt_limit_kw": 5, "pv_factor": 1.2}, ...]}
+    Each site gets its own SQLite partition (`db_path`, default <data_dir>/<id>.db), TimeSeriesStore and
+    live-tick writer, created lazily. The "default" site is the original single-site setup (DB_PATH, CSV)."""
+    DEFAULT = "default"
+
+    def __init__(self, config: Optional[dict] = None):
+        import re
+        cfg = config or {}
+        data_dir = cfg.get("data_dir", os.path.join("data", "sites"))
+        self._sites = {self.DEFAULT: Site(self.DEFAULT, "Microgrid", DB_PATH, CSV_PATH)}
+        for spec in cfg.get("sites", []):
+            sid = str(spec["id"])
+            if not re.fullmatch(r"[A-Za-z0-9_-]{1,64}", sid):
+                raise ValueError(f"invalid site id: {sid!r}")
+            base = self._sites.get(sid)
+            params = {f: getattr(base, f) for f in Site.FIELDS} if base is not None else {"db_path": os.path.join(data_dir, f"{sid}.db")}
+            params.update({f: spec[f] for f in Site.FIELDS if f in spec})
+            self._sites[sid] = Site(sid, **params)
+        self._stores = {}
+        self._writers = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "SiteRegistry":
+        path = os.environ.get("SITES_CONFIG")
+        if path and os.path.exists(path):
+            with open(path, "r") as f:
+                return cls(json.load(f))
+        return cls()
+
+    def __contains__(self, site) -> bool:
+        return (site or self.DEFAULT) in self._sites
+
+    def ids(self) -> list:
+        return list(self._sites)
+
+    def get(self, site: Optional[str] = None) -> Site:
+        return self._sites[site or self.DEFAULT]
+
+    def store(self, site: Optional[str] = None) -> TimeSeriesStore:
+        cfg = self.get(site)
+        if cfg.id == self.DEFAULT:
+            return STORE
+        with self._lock:
+            st = self._stores.get(cfg.id)
+            if st is None:
+                st = self._stores[cfg.id] = TimeSeriesStore(cfg.db_path, cfg.csv_path, site=cfg.id)
+            return st
+
+    def writer(self, site: Optional[str] = None) -> "LiveTickWriter":
+        cfg = self.get(site)
+        if cfg.id == self.DEFAULT:
+            return LIVE_WRITER
+        with self._lock:
+            w = self._writers.get(cfg.id)
+            if w is None:
+                os.makedirs(os.path.dirname(cfg.db_path) or ".", exist_ok=True)
+                w = self._writers[cfg.id] = LiveTickWriter(cfg.db_path, batch_size=LIVE_WRITER.batch_size,
+                                                           flush_interval=LIVE_WRITER.flush_interval)
+                w.listeners.append(lambda rows, site=cfg.id: RESIDUALS.observe_rows(rows, site))
+                atexit.register(w.close)
+            return w
+
+SITES = SiteRegistry.from_env()
+
+def resolve_site(site_id) -> Optional[Site]:
+    """Site for a request's `site` parameter (default site when absent), or None when unknown."""
+    sid = str(site_id or SiteRegistry.DEFAULT).strip()
+    return SITES.get(sid) if sid in SITES else None
+
+def source_snapshot(source: str = "db", site: Optional[str] = None) -> Optional[SeriesSnapshot]:
+    """Snapshot backing `load_source`, or None when only the synthetic fallback is available."""
     source = (source or "db").lower()
+    store = SITES.store(site)
     if source == "csv":
-        # Expecting columns: timestamp, consumption_kW, temperature_C
-        df = pd.read_csv("data/synthetic_consumption.csv")
-        if "timestamp" in df.columns:
-            df["timestamp"] = pd.to_datetime(df["timestamp"])
-        else:
-            # Fallback: create a monotonic timestamp if missing
-            df.insert(0, "timestamp", pd.date_range(end=pd.Timestamp.now(), periods=len(df), freq="H"))
-        if "consumption_kW" not in df.columns:
-            # Try common alternatives
-            for alt in ["consumption", "load", "power_kW"]:
-                if alt in df.columns:
-                    df = df.rename(columns={alt: "consumption_kW"})
-                    break
-        if "temperature_C" not in df.columns:
-            # Derive a mild diurnal temperature cycle if not provided
-            hours = df["timestamp"].dt.hour
-            df["temperature_C"] = 24 + 3 * np.sin((hours - 6) / 24 * 2 * np.pi)
-        return df[["timestamp", "consumption_kW", "temperature_C"]].sort_values("timestamp")
-    # default: DB
-    return load_latest_data()
-
-def load_latest_data():
-    """Load data from SQLite; on failure or empty, fall back to CSV or generate synthetic."""
+        return store.snapshot("csv")
+    if source in ("ticks", "live_ticks"):
+        return store.snapshot("ticks")
     try:
-        conn = sqlite3.connect(DB_PATH)
-        df = pd.read_sql_query(
-            "SELECT timestamp, consumption_kW, temperature_C FROM consumption ORDER BY timestamp ASC",
-            conn,
-            parse_dates=["timestamp"],
-        )
-        conn.close()
-        if df is not None and len(df):
-            return df
+        snap = store.snapshot("db")
+        if len(snap):
+            return snap
     except Exception:
         pass
     # Fallback to CSV if available
     try:
-        csv_path = os.path.join("data", "synthetic_consumption.csv")
-        if os.path.exists(csv_path):
-            df = pd.read_csv(csv_path)
-            if "timestamp" in df.columns:
-                df["timestamp"] = pd.to_datetime(df["timestamp"])
-            else:
-                df.insert(0, "timestamp", pd.date_range(end=pd.Timestamp.now(), periods=len(df), freq="H"))
-            if "consumption_kW" not in df.columns:
-                for alt in ["consumption", "load", "power_kW"]:
-                    if alt in df.columns:
-                        df = df.rename(columns={alt: "consumption_kW"})
-                        break
-            if "temperature_C" not in df.columns:
-                hours = pd.to_datetime(df["timestamp"]).dt.hour
-                df["temperature_C"] = 24 + 3 * np.sin((hours - 6) / 24 * 2 * np.pi)
-            return df[["timestamp", "consumption_kW", "temperature_C"]].sort_values("timestamp")
+        if store.csv_path and os.path.exists(store.csv_path):
+            return store.snapshot("csv")
     except Exception:
         pass
+    return None
+
+def load_source(source: str = "db", site: Optional[str] = None):
+    source = (source or "db").lower()
+    if source in ("csv", "ticks", "live_ticks"):
+        return source_snapshot(source, site).frame()
+    # default: DB
+    return load_latest_data(site)
+
+def load_latest_data(site: Optional[str] = None):
+    """Load data from SQLite; on failure or empty, fall back to CSV or generate synthetic.
+    Both real sources are served from the site's in-memory store."""
+    snap = source_snapshot("db", site)
+    if snap is not None:
+        return snap.frame()
     # Final fallback: generate synthetic for the last ~14 days hourly
     now = pd.Timestamp.now().tz_localize(None)
     idx = pd.date_range(end=now, periods=24 * 14, freq="H")
@@ -197,38 +664,301 @@ def load_latest_data():
     load = np.maximum(0.2, (base + 0.05 * (temp - 24) + noise))
     return pd.DataFrame({"timestamp": idx, "consumption_kW": load, "temperature_C": temp})
 
+SERIES_COLUMNS = ("consumption_kW", "temperature_C")
+_TS_FORMATS = {}  # (db_path, table) -> True when stored as ISO 'T' strings
+_INDEXED = set()
+
+def _ensure_timestamp_index(conn, table: str, db_path: str = DB_PATH):
+    """Create an index on `table(timestamp)` once per process unless one already leads with timestamp."""
+    key = (db_path, table)
+    if key in _INDEXED:
+        return
+    try:
+        has = False
+        for row in conn.execute(f"PRAGMA index_list({table})").fetchall():
+            cols = conn.execute(f"PRAGMA index_info('{row[1]}')").fetchall()
+            if cols and cols[0][2] == "timestamp":
+                has = True
+                break
+        if not has:
+            conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_timestamp ON {table}(timestamp)")
+            conn.commit()
+        _INDEXED.add(key)
+    except Exception:
+        pass
+
+def _ts_bound(conn, table: str, ts, db_path: str = DB_PATH) -> str:
+    """Format a bound the way `table` stores timestamps so text comparison matches time order."""
+    key = (db_path, table)
+    if key not in _TS_FORMATS:
+        row = conn.execute(f"SELECT timestamp FROM {table} LIMIT 1").fetchone()
+        _TS_FORMATS[key] = bool(row and isinstance(row[0], str) and len(row[0]) > 10 and row[0][10] == "T")
+    ts = pd.Timestamp(ts)
+    if ts.tzinfo is not None:
+        ts = ts.tz_convert(None)
+    return ts.isoformat(sep="T" if _TS_FORMATS[key] else " ")
+
+def query_range(source: str = "db", start=None, end=None, columns=None, site: Optional[str] = None) -> pd.DataFrame:
+    """Rows with start <= timestamp <= end (either bound optional), projected to `columns`.
+    DB tables ('db' -> consumption, 'ticks' -> live_ticks) push the window down to SQLite as an indexed
+    range scan; 'csv' slices the in-memory store with searchsorted. Raises if the source is unreadable."""
+    source = (source or "db").lower()
+    cols = [c for c in (columns or SERIES_COLUMNS) if c in SERIES_COLUMNS]
+    store = SITES.store(site)
+    if source == "csv":
+        snap = store.snapshot("csv")
+        lo = 0 if start is None else int(np.searchsorted(snap.ts, pd.Timestamp(start).value, side="left"))
+        hi = len(snap) if end is None else int(np.searchsorted(snap.ts, pd.Timestamp(end).value, side="right"))
+        out = {"timestamp": snap.ts[lo:hi].view("datetime64[ns]")}
+        for c in cols:
+            out[c] = getattr(snap, c)[lo:hi]
+        return pd.DataFrame(out, copy=False)
+    conn = sqlite3.connect(store.db_path, timeout=10)
+    try:
+        rows = conn.execute(*_range_sql(conn, source, start, end, cols, store.db_path)).fetchall()
+    finally:
+        conn.close()
+    return _rows_frame(rows, cols)
+
+def _range_sql(conn, source: str, start, end, cols: list, db_path: str = DB_PATH):
+    table = TimeSeriesStore.TABLES["ticks" if source in ("ticks", "live_ticks") else "db"]
+    _ensure_timestamp_index(conn, table, db_path)
+    where, args = [], []
+    if start is not None:
+        where.append("timestamp >= ?")
+        args.append(_ts_bound(conn, table, start, db_path))
+    if end is not None:
+        where.append("timestamp <= ?")
+        args.append(_ts_bound(conn, table, end, db_path))
+    sql = f"SELECT {', '.join(['timestamp'] + cols)} FROM {table}"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    return sql + " ORDER BY timestamp ASC", args
+
+def _rows_frame(rows: list, cols: list) -> pd.DataFrame:
+    """DataFrame from (timestamp, *cols) SQLite rows: parsed datetime64 timestamps, float columns."""
+    if not rows:
+        return pd.DataFrame({"timestamp": pd.Series([], dtype="datetime64[ns]"), **{c: pd.Series([], dtype=float) for c in cols}})
+    data = list(zip(*rows))
+    out = {"timestamp": _parse_timestamps(data[0]).view("datetime64[ns]")}
+    for c, vals in zip(cols, data[1:]):
+        out[c] = np.array([np.nan if v is None else v for v in vals], dtype=np.float64)
+    return pd.DataFrame(out).dropna(subset=["timestamp"])
+
+def iter_range(source: str = "db", start=None, end=None, columns=None, chunk: int = 50_000, site: Optional[str] = None):
+    """load_range in chunks of at most `chunk` rows, in timestamp order, with the same fallbacks. DB tables
+    are read through one cursor with fetchmany, so memory stays bounded by `chunk` whatever the range."""
+    source = (source or "db").lower()
+    cols = [c for c in (columns or SERIES_COLUMNS) if c in SERIES_COLUMNS]
+    store = SITES.store(site)
+    target = source if source in ("csv", "ticks", "live_ticks") else None
+    if target is None:
+        try:
+            target = "db" if latest_timestamp(source, site) is not None else None
+        except Exception:
+            target = None
+    if target is None and store.csv_path and os.path.exists(store.csv_path):
+        target = "csv"
+    if target in ("db", "ticks", "live_ticks"):
+        conn = sqlite3.connect(store.db_path, timeout=10)
+        try:
+            cur = conn.execute(*_range_sql(conn, target, start, end, cols, store.db_path))
+            while True:
+                rows = cur.fetchmany(chunk)
+                if not rows:
+                    break
+                yield _rows_frame(rows, cols)
+        finally:
+            conn.close()
+        return
+    # CSV store slices (or the synthetic fallback) are already in memory
+    df = query_range("csv", start, end, cols, site) if target == "csv" else load_range(source, start, end, cols, site)
+    for i in range(0, len(df), chunk):
+        yield df.iloc[i:i + chunk]
+
+def latest_timestamp(source: str = "db", site: Optional[str] = None) -> Optional[pd.Timestamp]:
+    """Newest timestamp of a source without loading it (indexed MAX for DB tables)."""
+    source = (source or "db").lower()
+    store = SITES.store(site)
+    if source == "csv":
+        snap = store.snapshot("csv")
+        return pd.Timestamp(int(snap.ts[-1])) if len(snap) else None
+    table = TimeSeriesStore.TABLES["ticks" if source in ("ticks", "live_ticks") else "db"]
+    conn = sqlite3.connect(store.db_path, timeout=10)
+    try:
+        _ensure_timestamp_index(conn, table, store.db_path)
+        row = conn.execute(f"SELECT MAX(timestamp) FROM {table}").fetchone()
+    finally:
+        conn.close()
+    if not row or row[0] is None:
+        return None
+    return pd.Timestamp(int(_parse_timestamps([row[0]])[0]))
+
+def load_range(source: str = "db", start=None, end=None, columns=None, site: Optional[str] = None) -> pd.DataFrame:
+    """query_range with load_source's fallbacks: an empty/unreadable DB falls back to the CSV, then to
+    the synthetic series (filtered in memory)."""
+    source = (source or "db").lower()
+    try:
+        if source in ("csv", "ticks", "live_ticks") or latest_timestamp(source, site) is not None:
+            return query_range(source, start, end, columns, site)
+    except Exception:
+        if source in ("csv", "ticks", "live_ticks"):
+            raise
+    csv_path = SITES.get(site).csv_path
+    try:
+        if csv_path and os.path.exists(csv_path):
+            return query_range("csv", start, end, columns, site)
+    except Exception:
+        pass
+    df = load_latest_data(site)
+    ts = pd.to_datetime(df["timestamp"])
+    mask = np.ones(len(df), dtype=bool)
+    if start is not None:
+        mask &= (ts >= pd.Timestamp(start)).to_numpy()
+    if end is not None:
+        mask &= (ts <= pd.Timestamp(end)).to_numpy()
+    cols = [c for c in (columns or SERIES_COLUMNS) if c in SERIES_COLUMNS]
+    return df.loc[mask, ["timestamp"] + cols].reset_index(drop=True)
+
+def latest_source_timestamp(source: str = "db", site: Optional[str] = None) -> Optional[pd.Timestamp]:
+    """latest_timestamp with the same fallbacks as load_range."""
+    source = (source or "db").lower()
+    try:
+        ts = latest_timestamp(source, site)
+        if ts is not None or source in ("csv", "ticks", "live_ticks"):
+            return ts
+    except Exception:
+        if source in ("csv", "ticks", "live_ticks"):
+            raise
+    csv_path = SITES.get(site).csv_path
+    try:
+        if csv_path and os.path.exists(csv_path):
+            return latest_timestamp("csv", site)
+    except Exception:
+        pass
+    df = load_latest_data(site)
+    return pd.Timestamp(pd.to_datetime(df["timestamp"]).max())
+
 def estimate_temp(ts: pd.Timestamp) -> float:
     ts = pd.to_datetime(ts)
     hour = ts.hour + (ts.minute or 0)/60
     return float(24 + 3 * np.sin((hour - 6) / 24 * 2 * np.pi))
 
+def estimate_temp_array(ts: pd.DatetimeIndex) -> np.ndarray:
+    """Vectorized estimate_temp over a DatetimeIndex."""
+    hour = ts.hour.to_numpy() + ts.minute.to_numpy() / 60
+    return 24 + 3 * np.sin((hour - 6) / 24 * 2 * np.pi)
+
+class WeatherProvider:
+    """Forecast temperatures from WEATHER_API_URL, fetched at most once per `ttl` seconds and kept as
+    sorted epoch-ns / temperature arrays. The endpoint returns JSON with forecast entries holding
+    'timestamp' and 'temperature_C' (optionally wrapped in {"forecast": [...]}). Concurrent callers share
+    one in-flight fetch. `file:///path.json` (or a plain path) reads a local file instead of HTTP,
+    which is handy for tests and offline runs. Best-effort: lookups return NaN when nothing is available."""
+
+    def __init__(self, url: Optional[str] = None, ttl: float = 600.0, error_ttl: float = 30.0, timeout: float = 4.0):
+        self.url = url  # None: read WEATHER_API_URL on each refresh
+        self.ttl = float(ttl)
+        self.error_ttl = float(error_ttl)
+        self.timeout = float(timeout)
+        self._lock = threading.Lock()
+        self._inflight = None
+        self._table = None  # (ts int64 ns, temp float64)
+        self._table_url = None
+        self._expires = 0.0
+
+    def _current_url(self) -> Optional[str]:
+        return self.url if self.url is not None else os.environ.get("WEATHER_API_URL")
+
+    def _fetch(self, url: str):
+        if url.startswith("file://") or "://" not in url:
+            with open(url[len("file://"):] if url.startswith("file://") else url, "r") as f:
+                j = json.load(f)
+        else:
+            import requests
+            r = requests.get(url, timeout=self.timeout)
+            r.raise_for_status()
+            j = r.json()
+        items = (j.get("forecast") or j) if isinstance(j, dict) else j
+        ts = _parse_timestamps([it.get("timestamp") for it in items])
+        temp = np.array([float(it.get("temperature_C", np.nan)) for it in items], dtype=np.float64)
+        ok = (ts != np.iinfo(np.int64).min) & np.isfinite(temp)
+        ts, temp = ts[ok], temp[ok]
+        order = np.argsort(ts, kind="stable")
+        return ts[order], temp[order]
+
+    def table(self):
+        """Current (ts, temp) arrays or None; refreshes when expired, sharing one fetch across threads."""
+        url = self._current_url()
+        if not url:
+            return None
+        with self._lock:
+            if self._table_url == url and time.monotonic() < self._expires:
+                return self._table
+            done = self._inflight
+            leader = done is None
+            if leader:
+                done = self._inflight = threading.Event()
+        if not leader:
+            done.wait(self.timeout + 1.0)
+            with self._lock:
+                return self._table if self._table_url == url else None
+        t0 = time.perf_counter()
+        try:
+            table, ttl = self._fetch(url), self.ttl
+        except Exception:
+            # keep serving the previous table (if any) and retry sooner
+            table, ttl = (self._table if self._table_url == url else None), self.error_ttl
+            TELEMETRY.inc("microgrid_external_errors_total", (("api", "weather"),))
+        TELEMETRY.observe("microgrid_external_request_seconds", time.perf_counter() - t0, (("api", "weather"),))
+        with self._lock:
+            self._table, self._table_url = table, url
+            self._expires = time.monotonic() + ttl
+            self._inflight = None
+        done.set()
+        return table
+
+    def lookup(self, ts) -> np.ndarray:
+        """Temperature of the closest forecast entry for each timestamp (NaN when unavailable)."""
+        target = pd.DatetimeIndex(np.atleast_1d(pd.to_datetime(ts))).tz_localize(None).astype("datetime64[ns]").asi8
+        table = self.table()
+        if table is None or len(table[0]) == 0:
+            return np.full(len(target), np.nan)
+        t, temp = table
+        i = np.clip(np.searchsorted(t, target), 1, max(1, len(t) - 1))
+        lo = np.maximum(i - 1, 0)
+        hi = np.minimum(i, len(t) - 1)
+        pick = np.where(np.abs(target - t[lo]) <= np.abs(t[hi] - target), lo, hi)
+        return temp[pick]
+
+    def interpolate(self, ts) -> np.ndarray:
+        """Linear interpolation between forecast entries, clamped at both ends (NaN when unavailable)."""
+        target = pd.DatetimeIndex(np.atleast_1d(pd.to_datetime(ts))).tz_localize(None).astype("datetime64[ns]").asi8
+        table = self.table()
+        if table is None or len(table[0]) == 0:
+            return np.full(len(target), np.nan)
+        t, temp = table
+        return np.interp(target.astype(np.float64), t.astype(np.float64), temp)
+
+WEATHER = WeatherProvider(ttl=float(os.environ.get("WEATHER_TTL_S", "600")))
+
 def _weather_forecast(ts: pd.Timestamp) -> Optional[float]:
-    """Optional external weather forecast for a given timestamp. Expected WEATHER_API_URL that returns
-    JSON containing forecast entries with 'timestamp' and 'temperature_C'. This is a best-effort helper; returns None on any issue."""
-    url = os.environ.get("WEATHER_API_URL")
-    if not url:
-        return None
+    """Optional external weather forecast for a given timestamp (see WeatherProvider); None when unavailable."""
     try:
-        r = requests.get(url, timeout=4)
-        r.raise_for_status()
-        j = r.json()
-        items = j.get("forecast") or j
-        target = pd.to_datetime(ts)
-        # pick the closest entry
-        best = None
-        best_dt = None
-        for it in items:
-            t = pd.to_datetime(it.get("timestamp"))
-            if pd.isna(t):
-                continue
-            if best is None or abs((t - target).total_seconds()) < abs((best_dt - target).total_seconds()):
-                best = float(it.get("temperature_C", np.nan))
-                best_dt = t
-        if best is not None and np.isfinite(best):
-            return best
+        v = float(WEATHER.lookup(ts)[0])
     except Exception:
         return None
-    return None
+    return v if np.isfinite(v) else None
+
+def forecast_temps(ts: pd.DatetimeIndex) -> np.ndarray:
+    """Temperatures for a whole horizon: external forecast where available, diurnal estimate elsewhere."""
+    ts = pd.DatetimeIndex(ts)
+    est = estimate_temp_array(ts)
+    try:
+        ext = WEATHER.lookup(ts)
+    except Exception:
+        return est
+    return np.where(np.isfinite(ext), ext, est)
 
 def make_lag_features(df, n_lags=24):
     df = df.copy().sort_values("timestamp")
@@ -239,6 +969,425 @@ def make_lag_features(df, n_lags=24):
     df = df.dropna().reset_index(drop=True)
     return df
 
+def _fast_predictor(model):
+    """Return f(X) -> y for a float64 ndarray X of shape (n, n_features), skipping the per-call
+    pandas/validation overhead of `model.predict`. Linear models reduce to a dot product; forests
+    average their trees exactly like `predict` does (float32 inputs, running sum then divide)."""
+    coef = getattr(model, "coef_", None)
+    if coef is not None and np.ndim(coef) == 1:
+        coef = np.asarray(coef, dtype=np.float64)
+        intercept = float(getattr(model, "intercept_", 0.0))
+        return lambda X: X @ coef + intercept
+    trees = [getattr(est, "tree_", None) for est in getattr(model, "estimators_", [])]
+    if trees and all(t is not None for t in trees) and model.__class__.__name__.startswith(("RandomForest", "ExtraTrees")):
+        def predict_forest(X):
+            X32 = np.ascontiguousarray(X, dtype=np.float32)
+            out = np.zeros(len(X32), dtype=np.float64)
+            for t in trees:
+                out += t.predict(X32).reshape(len(X32), -1)[:, 0]
+            return out / len(trees)
+        return predict_forest
+    import warnings
+    def predict_generic(X):
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", UserWarning)  # fitted with feature names, fed an ndarray
+            return np.asarray(model.predict(X), dtype=np.float64)
+    return predict_generic
+
+def forecast_recursive(model, features: list, row: dict, horizon: int = 24, temps_fn=None,
+                       step: pd.Timedelta = pd.Timedelta(hours=1)):
+    """Recursive multi-step forecast seeded from the last lag-feature row.
+    The lag window lives in a numpy ring buffer and feature rows are written into one preallocated
+    (horizon, n_features) matrix, so each step is a single ndarray predict with no DataFrame.
+    Step h keeps the calendar features of step h-1 (the seed row for h=0), as the original loop did.
+    temps_fn(DatetimeIndex) -> temperatures for the target timestamps (defaults to estimate_temp_array).
+    Returns (DatetimeIndex of targets, ndarray of predictions)."""
+    horizon = int(max(1, horizon))
+    n_feat = len(features)
+    lag_cols = {int(f[4:]): i for i, f in enumerate(features) if f.startswith("lag_")}
+    n_lags = max(lag_cols) if lag_cols else 0
+    origin = pd.Timestamp(row["timestamp"])
+    targets = pd.date_range(start=origin + step, periods=horizon, freq=step)
+    calendar = targets - step
+    X = np.empty((horizon, n_feat), dtype=np.float64)
+    for i, f in enumerate(features):
+        if f == "hour":
+            X[:, i] = calendar.hour
+        elif f == "dayofweek":
+            X[:, i] = calendar.dayofweek
+        elif f == "temperature_C":
+            X[:, i] = temps_fn(targets) if temps_fn is not None else estimate_temp_array(targets)
+        elif not f.startswith("lag_"):
+            X[:, i] = float(row[f])
+    # ring[(head - k) % n_lags] holds lag_k; head advances one slot per step
+    ring = np.array([float(row[f"lag_{k}"]) for k in range(n_lags, 0, -1)], dtype=np.float64)
+    head = 0
+    lag_idx = np.fromiter(lag_cols.values(), dtype=np.intp, count=len(lag_cols))
+    lag_off = np.fromiter(lag_cols.keys(), dtype=np.intp, count=len(lag_cols))
+    predict = _fast_predictor(model)
+    out = np.empty(horizon, dtype=np.float64)
+    for h in range(horizon):
+        if n_lags:
+            X[h, lag_idx] = ring[(head - lag_off) % n_lags]
+        y = float(predict(X[h:h + 1])[0])
+        out[h] = y
+        if n_lags:
+            ring[head % n_lags] = y
+            head += 1
+    return targets, out
+
+def forecast_recursive_batch(models: list, features: list, rows: list, horizon: int = 24, temps_fn=None,
+                             step: pd.Timedelta = pd.Timedelta(hours=1)):
+    """forecast_recursive for S series at once (e.g. one per site), with the same feature layout.
+    Feature rows live in one (S, horizon, n_features) array and the lag rings in an (S, n_lags) array, so
+    each step is one predict over all series sharing a model; linear models are stacked into a single
+    (S, n_features) coefficient matrix. temps_fn is called once for every target of every series.
+    Returns ((S, horizon) datetime64[ns] targets, (S, horizon) predictions)."""
+    horizon = int(max(1, horizon))
+    S, n_feat = len(rows), len(features)
+    lag_cols = {int(f[4:]): i for i, f in enumerate(features) if f.startswith("lag_")}
+    n_lags = max(lag_cols) if lag_cols else 0
+    origins = pd.DatetimeIndex([pd.Timestamp(r["timestamp"]) for r in rows]).asi8
+    targets = origins[:, None] + step.value * np.arange(1, horizon + 1, dtype=np.int64)[None, :]
+    calendar = pd.DatetimeIndex((targets - step.value).ravel())
+    target_idx = pd.DatetimeIndex(targets.ravel())
+    X = np.empty((S, horizon, n_feat), dtype=np.float64)
+    for i, f in enumerate(features):
+        if f == "hour":
+            X[:, :, i] = np.asarray(calendar.hour).reshape(S, horizon)
+        elif f == "dayofweek":
+            X[:, :, i] = np.asarray(calendar.dayofweek).reshape(S, horizon)
+        elif f == "temperature_C":
+            temps = temps_fn(target_idx) if temps_fn is not None else estimate_temp_array(target_idx)
+            X[:, :, i] = np.asarray(temps, dtype=np.float64).reshape(S, horizon)
+        elif not f.startswith("lag_"):
+            X[:, :, i] = np.array([float(r[f]) for r in rows])[:, None]
+    ring = np.array([[float(r[f"lag_{k}"]) for k in range(n_lags, 0, -1)] for r in rows], dtype=np.float64).reshape(S, n_lags)
+    head = 0
+    lag_idx = np.fromiter(lag_cols.values(), dtype=np.intp, count=len(lag_cols))
+    lag_off = np.fromiter(lag_cols.keys(), dtype=np.intp, count=len(lag_cols))
+    # predictor groups: all linear models as one stacked dot product, every other model once per step
+    linear, groups = [], {}
+    for s, m in enumerate(models):
+        if np.ndim(getattr(m, "coef_", None)) == 1:
+            linear.append(s)
+        else:
+            groups.setdefault(id(m), (m, []))[1].append(s)
+    if linear:
+        lin_idx = np.array(linear, dtype=np.intp)
+        W = np.array([np.asarray(models[s].coef_, dtype=np.float64) for s in linear])
+        b = np.array([float(getattr(models[s], "intercept_", 0.0)) for s in linear])
+    predictors = [(np.array(idx, dtype=np.intp), _fast_predictor(m)) for m, idx in groups.values()]
+    out = np.empty((S, horizon), dtype=np.float64)
+    for h in range(horizon):
+        Xh = X[:, h]
+        if n_lags:
+            Xh[:, lag_idx] = ring[:, (head - lag_off) % n_lags]
+        if linear:
+            out[lin_idx, h] = np.einsum("sf,sf->s", Xh[lin_idx], W) + b
+        for idx, predict in predictors:
+            out[idx, h] = predict(Xh[idx])
+        if n_lags:
+            ring[:, head % n_lags] = out[:, h]
+            head += 1
+    return targets.view("datetime64[ns]"), out
+
+def _train_test_split(df_feat: pd.DataFrame, features: list):
+    """Time-based split: last ~3 days (at least 24 rows) held out for test."""
+    X = df_feat[features]
+    y = df_feat["consumption_kW"].astype(float)
+    if len(df_feat) >= 2:
+        dt_hours = float(pd.Series(df_feat["timestamp"]).diff().dropna().dt.total_seconds().median() / 3600.0)
+        if not np.isfinite(dt_hours) or dt_hours <= 0:
+            dt_hours = 1.0
+    else:
+        dt_hours = 1.0
+    steps_day = int(max(1, round(24.0 / dt_hours)))
+    test_n = int(min(len(df_feat)//3, max(steps_day*3, 24)))
+    split = max(1, len(df_feat) - test_n)
+    return X.iloc[:split], y.iloc[:split], X.iloc[split:], y.iloc[split:]
+
+def _mae(y_true, y_pred) -> float:
+    try:
+        return float(np.mean(np.abs(y_true.values - y_pred)))
+    except Exception:
+        return float("inf")
+
+def _linear_model(name: str, **params):
+    from sklearn import linear_model
+    return getattr(linear_model, name)(**params)
+
+ALGO_FACTORIES = {
+    "linear": lambda: _linear_model("LinearRegression"),
+    "ridge": lambda: _linear_model("Ridge", alpha=1.0),
+    "lasso": lambda: _linear_model("Lasso", alpha=0.001, max_iter=10000),
+}
+
+def fit_algo(algo: str, df_feat: pd.DataFrame, features: list):
+    """Fit `algo` ('linear'|'ridge'|'lasso'|'auto') on the time split and return (algo, model, mae_test).
+    'auto' evaluates the saved RF on the test split too and resolves to the best of the four."""
+    X_train, y_train, X_test, y_test = _train_test_split(df_feat, features)
+    if algo != "auto":
+        model = ALGO_FACTORIES[algo]()
+        model.fit(X_train, y_train)
+        try:
+            mae = _mae(y_test, model.predict(X_test))
+        except Exception:
+            mae = float(BASE_MODEL.metrics.get("mae_test", 0.5))
+        return algo, model, mae
+    rf_mae = _mae(y_test, BASE_MODEL.model.predict(X_test)) if len(X_test) else float(BASE_MODEL.metrics.get("mae_test", 0.5))
+    best = ("rf", BASE_MODEL.model, rf_mae)
+    for name in ("linear", "ridge", "lasso"):
+        try:
+            model = ALGO_FACTORIES[name]()
+            model.fit(X_train, y_train)
+            mae = _mae(y_test, model.predict(X_test))
+            if mae < best[2]:
+                best = (name, model, mae)
+        except Exception:
+            pass
+    return best
+
+class ModelRegistry:
+    """Bounded LRU of fitted estimators keyed by (source, algo, data_version, feature_config).
+    A lookup for a newer data version of an (source, algo, features) already in the cache returns the
+    previous fit immediately and retrains in a background thread; a cold miss fits synchronously, once:
+    concurrent requests for the same key wait for that fit instead of running their own."""
+
+    def __init__(self, max_entries: int = 16):
+        from collections import OrderedDict
+        from concurrent.futures import ThreadPoolExecutor
+        self.max_entries = max_entries
+        self._models = OrderedDict()  # key -> (algo, model, mae)
+        self._latest = {}  # (source, algo, feature_config) -> newest key
+        self._pending = set()
+        self._inflight = {}  # key -> [Event, result or None, exception or None] of a cold-miss fit
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="model-fit")
+
+    def get(self, source: str, algo: str, version: int, feature_config: tuple, df_feat: pd.DataFrame, features: list):
+        key = (source, algo, version, feature_config)
+        family = (source, algo, feature_config)
+        with self._lock:
+            hit = self._models.get(key)
+            if hit is not None:
+                self._models.move_to_end(key)
+                return hit
+            stale_key = self._latest.get(family)
+            stale = self._models.get(stale_key) if stale_key is not None else None
+            if stale is not None:
+                self._models.move_to_end(stale_key)
+                if key not in self._pending:
+                    self._pending.add(key)
+                    self._executor.submit(self._fit_into, key, family, df_feat, features)
+                return stale
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[key] = [threading.Event(), None, None]
+        if not leader:
+            flight[0].wait()
+            if flight[2] is not None:
+                raise flight[2]
+            return flight[1]
+        try:
+            flight[1] = fit_algo(algo, df_feat, features)
+            with self._lock:
+                self._store(key, family, flight[1])
+            return flight[1]
+        except Exception as e:
+            flight[2] = e
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            flight[0].set()
+
+    def _fit_into(self, key, family, df_feat, features):
+        try:
+            result = fit_algo(key[1], df_feat, features)
+            with self._lock:
+                self._store(key, family, result)
+        except Exception:
+            pass
+        finally:
+            with self._lock:
+                self._pending.discard(key)
+
+    def _store(self, key, family, result):
+        prev = self._latest.get(family)
+        if prev is not None and prev != key and prev[2] < key[2]:
+            self._models.pop(prev, None)
+        if prev is None or prev[2] <= key[2]:
+            self._latest[family] = key
+        self._models[key] = result
+        self._models.move_to_end(key)
+        while len(self._models) > self.max_entries:
+            old, _ = self._models.popitem(last=False)
+            if self._latest.get(old[:2] + old[3:]) == old:
+                del self._latest[old[:2] + old[3:]]
+
+    def clear(self):
+        with self._lock:
+            self._models.clear()
+            self._latest.clear()
+
+MODEL_REGISTRY = ModelRegistry(max_entries=int(os.environ.get("MODEL_CACHE_SIZE", "16")))
+
+class ResidualStore:
+    """Rolling out-of-sample residuals (actual - forecast) per (series label, algo) and forecast step, turned
+    into split-conformal quantile bands by lookup.
+    - seeded once per (source, algo) by a background backtest of the fitted model over the held-out split;
+    - every forecast served is kept as pending and resolved as actuals arrive from `live_ticks`
+      (observe_rows is a LiveTickWriter listener, one per site), so the windows keep rolling with no refits.
+    Steps with fewer than `min_count` residuals reuse the nearest calibrated earlier step."""
+
+    def __init__(self, max_steps: int = 168, window: int = 500, min_count: int = 10, tolerance_s: float = 3600.0):
+        from collections import deque
+        from concurrent.futures import ThreadPoolExecutor
+        self.max_steps = int(max_steps)
+        self.window = int(window)
+        self.min_count = int(min_count)
+        self.tolerance_ns = int(tolerance_s * 1e9)
+        self._deque = deque
+        self._rings = {}  # key -> [residuals (max_steps, window), next slot (max_steps,), count (max_steps,), version]
+        self._pending = {}  # key -> deque of [targets_ns, yhat, resolved mask]
+        self._bands = {}  # (key, lo, hi) -> (version, q_lo, q_hi, count)
+        self._seeded = set()
+        self._last_tick = {}  # site -> (ts_ns, kW) carried between observe batches
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="residual-backtest")
+
+    def add(self, key: tuple, steps, residuals):
+        """Append residuals for 0-based forecast steps into the per-step rings."""
+        with self._lock:
+            ring = self._rings.get(key)
+            if ring is None:
+                ring = self._rings[key] = [np.full((self.max_steps, self.window), np.nan), np.zeros(self.max_steps, dtype=np.intp),
+                                           np.zeros(self.max_steps, dtype=np.intp), 0]
+            res, slot, count = ring[0], ring[1], ring[2]
+            for h, r in zip(np.asarray(steps).tolist(), np.asarray(residuals, dtype=np.float64).tolist()):
+                if 0 <= h < self.max_steps and np.isfinite(r):
+                    res[h, slot[h]] = r
+                    slot[h] = (slot[h] + 1) % self.window
+                    count[h] = min(self.window, count[h] + 1)
+            ring[3] += 1
+
+    def record(self, key: tuple, targets_ns: np.ndarray, yhat: np.ndarray):
+        """Keep a served forecast until its targets are observed; a repeat of the same origin replaces it."""
+        targets_ns = np.asarray(targets_ns, dtype=np.int64)
+        with self._lock:
+            pending = self._pending.setdefault(key, self._deque(maxlen=32))
+            if pending and len(pending[-1][0]) and len(targets_ns) and pending[-1][0][0] == targets_ns[0]:
+                pending.pop()
+            pending.append([targets_ns, np.asarray(yhat, dtype=np.float64), np.zeros(len(targets_ns), dtype=bool)])
+
+    @staticmethod
+    def _site_of(key: tuple) -> str:
+        label = key[0]
+        return label.split(":", 1)[0] if ":" in label else "default"
+
+    def observe(self, ts_ns: np.ndarray, values: np.ndarray, site: str = "default"):
+        """Resolve pending forecast targets of `site` covered by new actuals (linear interpolation between
+        ticks no more than `tolerance_s` apart; targets inside larger gaps are dropped)."""
+        order = np.argsort(ts_ns, kind="stable")
+        xs, ys = np.asarray(ts_ns, dtype=np.int64)[order], np.asarray(values, dtype=np.float64)[order]
+        if not len(xs):
+            return
+        with self._lock:
+            last = self._last_tick.get(site)
+            if last is not None and last[0] < xs[0]:
+                xs, ys = np.append(last[0], xs), np.append(last[1], ys)
+            self._last_tick[site] = (int(xs[-1]), float(ys[-1]))
+            pending = {k: list(v) for k, v in self._pending.items() if self._site_of(k) == site}
+        for key, forecasts in pending.items():
+            for fc in forecasts:
+                targets, yhat, done = fc
+                todo = np.flatnonzero(~done & (targets <= xs[-1]))
+                if not len(todo):
+                    continue
+                t = targets[todo]
+                pos = np.clip(np.searchsorted(xs, t), 1, len(xs) - 1) if len(xs) > 1 else np.zeros(len(t), dtype=np.intp)
+                exact = xs[np.minimum(pos, len(xs) - 1)] == t
+                ok = exact | ((xs[pos] - xs[pos - 1] <= self.tolerance_ns) & (xs[pos - 1] <= t) & (len(xs) > 1))
+                actual = np.interp(t, xs, ys)
+                self.add(key, todo[ok], actual[ok] - yhat[todo[ok]])
+                done[todo] = True
+        with self._lock:
+            for key, forecasts in self._pending.items():
+                keep = [fc for fc in forecasts if not fc[2].all()]
+                forecasts.clear()
+                forecasts.extend(keep)
+
+    def observe_rows(self, rows: list, site: str = "default"):
+        """LiveTickWriter listener: rows are (timestamp_iso, consumption_kW, temperature_C)."""
+        ts = _parse_timestamps([r[0] for r in rows])
+        ok = ts != np.iinfo(np.int64).min
+        self.observe(ts[ok], np.array([r[1] for r in rows], dtype=np.float64)[ok], site)
+
+    def seed(self, key: tuple, model, features: list, df_feat: pd.DataFrame, origins: int = 24):
+        """Backtest `model` once per key in the background: recursive forecasts from up to `origins` points of
+        the held-out split, scored against the following actuals."""
+        with self._lock:
+            if key in self._seeded:
+                return
+            self._seeded.add(key)
+        self._executor.submit(self._backtest, key, model, features, df_feat.copy(), origins)
+
+    def _backtest(self, key, model, features, df_feat, origins):
+        try:
+            _, _, X_test, _ = _train_test_split(df_feat, features)
+            ts = pd.DatetimeIndex(df_feat["timestamp"]).asi8
+            y = df_feat["consumption_kW"].astype(float).to_numpy()
+            first = len(df_feat) - len(X_test)
+            for i in np.unique(np.linspace(first, len(df_feat) - 2, num=origins).astype(int)):
+                if i < 0:
+                    continue
+                horizon = int(min(self.max_steps, (ts[-1] - ts[i]) // 3_600_000_000_000))
+                if horizon < 1:
+                    continue
+                targets, yhat = forecast_recursive(model, features, df_feat.iloc[i], horizon=horizon)
+                t = targets.asi8
+                self.add(key, np.arange(horizon), np.interp(t, ts, y) - yhat)
+        except Exception:
+            pass
+
+    def bands(self, key: tuple, horizon: int, lo: float = 0.1, hi: float = 0.9):
+        """(q_lo, q_hi, count) arrays over `horizon` steps to add to the point forecast, or None when no step
+        has `min_count` residuals yet. Quantile levels get the finite-sample conformal correction."""
+        with self._lock:
+            ring = self._rings.get(key)
+            if ring is None:
+                return None
+            cached = self._bands.get((key, lo, hi))
+            if cached is None or cached[0] != ring[3]:
+                res, count = ring[0].copy(), ring[2].copy()
+                q_lo = np.full(self.max_steps, np.nan)
+                q_hi = np.full(self.max_steps, np.nan)
+                for h in np.flatnonzero(count >= self.min_count):
+                    r = res[h, :count[h]]
+                    n = len(r)
+                    q_lo[h] = np.quantile(r, max(0.0, np.floor((n + 1) * lo) / n))
+                    q_hi[h] = np.quantile(r, min(1.0, np.ceil((n + 1) * hi) / n))
+                cached = self._bands[(key, lo, hi)] = (ring[3], q_lo, q_hi, count)
+        _, q_lo, q_hi, count = cached
+        have = np.flatnonzero(~np.isnan(q_lo[:horizon]))
+        if not len(have):
+            return None
+        # steps without enough residuals take the nearest calibrated earlier (else later) step
+        steps = np.arange(min(horizon, self.max_steps))
+        src = have[np.clip(np.searchsorted(have, steps, side="right") - 1, 0, None)]
+        src = np.where(steps < have[0], have[0], src)
+        src = np.append(src, np.full(max(0, horizon - self.max_steps), src[-1]))
+        return q_lo[src], q_hi[src], count[src]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {f"{k[0]}/{k[1]}": {"steps_calibrated": int((r[2] >= self.min_count).sum()), "residuals": int(r[2].sum()),
+                                       "pending": len(self._pending.get(k, ()))} for k, r in self._rings.items()}
+
+RESIDUALS = ResidualStore(window=int(os.environ.get("RESIDUAL_WINDOW", "500")))
+
 def compute_kpis(df: pd.DataFrame):
     df = df.copy().sort_values("timestamp")
     last = df.iloc[-1]
@@ -263,7 +1412,72 @@ def estimate_pv_kw(ts: pd.Timestamp, temp_c: Optional[float] = None, pv_factor:
         pv *= 1.0 - max(0.0, (temp_c - 30)) * 0.005
     return max(0.0, float(pv))
 
-def compute_equipment_state(df: pd.DataFrame, *, pv_factor: float = 1.0, batt_power_limit_kw: float = 2.0, soc_init_pct: float = 50.0):
+def estimate_pv_array(ts: pd.DatetimeIndex, temp_c: Optional[np.ndarray] = None, pv_factor: float = 1.0) -> np.ndarray:
+    """Vectorized estimate_pv_kw over a DatetimeIndex (same hourly profile and temperature derate)."""
+    hour = pd.DatetimeIndex(ts).hour.to_numpy()
+    pv = 3.0 * np.maximum(0.0, np.sin(np.pi * (hour - 6) / 12)) * float(pv_factor)
+    if temp_c is not None:
+        pv = pv * (1.0 - np.maximum(0.0, np.asarray(temp_c, dtype=np.float64) - 30) * 0.005)
+    return np.maximum(0.0, pv)
+
+def simulate_battery(load, pv, rates, dt, cap_kwh, limit_kw, soc0_kwh, soc_min_kwh=0.0,
+                     discharge_th=-np.inf, charge_th=-np.inf, grid_charge=False) -> dict:
+    """Battery rule kernel over whole arrays, optionally batched over B parameter sets.
+    load/pv/rates: (H,) shared by the batch or (B, H) per row (scenarios, sites); dt: scalar or (H,)
+    hours; the remaining parameters are scalars or (B,) arrays. Per step: discharge toward the net load when rate >= discharge_th (never below
+    soc_min), else charge from the grid at limit when grid_charge and rate <= charge_th, else charge from
+    PV surplus. Returns (B, H) arrays batt_kw (+ discharge, - charge), soc_kwh (after the step), grid_kw."""
+    load = np.asarray(load, dtype=np.float64)
+    net = load - np.asarray(pv, dtype=np.float64)
+    rates = np.asarray(rates, dtype=np.float64)
+    H = net.shape[-1]
+    dts = np.broadcast_to(np.asarray(dt, dtype=np.float64), (H,))
+    rows = max(v.shape[0] if v.ndim == 2 else 1 for v in (net, rates))
+    params = np.broadcast_arrays(*(np.atleast_1d(np.asarray(v, dtype=np.float64)) for v in
+                                   (cap_kwh, limit_kw, soc0_kwh, soc_min_kwh, discharge_th, charge_th, grid_charge)),
+                                 np.empty(rows))[:-1]
+    cap, limit, soc, soc_min, d_th, c_th, gc = (np.array(v) for v in params)
+    B = len(cap)
+    if B == 1:
+        net, rates = net.reshape(-1), rates.reshape(-1)
+    gc = gc.astype(bool)
+    batt = np.zeros((B, H))
+    socs = np.empty((B, H))
+    if B == 1:
+        # scalar fast path: long single-parameter runs (e.g. history replay) stay in plain Python floats
+        cap1, lim1, s, smin, dth, cth, g = (float(v[0]) for v in (cap, limit, soc, soc_min, d_th, c_th, gc))
+        out_b, out_s = batt[0], socs[0]
+        for t, (n, r, d) in enumerate(zip(net.tolist(), rates.tolist(), dts.tolist())):
+            b = 0.0
+            if r >= dth and n > 0 and s > smin:
+                b = min(n, lim1, (s - smin) / d)
+                s = max(smin, s - b * d)
+            elif g and r <= cth and s < cap1:
+                b = -min(lim1, (cap1 - s) / d)
+                s = min(cap1, s - b * d)
+            elif n < 0 and s < cap1:
+                b = -min(-n, lim1, (cap1 - s) / d)
+                s = min(cap1, s - b * d)
+            out_b[t] = b
+            out_s[t] = s
+    else:
+        for t in range(H):
+            n, r, d = net[..., t], rates[..., t], dts[t]
+            dis = (r >= d_th) & (n > 0) & (soc > soc_min)
+            chg_grid = ~dis & gc & (r <= c_th) & (soc < cap)
+            chg_pv = ~dis & ~chg_grid & (n < 0) & (soc < cap)
+            room = (cap - soc) / d
+            b = np.where(dis, np.minimum(np.minimum(n, limit), (soc - soc_min) / d), 0.0)
+            b = np.where(chg_grid, -np.minimum(limit, room), b)
+            b = np.where(chg_pv, -np.minimum(np.minimum(-n, limit), room), b)
+            soc = np.clip(soc - b * d, np.minimum(soc, soc_min), cap)
+            batt[:, t] = b
+            socs[:, t] = soc
+    grid = np.maximum(0.0, (net if net.ndim == 2 else net[None, :]) - batt)
+    return {"batt_kw": batt, "soc_kwh": socs, "grid_kw": grid}
+
+def compute_equipment_state(df: pd.DataFrame, *, pv_factor: float = 1.0, batt_power_limit_kw: float = 2.0, soc_init_pct: float = 50.0,
+                            cap_kwh: float = 10.0):
     """Compute simple PV/battery/grid flows for the latest step using a timestep-aware battery model.
     - battery_kw: positive = descarregando para a carga; negativo = carregando
     """
@@ -282,37 +1496,18 @@ def compute_equipment_state(df: pd.DataFrame, *, pv_factor: float = 1.0, batt_po
     steps = int(max(1, round(24.0 / dt_hours)))
     recent = df.tail(steps).reset_index(drop=True)
     # Estimate PV for each timestamp
-    temps = recent["temperature_C"] if "temperature_C" in recent.columns else [None] * len(recent)
-    recent["pv_kw"] = [estimate_pv_kw(ts, (float(t) if t is not None else None), pv_factor=pv_factor) for ts, t in zip(recent["timestamp"], temps)]
+    temps = recent["temperature_C"].astype(float).to_numpy() if "temperature_C" in recent.columns else None
+    pv = estimate_pv_array(pd.DatetimeIndex(recent["timestamp"]), temps, pv_factor=pv_factor)
     load = recent["consumption_kW"].astype(float).to_numpy()
-    pv = recent["pv_kw"].astype(float).to_numpy()
-    # Battery model
-    cap_kwh = 10.0
-    soc = float(np.clip(soc_init_pct, 0, 100)) / 100.0 * cap_kwh
-    soc_hist = []
-    batt_kw_hist = []  # + discharge to load, - charge
-    batt_power_limit = float(max(0.0, batt_power_limit_kw))  # kW limit
-    for l, p in zip(load, pv):
-        net = l - p  # positive => falta energia; negative => sobra de PV
-        if net > 0 and soc > 0:
-            # discharge limited by power and available energy for this dt
-            max_discharge_kw = soc / dt_hours
-            discharge_kw = float(min(net, batt_power_limit, max_discharge_kw))
-            soc -= discharge_kw * dt_hours
-            batt_kw_hist.append(discharge_kw)
-        elif net < 0 and soc < cap_kwh:
-            # charge limited by power and free capacity for this dt
-            surplus_kw = -net
-            max_charge_kw = (cap_kwh - soc) / dt_hours
-            charge_kw = float(min(surplus_kw, batt_power_limit, max_charge_kw))
-            soc += charge_kw * dt_hours
-            batt_kw_hist.append(-charge_kw)
-        else:
-            batt_kw_hist.append(0.0)
-        soc_hist.append(soc)
+    # Battery model (self-consumption: discharge toward the net load, charge from PV surplus)
+    res = simulate_battery(
+        load, pv, np.zeros(len(load)), dt_hours, cap_kwh, float(max(0.0, batt_power_limit_kw)),
+        float(np.clip(soc_init_pct, 0, 100)) / 100.0 * cap_kwh,
+    )
+    soc = float(res["soc_kwh"][0, -1])
     last_load = float(load[-1])
     last_pv = float(pv[-1])
-    last_batt_kw = float(batt_kw_hist[-1])
+    last_batt_kw = float(res["batt_kw"][0, -1])
     grid_kw = max(0.0, last_load - last_pv - last_batt_kw)
     return {
         "pv_kw": round(last_pv, 3),
@@ -343,30 +1538,172 @@ def compute_alerts(kpis: dict, equipment: dict) -> list:
         pass
     return alerts
 
-def _ensure_live_table():
-    try:
-        conn = sqlite3.connect(DB_PATH)
-        c = conn.cursor()
-        c.execute(
+class LiveTickWriter:
+    """Single background writer for `live_ticks`. Producers enqueue rows; one thread owns the connection
+    (schema created once, WAL journaling, synchronous=NORMAL) and writes with executemany when
+    `batch_size` rows are pending or `flush_interval` seconds have passed.
+    Back-pressure: submit() blocks up to `block_timeout` on a full queue, then drops and counts the row.
+    Rows whose timestamp was among the last `dedupe_window` submitted are skipped (several live streams of
+    one site all submit the same upstream point). Pending rows are flushed on close() (registered with atexit)."""
+
+    def __init__(self, db_path: str = DB_PATH, max_queue: int = 10000, batch_size: int = 256,
+                 flush_interval: float = 1.0, block_timeout: float = 0.5, dedupe_window: int = 4096):
+        import queue
+        from collections import OrderedDict
+        self.db_path = db_path
+        self.dedupe_window = int(dedupe_window)
+        self._recent = OrderedDict()  # timestamp -> None, most recent last
+        self.batch_size = int(batch_size)
+        self.flush_interval = float(flush_interval)
+        self.block_timeout = float(block_timeout)
+        self._q = queue.Queue(maxsize=int(max_queue))
+        self._lock = threading.Lock()
+        self._thread = None
+        self._closed = False
+        self.listeners = []  # callables(batch) run by the writer thread after each committed batch
+        self.counters = {"enqueued": 0, "written": 0, "dropped": 0, "deduped": 0, "errors": 0, "flushes": 0,
+                         "last_flush_ms": 0.0, "max_flush_ms": 0.0, "total_flush_ms": 0.0}
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None and not self._closed:
+                self._thread = threading.Thread(target=self._run, name="live-writer", daemon=True)
+                self._thread.start()
+
+    def submit_many(self, rows: list) -> int:
+        """Enqueue (timestamp_iso, consumption_kW, temperature_C) rows; returns how many were accepted."""
+        import queue
+        if self._closed:
+            return 0
+        self._start()
+        with self._lock:
+            fresh = []
+            for row in rows:
+                if row[0] in self._recent:
+                    continue
+                self._recent[row[0]] = None
+                fresh.append(row)
+            while len(self._recent) > self.dedupe_window:
+                self._recent.popitem(last=False)
+            self.counters["deduped"] += len(rows) - len(fresh)
+        accepted = 0
+        for row in fresh:
+            try:
+                self._q.put(row, timeout=self.block_timeout)
+                accepted += 1
+            except queue.Full:
+                break
+        with self._lock:
+            for row in fresh[accepted:]:
+                self._recent.pop(row[0], None)  # dropped: may be submitted again
+            self.counters["enqueued"] += accepted
+            self.counters["dropped"] += len(fresh) - accepted
+        return accepted
+
+    def submit(self, point: dict) -> bool:
+        row = (pd.to_datetime(point["timestamp"]).isoformat(), float(point["consumption_kW"]), float(point.get("temperature_C", 24.0)))
+        return self.submit_many([row]) == 1
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """Block until everything enqueued so far has been written."""
+        if self._thread is None:
+            return True
+        done = threading.Event()
+        try:
+            self._q.put(done, timeout=timeout)
+        except Exception:
+            return False
+        return done.wait(timeout)
+
+    def close(self, timeout: float = 5.0):
+        if self._closed:
+            return
+        self.flush(timeout)
+        self._closed = True
+
+    def stats(self) -> dict:
+        n = max(1, self.counters["flushes"])
+        return {**self.counters, "queue_depth": self._q.qsize(), "avg_flush_ms": self.counters["total_flush_ms"] / n}
+
+    def _open(self):
+        conn = sqlite3.connect(self.db_path, timeout=10)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(
             "CREATE TABLE IF NOT EXISTS live_ticks (timestamp TEXT PRIMARY KEY, consumption_kW REAL, temperature_C REAL)"
         )
         conn.commit()
-        conn.close()
-    except Exception:
-        pass
+        return conn
 
-def _insert_live_point(point: dict):
-    try:
-        conn = sqlite3.connect(DB_PATH)
-        c = conn.cursor()
-        c.execute(
-            "INSERT OR REPLACE INTO live_ticks (timestamp, consumption_kW, temperature_C) VALUES (?, ?, ?)",
-            (pd.to_datetime(point["timestamp"]).isoformat(), float(point["consumption_kW"]), float(point.get("temperature_C", 24.0)))
-        )
-        conn.commit()
-        conn.close()
-    except Exception:
-        pass
+    def _write(self, conn, batch: list):
+        t0 = time.perf_counter()
+        written = self.counters["written"]
+        try:
+            conn.executemany(
+                "INSERT OR REPLACE INTO live_ticks (timestamp, consumption_kW, temperature_C) VALUES (?, ?, ?)", batch
+            )
+            conn.commit()
+            self.counters["written"] += len(batch)
+            TELEMETRY.inc("microgrid_sqlite_rows_total", (("db", self.db_path),), len(batch))
+        except Exception:
+            self.counters["errors"] += 1
+            TELEMETRY.inc("microgrid_sqlite_write_errors_total", (("db", self.db_path),))
+            try:
+                conn.rollback()
+            except Exception:
+                pass
+        ms = (time.perf_counter() - t0) * 1000.0
+        TELEMETRY.observe("microgrid_sqlite_write_seconds", ms / 1000.0, (("db", self.db_path),))
+        self.counters["flushes"] += 1
+        self.counters["last_flush_ms"] = ms
+        self.counters["total_flush_ms"] += ms
+        self.counters["max_flush_ms"] = max(self.counters["max_flush_ms"], ms)
+        if self.counters["written"] > written:
+            for listener in self.listeners:
+                try:
+                    listener(batch)
+                except Exception:
+                    pass
+
+    def _run(self):
+        import queue
+        conn = None
+        batch, waiters = [], []
+        deadline = None
+        while True:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                item = self._q.get(timeout=timeout)
+                if isinstance(item, threading.Event):
+                    waiters.append(item)
+                else:
+                    batch.append(item)
+                    if deadline is None:
+                        deadline = time.monotonic() + self.flush_interval
+            except queue.Empty:
+                pass
+            due = waiters or len(batch) >= self.batch_size or (deadline is not None and time.monotonic() >= deadline)
+            if not due:
+                continue
+            if batch:
+                try:
+                    if conn is None:
+                        conn = self._open()
+                    self._write(conn, batch)
+                except Exception:
+                    self.counters["errors"] += 1
+                    conn = None
+            for w in waiters:
+                w.set()
+            batch, waiters, deadline = [], [], None
+
+LIVE_WRITER = LiveTickWriter(
+    batch_size=int(os.environ.get("LIVE_WRITER_BATCH", "256")),
+    flush_interval=float(os.environ.get("LIVE_WRITER_FLUSH_S", "1.0")),
+)
+LIVE_WRITER.listeners.append(RESIDUALS.observe_rows)
+import atexit
+atexit.register(LIVE_WRITER.close)
 
 def generate_context(kpis: dict, equipment: dict) -> str:
     load = kpis.get("current_load_kw")
@@ -403,28 +1740,158 @@ def generate_context(kpis: dict, equipment: dict) -> str:
     parts.append(f"Estado geral: {status}.")
     return " ".join(parts)
 
-def _live_external_point() -> Optional[dict]:
-    """Optionally fetch a live point from external API if configured.
-    Expected LIVE_API_URL returning JSON with keys: timestamp, consumption_kW, temperature_C
-    """
+def _parse_live_point(j: dict) -> dict:
+    ts = pd.to_datetime(j.get("timestamp", pd.Timestamp.utcnow()))
+    return {
+        "timestamp": ts,
+        "consumption_kW": float(j.get("consumption_kW", 0.0)),
+        "temperature_C": float(j.get("temperature_C", 24.0)),
+    }
+
+class LivePoller:
+    """Shared poller of one live upstream (LIVE_API_URL + token). A single background thread with a pooled
+    requests.Session publishes the newest point to every consumer, so any number of open streams costs one
+    upstream call per interval. Points are deduplicated by timestamp: `seq` only moves on a new one.
+
+    - adaptive interval: `interval` while the upstream has new data, stretched x1.5 per unchanged poll up
+      to `max_interval`;
+    - failures back off exponentially from `interval` (capped at `max_backoff`) with jitter;
+    - circuit breaker: `failure_threshold` consecutive failures open it for `open_s` seconds without calls,
+      then a single half-open trial closes it again or re-opens it.
+    The thread starts on first use and exits after `idle_grace` seconds without consumers. Points not
+    refreshed for `stale_after` seconds are not served, so consumers fall back to simulation."""
+
+    def __init__(self, url: str, token: Optional[str] = None, interval: float = 2.0, max_interval: float = 30.0,
+                 max_backoff: float = 60.0, timeout: float = 5.0, failure_threshold: int = 5, open_s: float = 30.0,
+                 idle_grace: float = 60.0, stale_after: Optional[float] = None):
+        self.url = url
+        self.token = token
+        self.interval = float(interval)
+        self.max_interval = float(max_interval)
+        self.max_backoff = float(max_backoff)
+        self.timeout = float(timeout)
+        self.failure_threshold = int(failure_threshold)
+        self.open_s = float(open_s)
+        self.idle_grace = float(idle_grace)
+        self.stale_after = float(stale_after) if stale_after is not None else max(60.0, 2 * self.max_interval, 2 * self.open_s)
+        self._lock = threading.Lock()
+        self._polled = threading.Event()  # set after the first poll attempt of the current thread
+        self._thread = None
+        self._point = None
+        self._point_ts = None
+        self._fetched_at = None
+        self.seq = 0
+        self.state = "closed"  # circuit breaker: closed / open / half_open
+        self.failures = 0
+        self.delay = self.interval
+        self._opened_at = None
+        self._last_used = time.monotonic()
+        self.counters = {"polls": 0, "new": 0, "unchanged": 0, "errors": 0, "breaker_opens": 0}
+
+    def latest(self, wait: float = 0.0):
+        """(seq, point) for the newest fresh upstream point, point None when there is none. Starts the poller
+        if needed; `wait` blocks up to that many seconds for its first poll."""
+        with self._lock:
+            self._last_used = time.monotonic()
+            if self._thread is None:
+                self._polled.clear()
+                self._thread = threading.Thread(target=self._run, name="live-poller", daemon=True)
+                self._thread.start()
+        if wait:
+            self._polled.wait(wait)
+        with self._lock:
+            fresh = self._point is not None and time.monotonic() - self._fetched_at <= self.stale_after
+            return self.seq, (self._point if fresh else None)
+
+    def _run(self):
+        import requests
+        session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=1)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        if self.token:
+            session.headers["Authorization"] = f"Bearer {self.token}"
+        try:
+            while True:
+                with self._lock:
+                    if time.monotonic() - self._last_used > self.idle_grace:
+                        self._thread = None
+                        return
+                delay = self._poll(session)
+                self._polled.set()
+                time.sleep(delay)
+        finally:
+            session.close()
+
+    def _poll(self, session) -> float:
+        """One breaker-guarded poll; returns the delay before the next one."""
+        import random
+        if self.state == "open":
+            remaining = self._opened_at + self.open_s - time.monotonic()
+            if remaining > 0:
+                return remaining
+            self.state = "half_open"
+        self.counters["polls"] += 1
+        t0 = time.perf_counter()
+        try:
+            r = session.get(self.url, timeout=self.timeout)
+            r.raise_for_status()
+            point = _parse_live_point(r.json())
+        except Exception:
+            TELEMETRY.inc("microgrid_external_errors_total", (("api", "live"),))
+            TELEMETRY.observe("microgrid_external_request_seconds", time.perf_counter() - t0, (("api", "live"),))
+            self.counters["errors"] += 1
+            self.failures += 1
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                self.state = "open"
+                self._opened_at = time.monotonic()
+                self.counters["breaker_opens"] += 1
+                return self.open_s
+            cap = min(self.max_backoff, self.interval * 2 ** self.failures)
+            return cap / 2 + random.uniform(0, cap / 2)
+        TELEMETRY.observe("microgrid_external_request_seconds", time.perf_counter() - t0, (("api", "live"),))
+        self.state, self.failures = "closed", 0
+        ts = pd.Timestamp(point["timestamp"]).value
+        with self._lock:
+            new = ts != self._point_ts
+            if new:
+                self._point, self._point_ts = point, ts
+                self.seq += 1
+            self._fetched_at = time.monotonic()
+        if new:
+            self.counters["new"] += 1
+            self.delay = self.interval
+        else:
+            self.counters["unchanged"] += 1
+            self.delay = min(self.max_interval, self.delay * 1.5)
+        return self.delay
+
+    def stats(self) -> dict:
+        with self._lock:
+            age = None if self._fetched_at is None else round(time.monotonic() - self._fetched_at, 1)
+            return {**self.counters, "state": self.state, "failures": self.failures, "seq": self.seq,
+                    "delay_s": round(self.delay, 2), "point_age_s": age, "running": self._thread is not None}
+
+_LIVE_POLLERS = {}
+_LIVE_POLLERS_LOCK = threading.Lock()
+
+def live_poller() -> Optional[LivePoller]:
+    """The shared poller of the configured upstream (LIVE_API_URL / LIVE_API_TOKEN), None when unset."""
     url = os.environ.get("LIVE_API_URL")
     if not url:
         return None
-    headers = {}
-    if os.environ.get("LIVE_API_TOKEN"):
-        headers["Authorization"] = f"Bearer {os.environ['LIVE_API_TOKEN']}"
-    try:
-        r = requests.get(url, headers=headers, timeout=5)
-        r.raise_for_status()
-        j = r.json()
-        ts = pd.to_datetime(j.get("timestamp", pd.Timestamp.utcnow()))
-        return {
-            "timestamp": ts,
-            "consumption_kW": float(j.get("consumption_kW", 0.0)),
-            "temperature_C": float(j.get("temperature_C", 24.0)),
-        }
-    except Exception:
-        return None
+    key = (url, os.environ.get("LIVE_API_TOKEN"))
+    with _LIVE_POLLERS_LOCK:
+        poller = _LIVE_POLLERS.get(key)
+        if poller is None:
+            poller = _LIVE_POLLERS[key] = LivePoller(
+                url, key[1],
+                interval=float(os.environ.get("LIVE_POLL_INTERVAL_S", os.environ.get("STREAM_INTERVAL_S", "2"))),
+                max_interval=float(os.environ.get("LIVE_POLL_MAX_INTERVAL_S", "30")),
+                failure_threshold=int(os.environ.get("LIVE_BREAKER_FAILURES", "5")),
+                open_s=float(os.environ.get("LIVE_BREAKER_OPEN_S", "30")),
+            )
+        return poller
 
 def _simulate_next_point(ts: pd.Timestamp, load: float, temp: float, factor: float = 1.0) -> dict:
     ts = (pd.to_datetime(ts) + pd.Timedelta(minutes=1)).tz_localize(None)
@@ -456,6 +1923,31 @@ def detect_anomalies(df: pd.DataFrame) -> list:
     out = s[(s["z"].abs() >= 3) & s["z"].notna()].tail(50)
     return [{"x": pd.to_datetime(r["timestamp"]).isoformat(), "y": float(r["consumption_kW"]), "text": f"z={float(r['z']):.2f}" } for _, r in out.iterrows()]
 
+def _dispatch_plan(ts_all, load, pv, rates, res: dict, row: int, cap_kwh: float) -> list:
+    net = np.maximum(0.0, load - pv)  # demanda para rede antes da bateria
+    batt, grid, soc = res["batt_kw"][row], res["grid_kw"][row], res["soc_kwh"][row]
+    return [{
+        "ts": ts.isoformat(),
+        "load_kw": round(float(load[i]), 3),
+        "pv_kw": round(float(pv[i]), 3),
+        "grid_base_kw": round(float(net[i]), 3),
+        "batt_kw": round(float(batt[i]), 3),
+        "grid_opt_kw": round(float(grid[i]), 3),
+        "rate": float(rates[i]),
+        "soc_pct": int(round(100 * soc[i] / cap_kwh)),
+    } for i, ts in enumerate(ts_all)]
+
+def _plan_costs(plan: list) -> dict:
+    baseline_cost = round(sum(step["grid_base_kw"] * step["rate"] for step in plan), 2)
+    optimized_cost = round(sum(step["grid_opt_kw"] * step["rate"] for step in plan), 2)
+    return {"baseline_cost": baseline_cost, "optimized_cost": optimized_cost, "savings": round(baseline_cost - optimized_cost, 2)}
+
+def _horizon_inputs(preds: list, pv_factor: float):
+    ts_all = pd.DatetimeIndex(pd.to_datetime([p["ts"] for p in preds]))
+    load = np.maximum(0.0, np.array([float(p["y"]) for p in preds], dtype=np.float64))
+    pv = estimate_pv_array(ts_all, forecast_temps(ts_all), pv_factor=pv_factor)
+    return ts_all, load, pv, TARIFF.price(ts_all)[0]
+
 def optimize_battery(preds: list, pv_factor: float = 1.0, batt_limit_kw: float = 2.0, soc_init_pct: float = 50.0, cap_kwh: float = 10.0) -> dict:
     """Greedy heuristic using TOU: descarrega em tarifa alta, carrega em baixa e com excedente de PV.
     Returns summary and per-step plan over forecast horizon.
@@ -463,45 +1955,20 @@ def optimize_battery(preds: list, pv_factor: float = 1.0, batt_limit_kw: float =
     """
     if not preds:
         return {"baseline_cost": 0.0, "optimized_cost": 0.0, "savings": 0.0, "plan": []}
-    plan = []
-    soc = float(np.clip(soc_init_pct, 0, 100)) / 100.0 * cap_kwh
-    for p in preds:
-        ts = pd.to_datetime(p["ts"]) if isinstance(p["ts"], str) else p["ts"]
-        load = max(0.0, float(p["y"]))
-        temp_f = _weather_forecast(ts) or estimate_temp(ts)
-        pv = estimate_pv_kw(ts, temp_f, pv_factor=pv_factor)
-        net = max(0.0, load - pv)  # demanda para rede antes da bateria
-        rate = tariff_rate(ts)
-        batt = 0.0
-        dt = 1.0  # horas por passo de forecast
-        max_discharge_kw = soc / dt
-        max_charge_kw = (cap_kwh - soc) / dt
-        if rate >= 1.0 and net > 0 and soc > 0:
-            # descarregar em horário caro
-            batt = float(min(net, batt_limit_kw, max_discharge_kw))
-            soc = max(0.0, soc - batt * dt)
-        elif rate <= 0.6 and soc < cap_kwh:
-            # carregar em horário barato (da rede)
-            charge = float(min(batt_limit_kw, max_charge_kw))
-            batt = -charge
-            soc = min(cap_kwh, soc + charge * dt)
-        # baseline/optimized grid
-        grid_base = net
-        grid_opt = max(0.0, net - batt)
-        plan.append({
-            "ts": ts.isoformat(),
-            "load_kw": round(load,3),
-            "pv_kw": round(pv,3),
-            "grid_base_kw": round(grid_base,3),
-            "batt_kw": round(batt,3),
-            "grid_opt_kw": round(grid_opt,3),
-            "rate": rate,
-            "soc_pct": int(round(100 * soc / cap_kwh)),
-        })
-    baseline_cost = round(sum(step["grid_base_kw"] * tariff_rate(step["ts"]) for step in plan), 2)
-    optimized_cost = round(sum(step["grid_opt_kw"] * tariff_rate(step["ts"]) for step in plan), 2)
-    savings = round(baseline_cost - optimized_cost, 2)
-    return {"baseline_cost": baseline_cost, "optimized_cost": optimized_cost, "savings": savings, "plan": plan}
+    ts_all, load, pv, rates = _horizon_inputs(preds, pv_factor)
+    res = simulate_battery(load, pv, rates, 1.0, cap_kwh, batt_limit_kw, float(np.clip(soc_init_pct, 0, 100)) / 100.0 * cap_kwh,
+                           discharge_th=1.0, charge_th=0.6, grid_charge=True)
+    plan = _dispatch_plan(ts_all, load, pv, rates, res, 0, cap_kwh)
+    return {**_plan_costs(plan), "plan": plan}
+
+def mode_thresholds(mode: str) -> list:
+    """(discharge_threshold, charge_threshold) sets tried by the adaptive heuristic for `mode`."""
+    if mode in ("economico", "eco", "agressivo"):
+        return [(0.9, 0.7), (0.8, 0.8), (0.75, 0.85)]
+    if mode in ("conforto", "confortavel"):
+        # Pouca intervenção: não carrega da rede, só com PV; descarrega apenas em pico alto
+        return [(1.1, -1.0)]
+    return [(1.0, 0.6), (0.9, 0.7), (0.8, 0.8)]
 
 def optimize_battery_adaptive(
     preds: list,
@@ -515,71 +1982,94 @@ def optimize_battery_adaptive(
 ) -> dict:
     """Adapt optimization behavior to 'mode' and optional daily savings target.
     Strategy: try progressively more aggressive discharge/charge thresholds until reaching target or best effort.
+    All threshold sets are simulated in one batched simulate_battery call.
     """
     if not preds:
         return {"baseline_cost": 0.0, "optimized_cost": 0.0, "savings": 0.0, "plan": []}
-    # Define threshold sets (discharge_threshold, charge_threshold)
-    sets = [(1.0, 0.6), (0.9, 0.7), (0.8, 0.8)]
-    if mode in ("economico", "eco", "agressivo"):
-        sets = [(0.9, 0.7), (0.8, 0.8), (0.75, 0.85)]
-    if mode in ("conforto", "confortavel"):
-        # Pouca intervenção: não carrega da rede, só com PV; descarrega apenas em pico alto
-        sets = [(1.1, -1.0)]
-
+    # Threshold sets (discharge_threshold, charge_threshold) for this mode
+    sets = mode_thresholds(mode)
+    ts_all, load, pv, rates = _horizon_inputs(preds, pv_factor)
+    res = simulate_battery(
+        load, pv, rates, 1.0, cap_kwh, batt_limit_kw,
+        float(np.clip(soc_init_pct, 0, 100)) / 100.0 * cap_kwh,
+        float(np.clip(soc_min_pct, 0, 100)) / 100.0 * cap_kwh,
+        [d for d, _ in sets], [c for _, c in sets],
+        grid_charge=mode not in ("conforto", "confortavel"),
+    )
     best = None
-    for (d_th, c_th) in sets:
-        plan = []
-        soc = float(np.clip(soc_init_pct, 0, 100)) / 100.0 * cap_kwh
-        for p in preds:
-            ts = pd.to_datetime(p["ts"]) if isinstance(p["ts"], str) else p["ts"]
-            load = max(0.0, float(p["y"]))
-            temp_f = _weather_forecast(ts) or estimate_temp(ts)
-            pv = estimate_pv_kw(ts, temp_f, pv_factor=pv_factor)
-            net = max(0.0, load - pv)
-            rate = tariff_rate(ts)
-            batt = 0.0
-            dt = 1.0
-            max_discharge_kw = soc / dt
-            max_charge_kw = (cap_kwh - soc) / dt
-            # Honor SOC mínimo
-            soc_min_kwh = float(np.clip(soc_min_pct, 0, 100)) / 100.0 * cap_kwh
-            if rate >= d_th and net > 0 and soc > soc_min_kwh:
-                batt = float(min(net, batt_limit_kw, max_discharge_kw))
-                # clamp to not go below SOC mínimo
-                batt = min(batt, (soc - soc_min_kwh) / dt)
-                soc = max(soc_min_kwh, soc - batt * dt)
-            elif rate <= c_th and soc < cap_kwh and not (mode in ("conforto", "confortavel")):
-                charge = float(min(batt_limit_kw, max_charge_kw))
-                batt = -charge
-                soc = min(cap_kwh, soc + charge * dt)
-            elif net < 0 and soc < cap_kwh:
-                # carregar com excedente de PV (sempre permitido)
-                charge = float(min(-net, batt_limit_kw, max_charge_kw))
-                batt = -charge
-                soc = min(cap_kwh, soc + charge * dt)
-            grid_base = net
-            grid_opt = max(0.0, net - batt)
-            plan.append({
-                "ts": ts.isoformat(),
-                "load_kw": round(load,3),
-                "pv_kw": round(pv,3),
-                "grid_base_kw": round(grid_base,3),
-                "batt_kw": round(batt,3),
-                "grid_opt_kw": round(grid_opt,3),
-                "rate": rate,
-                "soc_pct": int(round(100 * soc / cap_kwh)),
-            })
-        baseline_cost = round(sum(step["grid_base_kw"] * tariff_rate(step["ts"]) for step in plan), 2)
-        optimized_cost = round(sum(step["grid_opt_kw"] * tariff_rate(step["ts"]) for step in plan), 2)
-        savings = round(baseline_cost - optimized_cost, 2)
-        cand = {"baseline_cost": baseline_cost, "optimized_cost": optimized_cost, "savings": savings, "plan": plan,
-                "discharge_threshold": d_th, "charge_threshold": c_th}
+    for i, (d_th, c_th) in enumerate(sets):
+        plan = _dispatch_plan(ts_all, load, pv, rates, res, i, cap_kwh)
+        cand = {**_plan_costs(plan), "plan": plan, "discharge_threshold": d_th, "charge_threshold": c_th}
         if best is None or cand["savings"] > best["savings"]:
             best = cand
-        if target_savings_per_day is not None and savings >= target_savings_per_day:
+        if target_savings_per_day is not None and cand["savings"] >= target_savings_per_day:
             return cand
     return best or {"baseline_cost": 0.0, "optimized_cost": 0.0, "savings": 0.0, "plan": []}
 
+def dp_dispatch(net, surplus, rates, cap_kwh, limit_kw, soc0_kwh, soc_min_kwh, soc_steps: int = 100, dt: float = 1.0):
+    """Cost-minimizing dispatch by backward DP on a SOC grid of `soc_steps` intervals, batched over B
+    parameter sets (cap/limit/soc0/soc_min scalars or (B,) arrays; net/surplus/rates (H,) shared or
+    (B, H) per row). Each step evaluates all (SOC_from, SOC_to) transitions as one (B, K, K) array.
+    Returns (B, H) arrays batt_kw (+ discharge, - charge), soc_kwh (after each step) and grid_kw, like
+    simulate_battery."""
+    # (1 | B, H, 1, 1): column t broadcasts against the (B, K, K) transition arrays
+    net, surplus, rates = (np.atleast_2d(np.asarray(v, dtype=np.float64))[:, :, None, None] for v in (net, surplus, rates))
+    cap, limit, soc0, soc_min = (np.array(v, dtype=np.float64) for v in np.broadcast_arrays(
+        *(np.atleast_1d(np.asarray(v, dtype=np.float64)) for v in (cap_kwh, limit_kw, soc0_kwh, soc_min_kwh)),
+        np.empty(max(net.shape[0], surplus.shape[0], rates.shape[0])))[:-1])
+    B, H, K = len(cap), net.shape[1], int(max(2, soc_steps)) + 1
+    frac = np.linspace(0.0, 1.0, K)
+    eps = 1e-9
+    p = (frac[None, None, :] - frac[None, :, None]) * cap[:, None, None] / dt  # kW from j (rows) to k (cols)
+    charge = np.maximum(0.0, p)
+    discharge = np.maximum(0.0, -p)
+    static_ok = (np.abs(p) <= limit[:, None, None] + eps) & (
+        (p >= 0) | (frac[None, None, :] * cap[:, None, None] >= soc_min[:, None, None] - eps))
+    wear = 1e-6 * np.abs(p)  # tie-breaker: prefer idling over pointless cycling
+    policy = np.empty((H, B, K), dtype=np.intp)
+    V = np.zeros((B, K))
+    for t in range(H - 1, -1, -1):
+        grid = net[:, t] - discharge + np.maximum(0.0, charge - surplus[:, t])
+        ok = static_ok & (discharge <= net[:, t] + eps)
+        Q = np.where(ok, rates[:, t] * grid * dt + wear, np.inf) + V[:, None, :]
+        policy[t] = np.argmin(Q, axis=2)
+        V = np.take_along_axis(Q, policy[t][:, :, None], axis=2)[:, :, 0]
+    rows = np.arange(B)
+    path = np.empty((B, H + 1), dtype=np.intp)
+    path[:, 0] = np.argmin(np.abs(frac[None, :] * cap[:, None] - soc0[:, None]), axis=1)
+    for t in range(H):
+        path[:, t + 1] = policy[t, rows, path[:, t]]
+    soc = frac[path] * cap[:, None]
+    batt = -(soc[:, 1:] - soc[:, :-1]) / dt
+    grid = net[:, :, 0, 0] - np.maximum(0.0, batt) + np.maximum(0.0, -batt - surplus[:, :, 0, 0])
+    return {"batt_kw": batt, "soc_kwh": soc[:, 1:], "grid_kw": grid}
+
+def optimize_battery_optimal(
+    preds: list,
+    pv_factor: float = 1.0,
+    batt_limit_kw: float = 2.0,
+    soc_init_pct: float = 50.0,
+    cap_kwh: float = 10.0,
+    soc_min_pct: float = 0.0,
+    soc_steps: int = 100,
+) -> dict:
+    """Cost-minimizing dispatch over the forecast horizon (dp_dispatch on a 1%-of-capacity SOC grid by
+    default; a 168-step horizon solves in a few milliseconds).
+    Constraints: |batt_kw| <= batt_limit_kw, 0..cap_kwh, no discharge below soc_min_pct, discharge only
+    covers the net load (no export), charging uses PV surplus first and the grid for the rest.
+    Returns the same structure as optimize_battery_adaptive."""
+    if not preds:
+        return {"baseline_cost": 0.0, "optimized_cost": 0.0, "savings": 0.0, "plan": []}
+    ts_all, load, pv, rates = _horizon_inputs(preds, pv_factor)
+    res = dp_dispatch(
+        np.maximum(0.0, load - pv), np.maximum(0.0, pv - load), rates, cap_kwh, max(0.0, batt_limit_kw),
+        float(np.clip(soc_init_pct, 0, 100)) / 100.0 * cap_kwh,
+        float(np.clip(soc_min_pct, 0, 100)) / 100.0 * cap_kwh,
+        soc_steps=soc_steps,
+    )
+    plan = _dispatch_plan(ts_all, load, pv, rates, res, 0, cap_kwh)
+    return {**_plan_costs(plan), "plan": plan, "solver": "dp", "soc_steps": int(max(2, soc_steps))}
+
 def parse_goal(text: Optional[str]) -> Optional[dict]:
     """Parse a natural language savings goal in Portuguese, e.g., 'quero salvar 200 reais por mes'.
     Returns dict with detected amounts per month/day and derived daily target (R$)."""
@@ -606,22 +2096,91 @@ def parse_goal(text: Optional[str]) -> Optional[dict]:
     except Exception:
         return None
 
+def _to_epoch_ns(ts) -> np.ndarray:
+    """Naive epoch-ns int64 array from a scalar, list of str/Timestamp, Series or DatetimeIndex."""
+    if isinstance(ts, np.ndarray) and ts.dtype == np.int64:
+        return ts
+    idx = pd.DatetimeIndex(np.atleast_1d(pd.to_datetime(ts)))
+    if idx.tz is not None:
+        idx = idx.tz_localize(None)
+    return idx.astype("datetime64[ns]").asi8
+
+class TariffSchedule:
+    """Time-of-use schedule compiled into lookup tables:
+    period[day_type, hour] (day types: weekday, weekend, holiday) and rate[season, period].
+    Config (JSON, see TARIFF_CONFIG) with inclusive hour ranges:
+      {"rates": {"off": 0.5, "mid": 0.8, "peak": 1.2},
+       "weekday": {"peak": [[18, 21]], "mid": [[11, 17]]},
+       "weekend": {...}, "holiday": {...},          # default: same as weekday / weekend
+       "holidays": ["2025-12-25", ...],
+       "seasons": [{"months": [12, 1, 2], "rates": {"peak": 1.4}}]}   # overrides per month set
+    """
+    PERIODS = ("off", "mid", "peak")
+    DEFAULT = {"rates": {"off": 0.5, "mid": 0.8, "peak": 1.2}, "weekday": {"peak": [[18, 21]], "mid": [[11, 17]]}}
+
+    def __init__(self, config: Optional[dict] = None):
+        cfg = config or self.DEFAULT
+        codes = {p: i for i, p in enumerate(self.PERIODS)}
+
+        def day_table(spec: dict) -> np.ndarray:
+            tbl = np.zeros(24, dtype=np.int8)
+            # mid first so peak wins on overlap
+            for per in ("mid", "peak"):
+                for lo, hi in spec.get(per, []):
+                    tbl[int(lo):int(hi) + 1] = codes[per]
+            return tbl
+
+        weekday = cfg.get("weekday", self.DEFAULT["weekday"])
+        weekend = cfg.get("weekend", weekday)
+        holiday = cfg.get("holiday", weekend)
+        self.period_table = np.stack([day_table(weekday), day_table(weekend), day_table(holiday)])
+        base = {**self.DEFAULT["rates"], **cfg.get("rates", {})}
+        seasons = cfg.get("seasons", [])
+        self.rate_table = np.empty((len(seasons) + 1, len(self.PERIODS)), dtype=np.float64)
+        self.rate_table[0] = [float(base[p]) for p in self.PERIODS]
+        self.month_season = np.zeros(13, dtype=np.intp)
+        for i, season in enumerate(seasons, start=1):
+            rates = {**base, **season.get("rates", {})}
+            self.rate_table[i] = [float(rates[p]) for p in self.PERIODS]
+            for m in season.get("months", []):
+                self.month_season[int(m)] = i
+        self.holiday_days = np.sort(_to_epoch_ns(cfg["holidays"]) // 86_400_000_000_000) if cfg.get("holidays") else np.empty(0, dtype=np.int64)
+
+    @classmethod
+    def from_env(cls) -> "TariffSchedule":
+        path = os.environ.get("TARIFF_CONFIG")
+        if path and os.path.exists(path):
+            with open(path, "r") as f:
+                return cls(json.load(f))
+        return cls()
+
+    def price(self, ts):
+        """Vectorized (rates, period_codes) for timestamps; codes index PERIODS."""
+        ns = _to_epoch_ns(ts)
+        days = ns // 86_400_000_000_000
+        hour = (ns // 3_600_000_000_000) % 24
+        day_type = (((days + 3) % 7) >= 5).astype(np.intp)  # 1970-01-01 was a Thursday
+        if len(self.holiday_days):
+            day_type[np.isin(days, self.holiday_days)] = 2
+        period = self.period_table[day_type, hour]
+        month = ns.astype("datetime64[ns]").astype("datetime64[M]").astype(np.int64) % 12 + 1
+        rates = self.rate_table[self.month_season[month], period]
+        return rates, period
+
+    def cost_by_period(self, ts, kw) -> dict:
+        """Sum kw * rate per period over timestamps (np.bincount aggregation)."""
+        rates, period = self.price(ts)
+        totals = np.bincount(period, weights=np.asarray(kw, dtype=np.float64) * rates, minlength=len(self.PERIODS))
+        return dict(zip(self.PERIODS, totals.tolist()))
+
+TARIFF = TariffSchedule.from_env()
+
 def tariff_rate(dt: pd.Timestamp) -> float:
-    """Simple TOU tariff: peak 18-21h, mid 11-17h, resto off."""
-    h = pd.to_datetime(dt).hour
-    if 18 <= h <= 21:
-        return 1.2
-    if 11 <= h <= 17:
-        return 0.8
-    return 0.5
+    """TOU rate for one timestamp (default: peak 18-21h, mid 11-17h, resto off)."""
+    return float(TARIFF.price(dt)[0][0])
 
 def tariff_period(dt: pd.Timestamp) -> str:
-    h = pd.to_datetime(dt).hour
-    if 18 <= h <= 21:
-        return "peak"
-    if 11 <= h <= 17:
-        return "mid"
-    return "off"
+    return TariffSchedule.PERIODS[int(TARIFF.price(dt)[1][0])]
 
 def compute_costs(current_ts: pd.Timestamp, current_kw: float, forecast: list, df_history: Optional[pd.DataFrame] = None) -> dict:
     """Compute current instantaneous cost and richer pricing KPIs.
@@ -634,44 +2193,41 @@ def compute_costs(current_ts: pd.Timestamp, current_kw: float, forecast: list, d
     }
     """
     try:
+        peak = TariffSchedule.PERIODS.index("peak")
         rate_now = tariff_rate(current_ts)
         current_cost = float(current_kw) * rate_now
         # Forecast totals
-        total_fc = 0.0
         fc_by = {"off": 0.0, "mid": 0.0, "peak": 0.0}
         next_peak = None
-        for p in forecast:
-            ts = pd.to_datetime(p["ts"]) if isinstance(p["ts"], str) else p["ts"]
-            y = float(p["y"]) if p.get("y") is not None else 0.0
-            rate = tariff_rate(ts)
-            per = tariff_period(ts)
-            c = y * rate
-            total_fc += c
-            fc_by[per] += c
-            if next_peak is None and per == "peak":
-                next_peak = ts
+        if forecast:
+            fc_ts = _to_epoch_ns([p["ts"] for p in forecast])
+            fc_y = np.array([float(p["y"]) if p.get("y") is not None else 0.0 for p in forecast], dtype=np.float64)
+            fc_by = TARIFF.cost_by_period(fc_ts, fc_y)
+            is_peak = np.flatnonzero(TARIFF.price(fc_ts)[1] == peak)
+            if len(is_peak):
+                next_peak = pd.Timestamp(fc_ts[is_peak[0]])
+        total_fc = sum(fc_by.values())
         today_cost = None
         last24_cost = None
         by = {"off": 0.0, "mid": 0.0, "peak": 0.0}
         if df_history is not None and len(df_history):
-            dfh = df_history.copy()
-            dfh["timestamp"] = pd.to_datetime(dfh["timestamp"]).dt.tz_localize(None)
+            ts = _to_epoch_ns(df_history["timestamp"])
+            kw = df_history["consumption_kW"].astype(float).to_numpy()
             now = pd.to_datetime(current_ts).tz_localize(None)
-            start_today = now.normalize()
-            last24_start = now - pd.Timedelta(hours=24)
+            start_today = now.normalize().value
+            last24_start = (now - pd.Timedelta(hours=24)).value
+            rates, period = TARIFF.price(ts)
+            cost = kw * rates
             # Today
-            dft = dfh[dfh["timestamp"] >= start_today]
-            if len(dft):
-                today_cost = float((dft.apply(lambda r: float(r["consumption_kW"]) * tariff_rate(r["timestamp"]), axis=1)).sum())
+            m_today = ts >= start_today
+            if m_today.any():
+                today_cost = float(cost[m_today].sum())
             # Last 24h and by_period
-            df24 = dfh[dfh["timestamp"] >= last24_start]
-            if len(df24):
-                costs_24 = df24.apply(lambda r: float(r["consumption_kW"]) * tariff_rate(r["timestamp"]), axis=1)
-                last24_cost = float(costs_24.sum())
-                # By period breakdown
-                for _, r in df24.iterrows():
-                    per = tariff_period(r["timestamp"])  # off/mid/peak
-                    by[per] += float(r["consumption_kW"]) * tariff_rate(r["timestamp"])  # cost
+            m24 = ts >= last24_start
+            if m24.any():
+                last24_cost = float(cost[m24].sum())
+                totals = np.bincount(period[m24], weights=cost[m24], minlength=len(TariffSchedule.PERIODS))
+                by = dict(zip(TariffSchedule.PERIODS, totals.tolist()))
         return {
             "rate_now": rate_now,
             "current_cost": round(current_cost, 3),
@@ -685,124 +2241,390 @@ def compute_costs(current_ts: pd.Timestamp, current_kw: float, forecast: list, d
     except Exception:
         return {"rate_now": None, "current_cost": None, "forecast_cost_24h": None}
 
-@app.route("/api/stream")
-def api_stream():
-    source = request.args.get("source", "live").lower()
-    factor = float(request.args.get("factor", 1.0))
-    pv_factor = float(request.args.get("pv_factor", 1.0))
-    batt_limit = float(request.args.get("batt_limit", 2.0))
-    soc_init = float(request.args.get("soc_init", 50.0))
-    if source == "sim" or source == "simulacao":
+class StreamBuffer:
+    """Fixed-capacity ring buffer of (ts, load, temp) for stream state. Keeps the rolling 24h mean as a
+    running sum and the 24h peak with a monotonic deque, so push() and the KPI reads are O(1) amortized
+    regardless of capacity."""
+
+    def __init__(self, capacity: int = 7*24*60, window: pd.Timedelta = pd.Timedelta(hours=24)):
+        from collections import deque
+        self.capacity = int(capacity)
+        self.window_ns = int(window.value)
+        self.ts = np.zeros(self.capacity, dtype=np.int64)
+        self.load = np.zeros(self.capacity, dtype=np.float64)
+        self.temp = np.zeros(self.capacity, dtype=np.float64)
+        self.head = 0  # next write slot
+        self.size = 0
+        self.win_count = 0  # newest `win_count` entries are inside the window
+        self.win_sum = 0.0
+        self.peaks = deque()  # (seq, ts, load) with decreasing load
+        self.seq = 0
+        self.dt_hours = None  # spacing of the last two points
+
+    def extend(self, ts: np.ndarray, load: np.ndarray, temp: np.ndarray):
+        for t, l, tc in zip(ts[-self.capacity:].tolist(), load[-self.capacity:].tolist(), temp[-self.capacity:].tolist()):
+            self.push(t, l, tc)
+
+    def push(self, ts_ns: int, load: float, temp: float):
+        if self.size:
+            prev = int(self.ts[(self.head - 1) % self.capacity])
+            self.dt_hours = (ts_ns - prev) / 3.6e12
+        if self.size == self.capacity and self.win_count == self.capacity:
+            # overwriting the oldest slot, which is still inside the window
+            self._evict_oldest()
+        self.ts[self.head] = ts_ns
+        self.load[self.head] = load
+        self.temp[self.head] = temp
+        self.head = (self.head + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+        self.win_count += 1
+        self.win_sum += load
+        while self.peaks and self.peaks[-1][2] <= load:
+            self.peaks.pop()
+        self.peaks.append((self.seq, ts_ns, load))
+        self.seq += 1
+        cutoff = ts_ns - self.window_ns
+        while self.win_count > 1 and self.ts[(self.head - self.win_count) % self.capacity] <= cutoff:
+            self._evict_oldest()
+        if self.win_count == 1:
+            self.win_sum = load  # resync the running sum whenever the window collapses
+
+    def _evict_oldest(self):
+        i = (self.head - self.win_count) % self.capacity
+        self.win_sum -= float(self.load[i])
+        self.win_count -= 1
+        oldest_seq = self.seq - self.win_count
+        while self.peaks and self.peaks[0][0] < oldest_seq:
+            self.peaks.popleft()
+
+    def last(self):
+        i = (self.head - 1) % self.capacity
+        return int(self.ts[i]), float(self.load[i]), float(self.temp[i])
+
+    def kpis(self) -> dict:
+        ts, load, temp = self.last()
+        return {
+            "last_updated": pd.Timestamp(ts).isoformat(),
+            "current_load_kw": load,
+            "avg_24h_kw": self.win_sum / self.win_count if self.win_count else None,
+            "peak_24h_kw": self.peaks[0][2] if self.peaks else None,
+            "current_temp_c": temp,
+        }
+
+class _LiveStream:
+    """State of one live stream (site, source + simulation parameters): history, battery SOC and tick logic.
+    One instance per StreamHub key, so every subscriber of that key sees the same ticks. source=live reads
+    the shared LivePoller and only ticks when the upstream has a point it has not seen yet."""
+
+    def __init__(self, source: str, factor: float, pv_factor: float, batt_limit: float, soc_init: float,
+                 site: Optional[str] = None):
+        self.source = source
+        self.site = SITES.get(site)
+        self.factor = factor
+        self.pv_factor = pv_factor
+        if source == "sim" or source == "simulacao":
+            df_live = self._synthetic_history()
+        else:
+            try:
+                df_live = load_source("db" if source == "live" else source, self.site.id).sort_values("timestamp").copy()
+                if df_live is None or len(df_live) == 0:
+                    raise ValueError("empty live dataset")
+            except Exception:
+                # fallback to synthetic stream baseline
+                df_live = self._synthetic_history()
+        df_live["timestamp"] = pd.to_datetime(df_live["timestamp"]).dt.tz_localize(None)
+        self.buf = StreamBuffer(capacity=7*24*60)  # keep last ~7 days at 1-min res
+        self.buf.extend(
+            df_live["timestamp"].astype("datetime64[ns]").to_numpy().view("int64"),
+            df_live["consumption_kW"].astype(float).to_numpy(),
+            df_live["temperature_C"].astype(float).to_numpy() if "temperature_C" in df_live.columns else np.full(len(df_live), 24.0),
+        )
+        # Battery stateful model for stream
+        self.cap_kwh = self.site.cap_kwh
+        self.soc_state_kwh = float(np.clip(soc_init, 0, 100)) / 100.0 * self.cap_kwh
+        self.batt_limit_kw = float(max(0.0, batt_limit))
+        self.upstream_seq = None  # LivePoller.seq of the last upstream point ticked
+        from collections import deque
+        self.ingested = deque()  # (ts, load, temp) arrays from /api/ingest, consumed by the next tick
+
+    def offer(self, ts: np.ndarray, load: np.ndarray, temp: np.ndarray):
+        """Queue ingested points (thread-safe); the next tick uses them instead of a polled/simulated point."""
+        self.ingested.append((ts, load, temp))
+
+    def _take_ingested(self) -> Optional[dict]:
+        """Move queued ingested points newer than the buffer into it; the newest is returned as this tick's
+        point (None when nothing is newer)."""
+        chunks = []
+        while self.ingested:
+            chunks.append(self.ingested.popleft())
+        ts = np.concatenate([c[0] for c in chunks])
+        keep = ts > self.buf.last()[0]
+        if not keep.any():
+            return None
+        order = np.argsort(ts[keep], kind="stable")
+        ts, load, temp = (np.concatenate([c[i] for c in chunks])[keep][order] for i in range(3))
+        self.buf.extend(ts[:-1], load[:-1], temp[:-1])
+        return {"timestamp": pd.Timestamp(int(ts[-1])), "consumption_kW": float(load[-1]), "temperature_C": float(temp[-1])}
+
+    def _synthetic_history(self) -> pd.DataFrame:
         now = pd.Timestamp.now().tz_localize(None).floor("h")
         idx = pd.date_range(end=now, periods=24*14, freq="H")
         hours = idx.hour + idx.minute/60
         temp = 24 + 3*np.sin((hours-6)/24*2*np.pi)
         base = 2.5 + 0.8 * (1 + np.sin((hours-6)/24*2*np.pi)) + 0.2*np.sin((hours)/24*4*np.pi)
         noise = np.random.normal(0, 0.08, size=len(idx))
-        load = np.maximum(0.2, (base + 0.05*(temp-24) + noise) * float(factor))
-        df_live = pd.DataFrame({"timestamp": idx, "consumption_kW": load, "temperature_C": temp})
-    else:
-        try:
-            df_live = load_source("db" if source == "live" else source).sort_values("timestamp").copy()
-            if df_live is None or len(df_live) == 0:
-                raise ValueError("empty live dataset")
-        except Exception:
-            # fallback to synthetic stream baseline
-            now = pd.Timestamp.now().tz_localize(None).floor("h")
-            idx = pd.date_range(end=now, periods=24*14, freq="H")
-            hours = idx.hour + idx.minute/60
-            temp = 24 + 3*np.sin((hours-6)/24*2*np.pi)
-            base = 2.5 + 0.8 * (1 + np.sin((hours-6)/24*2*np.pi)) + 0.2*np.sin((hours)/24*4*np.pi)
-            noise = np.random.normal(0, 0.08, size=len(idx))
-            load = np.maximum(0.2, (base + 0.05*(temp-24) + noise) * float(factor))
-            df_live = pd.DataFrame({"timestamp": idx, "consumption_kW": load, "temperature_C": temp})
-    df_live["timestamp"] = pd.to_datetime(df_live["timestamp"]).dt.tz_localize(None)
+        load = np.maximum(0.2, (base + 0.05*(temp-24) + noise) * float(self.factor))
+        return pd.DataFrame({"timestamp": idx, "consumption_kW": load, "temperature_C": temp})
 
-    def gen():
-        nonlocal df_live
-        retry_ms = 2000
-        yield f"retry: {retry_ms}\n\n"
-        last = df_live.iloc[-1]
-        # Battery stateful model for stream
-        cap_kwh = 10.0
-        soc_state_kwh = float(np.clip(soc_init, 0, 100)) / 100.0 * cap_kwh
-        batt_limit_kw = float(max(0.0, batt_limit))
-        from typing import Tuple
-        def step_battery(soc_kwh: float, load_kw: float, pv_kw: float, dt_hours: float) -> Tuple[float, float]:
-            """Return (new_soc_kwh, batt_kw), batt_kw>0 discharging to load, <0 charging"""
-            net = float(load_kw) - float(pv_kw)
-            batt_kw = 0.0
-            if net > 0 and soc_kwh > 0:
-                max_discharge_kw = soc_kwh / dt_hours
-                batt_kw = float(min(net, batt_limit_kw, max_discharge_kw))
-                soc_kwh = max(0.0, soc_kwh - batt_kw * dt_hours)
-            elif net < 0 and soc_kwh < cap_kwh:
-                surplus_kw = -net
-                max_charge_kw = (cap_kwh - soc_kwh) / dt_hours
-                charge_kw = float(min(surplus_kw, batt_limit_kw, max_charge_kw))
-                batt_kw = -charge_kw
-                soc_kwh = min(cap_kwh, soc_kwh + charge_kw * dt_hours)
-            return soc_kwh, batt_kw
-        while True:
-            # Try external live point if configured when source == live
-            point = _live_external_point() if source == "live" else None
-            if point is None:
-                point = _simulate_next_point(last["timestamp"], float(last["consumption_kW"]), float(last.get("temperature_C", 24.0)), factor=factor)
-            # Append and compute
-            df_live = pd.concat([df_live, pd.DataFrame([point])], ignore_index=True)
-            df_live = df_live.tail(7*24*60).reset_index(drop=True)  # keep last ~7 days at 1-min res
-            last = df_live.iloc[-1]
-            # persist
+    def step_battery(self, soc_kwh: float, load_kw: float, pv_kw: float, dt_hours: float):
+        """Return (new_soc_kwh, batt_kw), batt_kw>0 discharging to load, <0 charging"""
+        res = simulate_battery([load_kw], [pv_kw], [0.0], dt_hours, self.cap_kwh, self.batt_limit_kw, soc_kwh)
+        return float(res["soc_kwh"][0, 0]), float(res["batt_kw"][0, 0])
+
+    def next_event(self, point: Optional[dict] = None) -> Optional[str]:
+        """Advance one tick and return the serialized SSE event; O(1) in the history length. `point` overrides
+        the next point; otherwise it comes from /api/ingest, the live upstream or simulation. None when the
+        upstream is up but has nothing new since the last tick."""
+        last_ts, last_load, last_temp = self.buf.last()
+        persist = True
+        if point is None and self.ingested:
+            point = self._take_ingested()
+            persist = point is None  # ingested points are stored already
+        # Try external live point if configured when source == live
+        if point is None and self.source == "live":
+            poller = live_poller()
+            if poller is not None:
+                seq, point = poller.latest(wait=poller.timeout)
+                if point is not None:
+                    if seq == self.upstream_seq:
+                        return None
+                    self.upstream_seq = seq
+        if point is None:
+            point = _simulate_next_point(pd.Timestamp(last_ts), last_load, last_temp, factor=self.factor)
+        ts_last = pd.to_datetime(point["timestamp"]).tz_localize(None)
+        self.buf.push(ts_last.value, float(point["consumption_kW"]), float(point.get("temperature_C", 24.0)))
+        # persist (batched by the background writer)
+        if persist:
             try:
-                _ensure_live_table()
-                _insert_live_point(point)
+                SITES.writer(self.site.id).submit(point)
             except Exception:
                 pass
-            # Determine approx dt for battery step (based on last two points)
-            if len(df_live) >= 2:
-                dt_hours = float(pd.to_datetime(df_live["timestamp"]).diff().iloc[-1].total_seconds() / 3600.0)
-                if not np.isfinite(dt_hours) or dt_hours <= 0:
-                    dt_hours = 1.0/60.0
-            else:
-                dt_hours = 1.0/60.0
-            # KPIs on a rolling 24h window
-            if len(df_live) >= 2:
-                med_dt = float(pd.Series(df_live["timestamp"]).diff().dropna().dt.total_seconds().median() / 3600.0)
-                if not np.isfinite(med_dt) or med_dt <= 0:
-                    med_dt = 1.0
-            else:
-                med_dt = 1.0
-            window_steps = int(max(1, round(24.0 / med_dt)))
-            window_df = df_live.tail(window_steps).copy()
-            kpis = compute_kpis(window_df) if len(window_df) else {}
-            # Estimate PV for last timestamp and update battery state
-            ts_last = pd.to_datetime(last["timestamp"]).tz_localize(None)
-            temp_last = float(last.get("temperature_C", 24.0))
-            pv_now = estimate_pv_kw(ts_last, temp_last, pv_factor=pv_factor)
-            load_now = float(last["consumption_kW"]) if "consumption_kW" in last else 0.0
-            soc_state_kwh, batt_kw = step_battery(soc_state_kwh, load_now, pv_now, dt_hours)
-            equip = {
-                "pv_kw": round(pv_now, 3),
-                "load_kw": round(load_now, 3),
-                "battery_kw": round(batt_kw, 3),
-                "grid_kw": round(max(0.0, load_now - pv_now - batt_kw), 3),
-                "battery_soc": int(round(100 * soc_state_kwh / cap_kwh)),
-            }
-            context = generate_context(kpis, equip)
-            alerts = compute_alerts(kpis, equip)
-            payload = {
-                "tick": {
-                    "x": pd.to_datetime(last["timestamp"]).isoformat(),
-                    "y": round(float(last["consumption_kW"]), 3),
-                    "temp": round(float(last["temperature_C"]), 2),
-                },
-                "kpis": kpis,
-                "equipment": equip,
-                "context": context,
-                "alerts": alerts,
+        # Battery step uses the spacing of the last two points
+        dt_hours = self.buf.dt_hours
+        if dt_hours is None or not np.isfinite(dt_hours) or dt_hours <= 0:
+            dt_hours = 1.0/60.0
+        # KPIs on a rolling 24h window
+        kpis = self.buf.kpis()
+        # Estimate PV for last timestamp and update battery state
+        _, load_now, temp_last = self.buf.last()
+        pv_now = estimate_pv_kw(ts_last, temp_last, pv_factor=self.pv_factor)
+        self.soc_state_kwh, batt_kw = self.step_battery(self.soc_state_kwh, load_now, pv_now, dt_hours)
+        equip = {
+            "pv_kw": round(pv_now, 3),
+            "load_kw": round(load_now, 3),
+            "battery_kw": round(batt_kw, 3),
+            "grid_kw": round(max(0.0, load_now - pv_now - batt_kw), 3),
+            "battery_soc": int(round(100 * self.soc_state_kwh / self.cap_kwh)),
+        }
+        context = generate_context(kpis, equip)
+        alerts = compute_alerts(kpis, equip)
+        payload = {
+            "tick": {
+                "x": kpis["last_updated"],
+                "y": round(load_now, 3),
+                "temp": round(temp_last, 2),
+            },
+            "kpis": kpis,
+            "equipment": equip,
+            "context": context,
+            "alerts": alerts,
+        }
+        return f"event: tick\n" + f"data: {json.dumps(payload)}\n\n"
+
+def stream_error_event(error: Exception, retry_s: float) -> str:
+    """SSE frame sent while a stream's state cannot be built; retry_s is the wait before the next attempt.
+    Shared by StreamHub and stream_service so both report failures with the same schema."""
+    return "event: stream_error\n" + f"data: {json.dumps({'error': 'stream_unavailable', 'detail': str(error), 'retry_s': retry_s})}\n\n"
+
+class _Subscriber:
+    __slots__ = ("queue", "dropped")
+
+    def __init__(self, maxsize: int):
+        import queue
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.dropped = 0
+
+    def offer(self, event: str):
+        """Non-blocking put; a full queue drops its oldest event so slow clients skip to fresh ticks."""
+        import queue
+        while True:
+            try:
+                self.queue.put_nowait(event)
+                return
+            except queue.Full:
+                try:
+                    self.queue.get_nowait()
+                    self.dropped += 1
+                except queue.Empty:
+                    pass
+
+class _Producer:
+    def __init__(self, key: tuple, make_state):
+        self.key = key
+        self.make_state = make_state
+        self.subscribers = set()
+        self.last_event = None
+        self.idle_since = None
+        self.stop = threading.Event()
+        self.thread = None
+        self.state = None
+
+class StreamHub:
+    """Fan-out for /api/stream: one producer thread per (source, parameters, site) key computes and serializes
+    each tick once and offers it to every subscriber's bounded queue. Producers stop once they have had
+    no subscribers for `idle_grace` seconds. If the stream state cannot be built, subscribers get a
+    `stream_error` event and the producer retries with backoff up to `max_backoff` seconds."""
+
+    def __init__(self, interval: float = 2.0, queue_size: int = 8, idle_grace: float = 10.0, max_backoff: float = 30.0):
+        self.interval = float(interval)
+        self.max_backoff = float(max_backoff)
+        self.queue_size = int(queue_size)
+        self.idle_grace = float(idle_grace)
+        self._producers = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, key: tuple, make_state) -> _Subscriber:
+        sub = _Subscriber(self.queue_size)
+        with self._lock:
+            prod = self._producers.get(key)
+            if prod is None:
+                prod = self._producers[key] = _Producer(key, make_state)
+                prod.thread = threading.Thread(target=self._run, args=(prod,), name=f"stream-{key[0]}", daemon=True)
+                prod.thread.start()
+            prod.subscribers.add(sub)
+            prod.idle_since = None
+            if prod.last_event is not None:
+                sub.offer(prod.last_event)  # new clients see the current state right away
+        return sub
+
+    def unsubscribe(self, key: tuple, sub: _Subscriber):
+        with self._lock:
+            prod = self._producers.get(key)
+            if prod is not None:
+                prod.subscribers.discard(sub)
+                if not prod.subscribers:
+                    prod.idle_since = time.monotonic()
+
+    def _run(self, prod: _Producer):
+        state, due = None, None
+        backoff = self.interval
+        while not prod.stop.is_set():
+            delay = self.interval
+            if state is None:
+                # the site failed to load or the upstream is down: tell the clients and retry with backoff
+                # (as stream_service does) rather than exiting and being respawned by every subscriber
+                try:
+                    state = prod.state = prod.make_state()
+                    backoff = self.interval
+                except Exception as e:
+                    TELEMETRY.inc("microgrid_stream_errors_total", (("stage", "state"),))
+                    event = stream_error_event(e, backoff)
+                    delay, backoff = backoff, min(backoff * 2, self.max_backoff)
+            if state is not None:
+                t0 = time.monotonic()
+                if due is not None:
+                    TELEMETRY.observe("microgrid_stream_tick_lag_seconds", max(0.0, t0 - due))
+                try:
+                    event = state.next_event()
+                except Exception:
+                    TELEMETRY.inc("microgrid_stream_errors_total", (("stage", "tick"),))
+                    event = None
+                TELEMETRY.observe("microgrid_stream_tick_seconds", time.monotonic() - t0)
+            with self._lock:
+                if event is not None:
+                    if state is not None:
+                        prod.last_event = event
+                    for sub in prod.subscribers:
+                        sub.offer(event)
+                if not prod.subscribers and prod.idle_since is not None and time.monotonic() - prod.idle_since >= self.idle_grace:
+                    break
+            due = time.monotonic() + delay
+            prod.stop.wait(delay)
+        with self._lock:
+            if self._producers.get(prod.key) is prod:
+                del self._producers[prod.key]
+            # a client that raced the shutdown is handed to a fresh producer on its next subscribe;
+            # wake it so its generator re-subscribes instead of waiting on a dead queue
+            for sub in prod.subscribers:
+                sub.offer(None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "producers": len(self._producers),
+                "subscribers": sum(len(p.subscribers) for p in self._producers.values()),
+                "dropped": sum(s.dropped for p in self._producers.values() for s in p.subscribers),
             }
-            yield f"event: tick\n" + f"data: {json.dumps(payload)}\n\n"
-            time.sleep(2)
+
+    def notify(self, site: str, ts: np.ndarray, load: np.ndarray, temp: np.ndarray) -> int:
+        """Hand ingested points to the running non-simulated streams of `site`; returns how many."""
+        with self._lock:
+            states = [p.state for p in self._producers.values()
+                      if p.key[-1] == site and p.state is not None and p.key[0] not in ("sim", "simulacao")]
+        for state in states:
+            state.offer(ts, load, temp)
+        return len(states)
+
+    def subscriber_counts(self) -> dict:
+        """Connected SSE clients per (source, site); keys are (source, ..., site id) tuples."""
+        counts = {}
+        with self._lock:
+            for key, prod in self._producers.items():
+                labels = (("source", key[0]), ("site", key[-1]))
+                counts[labels] = counts.get(labels, 0) + len(prod.subscribers)
+        return counts
+
+STREAM_HUB = StreamHub(
+    interval=float(os.environ.get("STREAM_INTERVAL_S", "2")),
+    queue_size=int(os.environ.get("STREAM_QUEUE_SIZE", "8")),
+)
+
+@app.route("/api/stream")
+def api_stream():
+    site = resolve_site(request.args.get("site"))
+    if site is None:
+        return jsonify({"error": "unknown_site", "detail": request.args.get("site")}), 404
+    source = request.args.get("source", "live").lower()
+    factor = float(request.args.get("factor", 1.0))
+    pv_factor = float(request.args.get("pv_factor", site.pv_factor))
+    batt_limit = float(request.args.get("batt_limit", site.batt_limit_kw))
+    soc_init = float(request.args.get("soc_init", site.soc_init_pct))
+    key = (source, factor, pv_factor, batt_limit, soc_init, site.id)
+
+    def make_state():
+        return _LiveStream(source, factor, pv_factor, batt_limit, soc_init, site.id)
+
+    def gen():
+        import queue
+        retry_ms = 2000
+        yield f"retry: {retry_ms}\n\n"
+        sub = STREAM_HUB.subscribe(key, make_state)
+        try:
+            while True:
+                try:
+                    event = sub.queue.get(timeout=15)
+                except queue.Empty:
+                    yield ": keep-alive\n\n"
+                    continue
+                if event is None:
+                    # producer shut down underneath us (idle race); attach to a new one after a pause
+                    STREAM_HUB.unsubscribe(key, sub)
+                    time.sleep(STREAM_HUB.interval)
+                    sub = STREAM_HUB.subscribe(key, make_state)
+                    continue
+                yield event
+        finally:
+            STREAM_HUB.unsubscribe(key, sub)
 
     return Response(stream_with_context(gen()), mimetype="text/event-stream", headers={
         "Cache-Control": "no-cache",
@@ -812,12 +2634,12 @@ def api_stream():
 @app.route("/")
 def index():
     dev_livereload = os.environ.get("DEV_LIVERELOAD", "0") in ("1", "true", "True", "yes")
-    return render_template("dashboard.html", dev_livereload=dev_livereload)
+    # STREAM_URL points the page at a separate stream service (stream_service.py), e.g. behind a proxy
+    stream_url = os.environ.get("STREAM_URL", "/api/stream")
+    return render_template("dashboard.html", dev_livereload=dev_livereload, stream_url=stream_url)
 
-@app.route("/api/dashboard")
-def api_dashboard():
-    source = request.args.get("source", "db").lower()
-    algo = (request.args.get("algo") or "rf").lower()
+def normalize_algo(algo: Optional[str]) -> str:
+    algo = (algo or "rf").lower()
     # Normalize Portuguese synonyms
     if algo in ("floresta", "floresta_aleatoria", "floresta-aleatoria", "rf-pt"):
         algo = "rf"
@@ -825,247 +2647,401 @@ def api_dashboard():
         algo = "linear"
     if algo in ("automatico", "automático", "auto-pt"):
         algo = "auto"
-    def safe_float(val, default):
-        try:
-            if val is None:
-                return float(default)
-            if isinstance(val, str) and val.strip() == "":
-                return float(default)
-            return float(val)
-        except Exception:
+    return algo
+
+def safe_float(val, default):
+    try:
+        if val is None:
+            return float(default)
+        if isinstance(val, str) and val.strip() == "":
             return float(default)
+        return float(val)
+    except Exception:
+        return float(default)
 
-    factor = safe_float(request.args.get("factor"), 1.0)
-    pv_factor = safe_float(request.args.get("pv_factor"), 1.0)
-    batt_limit = safe_float(request.args.get("batt_limit"), 2.0)
-    soc_init = safe_float(request.args.get("soc_init"), 50.0)
-    mode = (request.args.get("mode") or "normal").lower()
-    goal_text = request.args.get("goal")
-    goal = parse_goal(goal_text)
-    soc_min = safe_float(request.args.get("soc_min"), 0.0)
-    # Clamp to sensible ranges
-    factor = float(np.clip(factor, 0.5, 1.5))
-    pv_factor = float(np.clip(pv_factor, 0.5, 2.0))
-    batt_limit = float(np.clip(batt_limit, 0.0, 10.0))
-    soc_init = float(np.clip(soc_init, 0.0, 100.0))
-    soc_min = float(np.clip(soc_min, 0.0, 80.0))
+def dashboard_frame(source: str, factor: float = 1.0, site: Optional[str] = None):
+    """History behind the dashboard: (df, snapshot). 'sim' regenerates a noisy synthetic series and has
+    no snapshot; every other source is served from the site's store."""
     if source == "sim" or source == "simulacao":
         # Generate synthetic series for the last ~14 days for richer context
         now = pd.Timestamp.now().tz_localize(None)
         idx = pd.date_range(end=now, periods=24*14, freq="H")
         hours = idx.hour + idx.minute/60
         temp = 24 + 3*np.sin((hours-6)/24*2*np.pi)
-        # Additional context for drift detection
-        df_full = load_source(source)
-        drift = compute_drift(df_full)
         base = 2.5 + 0.8 * (1 + np.sin((hours-6)/24*2*np.pi)) + 0.2*np.sin((hours)/24*4*np.pi)
         noise = np.random.normal(0, 0.08, size=len(idx))
         load = np.maximum(0.2, (base + 0.05*(temp-24) + noise) * float(factor))
-        df = pd.DataFrame({"timestamp": idx, "consumption_kW": load, "temperature_C": temp})
-    else:
-        df = load_source(source)
-    last = df.tail(7*24)
-    trace = {"x": last["timestamp"].astype(str).tolist(), "y": last["consumption_kW"].round(3).tolist(), "type": "scatter", "name": "Consumo de energia (kW)", "hovertemplate": "Tempo: %{x}<br>Consumo: %{y:.2f} kW"}
-    consumption = {"data":[trace], "layout":{"title":"Consumo - últimos 7 dias", "xaxis":{"title":"timestamp"}, "yaxis":{"title":"kW"}}}
+        return pd.DataFrame({"timestamp": idx, "consumption_kW": load, "temperature_C": temp}), None
+    snap = source_snapshot(source, site)
+    return (snap.frame() if snap is not None else load_source(source, site)), snap
 
+def forecast_model(df: pd.DataFrame, snap: Optional[SeriesSnapshot], algo: str):
+    """Pick/fit the model for `algo` on the lag features of `df`.
+    Returns (model, resolved algo, metrics, features, lag-feature frame)."""
     df_full = df.copy()
     df_full["timestamp"] = pd.to_datetime(df_full["timestamp"])
-    df_feat = make_lag_features(df_full, n_lags=24)
-    last_row = df_feat.tail(1).iloc[0]
+    with stage("features"):
+        df_feat = make_lag_features(df_full, n_lags=24)
     features = [c for c in df_feat.columns if c.startswith("lag_")] + ["hour","dayofweek","temperature_C"]
-    preds = []
-    current = last_row.copy()
 
-    # Choose model per 'algo'
+    # Choose model per 'algo'; fitted models come from the registry (one fit per data version)
     active_model = None
-    metrics = {**METRICS}
-    # helpers to train/eval simple models with same split
-    def _train_test_split(df_feat_local):
-        Xl = df_feat_local[features]
-        yl = df_feat_local["consumption_kW"].astype(float)
-        if len(df_feat_local) >= 2:
-            dt_hours_local = float(pd.Series(df_feat_local["timestamp"]).diff().dropna().dt.total_seconds().median() / 3600.0)
-            if not np.isfinite(dt_hours_local) or dt_hours_local <= 0:
-                dt_hours_local = 1.0
-        else:
-            dt_hours_local = 1.0
-        steps_day_l = int(max(1, round(24.0 / dt_hours_local)))
-        test_n_l = int(min(len(df_feat_local)//3, max(steps_day_l*3, 24)))
-        split_l = max(1, len(df_feat_local) - test_n_l)
-        return (Xl.iloc[:split_l], yl.iloc[:split_l], Xl.iloc[split_l:], yl.iloc[split_l:])
-
-    def _mae(y_true, y_pred):
-        try:
-            return float(np.mean(np.abs(y_true.values - y_pred)))
-        except Exception:
-            return float("inf")
+    metrics = {**BASE_MODEL.metrics}
     if algo in ("rf", "random_forest", "randomforest"):
-        active_model = MODEL
+        active_model = BASE_MODEL.model
+        algo = "rf"
         # keep metrics from saved file
-    elif algo in ("auto",):
+    elif algo in ("auto", "linear", "lin", "lr", "linear_regression", "ridge", "lasso"):
+        if algo in ("lin", "lr", "linear_regression"):
+            algo = "linear"
         try:
-            X_train, y_train, X_test, y_test = _train_test_split(df_feat)
-            # Evaluate RF saved model
-            rf_mae = _mae(y_test, MODEL.predict(X_test)) if len(X_test) else float(METRICS.get("mae_test", 0.5))
-            best = ("rf", rf_mae, MODEL)
-            # Linear
-            try:
-                lr = LinearRegression()
-                lr.fit(X_train, y_train)
-                mae_lr = _mae(y_test, lr.predict(X_test))
-                if mae_lr < best[1]: best = ("linear", mae_lr, lr)
-            except Exception:
-                pass
-            # Ridge
-            try:
-                rg = Ridge(alpha=1.0)
-                rg.fit(X_train, y_train)
-                mae_rg = _mae(y_test, rg.predict(X_test))
-                if mae_rg < best[1]: best = ("ridge", mae_rg, rg)
-            except Exception:
-                pass
-            # Lasso
-            try:
-                ls = Lasso(alpha=0.001, max_iter=10000)
-                ls.fit(X_train, y_train)
-                mae_ls = _mae(y_test, ls.predict(X_test))
-                if mae_ls < best[1]: best = ("lasso", mae_ls, ls)
-            except Exception:
-                pass
-            algo = best[0]
-            active_model = best[2]
-            metrics = {"mae_test": round(float(best[1]), 4)}
-        except Exception:
-            active_model = MODEL
-            metrics = {**METRICS}
-            algo = "rf"
-    elif algo in ("linear", "lin", "lr", "linear_regression"):
-        # Train a quick Linear Regression on-the-fly
-        try:
-            X = df_feat[features]
-            y = df_feat["consumption_kW"].astype(float)
-            # time-based split: last ~3 days as test
-            if len(df_feat) >= 10:
-                # estimate steps per day
-                if len(df_feat) >= 2:
-                    dt_hours = float(pd.Series(df_feat["timestamp"]).diff().dropna().dt.total_seconds().median() / 3600.0)
-                    if not np.isfinite(dt_hours) or dt_hours <= 0:
-                        dt_hours = 1.0
+            with stage("fit"):
+                if snap is None:
+                    algo, active_model, mae = fit_algo(algo, df_feat, features)
                 else:
-                    dt_hours = 1.0
-                steps_day = int(max(1, round(24.0 / dt_hours)))
-                test_n = int(min(len(df_feat)//3, max(steps_day*3, 24)))
-                split = len(df_feat) - test_n
-                X_train, y_train = X.iloc[:split], y.iloc[:split]
-                X_test, y_test = X.iloc[split:], y.iloc[split:]
-            else:
-                X_train, y_train = X, y
-                X_test, y_test = X.iloc[-1:], y.iloc[-1:]
-            lr = LinearRegression()
-            lr.fit(X_train, y_train)
-            active_model = lr
-            # compute MAE on test
-            try:
-                y_pred = lr.predict(X_test)
-                mae = float(np.mean(np.abs(y_test.values - y_pred)))
-                metrics = {"mae_test": round(mae, 4)}
-            except Exception:
-                metrics = {"mae_test": float(METRICS.get("mae_test", 0.5))}
+                    algo, active_model, mae = MODEL_REGISTRY.get(
+                        snap.label, algo, snap.version, ("lags", 24, tuple(features)), df_feat, features)
+            metrics = {"mae_test": round(float(mae), 4)}
         except Exception:
-            active_model = MODEL
-            metrics = {**METRICS}
-            algo = "rf"
-    elif algo in ("ridge",):
-        try:
-            X = df_feat[features]
-            y = df_feat["consumption_kW"].astype(float)
-            if len(df_feat) >= 2:
-                dt_hours = float(pd.Series(df_feat["timestamp"]).diff().dropna().dt.total_seconds().median() / 3600.0)
-                if not np.isfinite(dt_hours) or dt_hours <= 0:
-                    dt_hours = 1.0
-            else:
-                dt_hours = 1.0
-            steps_day = int(max(1, round(24.0 / dt_hours)))
-            test_n = int(min(len(df_feat)//3, max(steps_day*3, 24)))
-            split = max(1, len(df_feat) - test_n)
-            X_train, y_train = X.iloc[:split], y.iloc[:split]
-            X_test, y_test = X.iloc[split:], y.iloc[split:]
-            model = Ridge(alpha=1.0)
-            model.fit(X_train, y_train)
-            active_model = model
-            try:
-                y_pred = model.predict(X_test)
-                mae = float(np.mean(np.abs(y_test.values - y_pred)))
-                metrics = {"mae_test": round(mae, 4)}
-            except Exception:
-                metrics = {"mae_test": float(METRICS.get("mae_test", 0.5))}
-        except Exception:
-            active_model = MODEL
-            metrics = {**METRICS}
-            algo = "rf"
-    elif algo in ("lasso",):
-        try:
-            X = df_feat[features]
-            y = df_feat["consumption_kW"].astype(float)
-            if len(df_feat) >= 2:
-                dt_hours = float(pd.Series(df_feat["timestamp"]).diff().dropna().dt.total_seconds().median() / 3600.0)
-                if not np.isfinite(dt_hours) or dt_hours <= 0:
-                    dt_hours = 1.0
-            else:
-                dt_hours = 1.0
-            steps_day = int(max(1, round(24.0 / dt_hours)))
-            test_n = int(min(len(df_feat)//3, max(steps_day*3, 24)))
-            split = max(1, len(df_feat) - test_n)
-            X_train, y_train = X.iloc[:split], y.iloc[:split]
-            X_test, y_test = X.iloc[split:], y.iloc[split:]
-            model = Lasso(alpha=0.001, max_iter=10000)
-            model.fit(X_train, y_train)
-            active_model = model
-            try:
-                y_pred = model.predict(X_test)
-                mae = float(np.mean(np.abs(y_test.values - y_pred)))
-                metrics = {"mae_test": round(mae, 4)}
-            except Exception:
-                metrics = {"mae_test": float(METRICS.get("mae_test", 0.5))}
-        except Exception:
-            active_model = MODEL
-            metrics = {**METRICS}
+            active_model = BASE_MODEL.model
+            metrics = {**BASE_MODEL.metrics}
             algo = "rf"
     else:
         # default to RF
-        active_model = MODEL
+        active_model = BASE_MODEL.model
         algo = "rf"
-    for h in range(24):
-        # update temperature feature with external forecast or diurnal estimate
-        ts = pd.to_datetime(current["timestamp"]) + pd.Timedelta(hours=1)
-        temp_f = _weather_forecast(ts)
-        if temp_f is None:
-            temp_f = estimate_temp(ts)
-        current["temperature_C"] = temp_f
-        x_df = pd.DataFrame([current[features]])
-        yhat = float(active_model.predict(x_df)[0])
-        preds.append({"ts": ts.isoformat(), "y": yhat})
-        for lag in range(24,1,-1):
-            current[f"lag_{lag}"] = current[f"lag_{lag-1}"]
-        current["lag_1"] = yhat
-        current["timestamp"] = ts
-        current["hour"] = ts.hour
-        current["dayofweek"] = ts.dayofweek
-
-    # Forecast with simple uncertainty bands using MAE
-    mae = float(metrics.get("mae_test", METRICS.get("mae_test", 0.5)))
-    k = 1.5
+    return active_model, algo, metrics, features, df_feat
+
+def forecast_frame(df: pd.DataFrame, snap: Optional[SeriesSnapshot], algo: str, horizon: int = 24):
+    """Pick/fit the model for `algo` and forecast `horizon` hourly steps past the end of `df`.
+    Returns (preds [{ts, y}], resolved algo, metrics)."""
+    active_model, algo, metrics, features, df_feat = forecast_model(df, snap, algo)
+    current = df_feat.tail(1).iloc[0].copy()
+    with stage("forecast"):
+        targets, yhat = forecast_recursive(active_model, features, current, horizon=horizon, temps_fn=forecast_temps)
+    if snap is not None:
+        # calibration bookkeeping for the conformal bands: score this forecast once actuals arrive
+        RESIDUALS.record((snap.label, algo), targets.asi8, yhat)
+        RESIDUALS.seed((snap.label, algo), active_model, features, df_feat)
+    preds = [{"ts": ts.isoformat(), "y": float(y)} for ts, y in zip(targets, yhat)]
+    return preds, algo, metrics
+
+COLUMNS_MIME = "application/x-microgrid-columns"
+ARROW_MIME = "application/vnd.apache.arrow.stream"
+RESPONSE_MIMES = {"json": "application/json", "columns": COLUMNS_MIME, "arrow": ARROW_MIME}
+
+class TsArray:
+    """Epoch-ns timestamps inside a response payload. JSON writes strings (fmt ' ' as astype(str),
+    'T' as isoformat, 'date' as YYYY-MM-DD); binary formats write int64 epoch milliseconds."""
+    __slots__ = ("ns", "fmt")
+
+    def __init__(self, ns: np.ndarray, fmt: str = " "):
+        self.ns = np.asarray(ns, dtype=np.int64)
+        self.fmt = fmt
+
+    def __len__(self):
+        return len(self.ns)
+
+    def strings(self) -> list:
+        ns = self.ns
+        if not len(ns):
+            return []
+        if self.fmt == "date":
+            unit = "D"
+        else:
+            # same precision rule as pandas astype(str): seconds, else microseconds, else nanoseconds
+            unit = "s" if not (ns % 1_000_000_000).any() else ("us" if not (ns % 1000).any() else "ns")
+        out = np.datetime_as_string(ns.astype("datetime64[ns]"), unit=unit).astype("S")
+        if self.fmt == " ":
+            out.view(np.uint8).reshape(len(out), -1)[:, 10] = ord(" ")
+        return out.astype("U").tolist()
+
+def _json_default(o):
+    if isinstance(o, TsArray):
+        return o.strings()
+    if isinstance(o, np.ndarray):
+        return o.tolist()
+    if isinstance(o, np.generic):
+        return o.item()
+    return app.json.default(o)
+
+def dumps_json(payload) -> bytes:
+    """JSON bytes with sorted keys like jsonify; numpy arrays are written directly when orjson is installed."""
+    if orjson is not None:
+        return orjson.dumps(payload, default=_json_default,
+                            option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS)
+    return app.json.dumps(payload, default=_json_default, separators=(",", ":")).encode("utf-8")
+
+def encode_columns(payload) -> bytes:
+    """Columnar binary encoding: b"MGC1", uint32 LE header length, JSON header, then 8-byte aligned column
+    blocks. Every 1-D numeric ndarray becomes a float32 column and every TsArray an int64 epoch-ms column;
+    in the header's "payload" they are replaced by {"$col": i} and "columns"[i] gives dtype/offset/length
+    (offsets relative to the first block)."""
+    import struct
+    columns, blocks = [], []
+    offset = 0
+
+    def walk(o):
+        nonlocal offset
+        if isinstance(o, TsArray):
+            data, spec = (o.ns // 1_000_000).astype("<i8"), {"dtype": "ts_ms", "fmt": o.fmt}
+        elif isinstance(o, np.ndarray) and o.ndim == 1 and o.dtype.kind in "fiub":
+            data, spec = o.astype("<f4"), {"dtype": "f4"}
+        elif isinstance(o, dict):
+            return {k: walk(v) for k, v in o.items()}
+        elif isinstance(o, (list, tuple)):
+            return [walk(v) for v in o]
+        else:
+            return o
+        raw = data.tobytes()
+        columns.append({**spec, "offset": offset, "length": len(data)})
+        blocks.append(raw + b"\0" * (-len(raw) % 8))
+        offset += len(blocks[-1])
+        return {"$col": len(columns) - 1}
+
+    tree = walk(payload)
+    header = dumps_json({"columns": columns, "payload": tree})
+    header += b" " * (-(8 + len(header)) % 8)
+    return b"MGC1" + struct.pack("<I", len(header)) + header + b"".join(blocks)
+
+def decode_columns(body: bytes):
+    """Inverse of encode_columns for request bodies: the header payload with every {"$col": i} replaced by
+    its column as an ndarray (ts_ms -> int64 epoch-ms; f4/f8/i8 as stored). Raises ValueError if malformed."""
+    import struct
+    if len(body) < 8 or body[:4] != b"MGC1":
+        raise ValueError("not a MGC1 columns body")
+    (n,) = struct.unpack("<I", body[4:8])
+    header = json.loads(body[8:8 + n])
+    base = 8 + n
+    dtypes = {"ts_ms": "<i8", "f4": "<f4", "f8": "<f8", "i8": "<i8"}
+    cols = []
+    for spec in header.get("columns", []):
+        dt = np.dtype(dtypes[spec["dtype"]])
+        start, length = base + int(spec["offset"]), int(spec["length"])
+        if start + length * dt.itemsize > len(body):
+            raise ValueError("column block past the end of the body")
+        cols.append(np.frombuffer(body, dtype=dt, count=length, offset=start))
+
+    def walk(o):
+        if isinstance(o, dict):
+            if set(o) == {"$col"}:
+                return cols[int(o["$col"])]
+            return {k: walk(v) for k, v in o.items()}
+        if isinstance(o, list):
+            return [walk(v) for v in o]
+        return o
+
+    return walk(header.get("payload"))
+
+def encode_arrow(payload: dict) -> bytes:
+    """Arrow IPC stream of the top-level array fields of a flat payload (TsArray -> timestamp[ms],
+    arrays -> float32); the remaining fields travel as JSON in the schema metadata under "payload"."""
+    import pyarrow as pa
+    names, arrays, meta = [], [], {}
+    for k, v in payload.items():
+        if isinstance(v, TsArray):
+            names.append(k)
+            arrays.append(pa.array(v.ns // 1_000_000, type=pa.timestamp("ms")))
+        elif isinstance(v, np.ndarray) and v.ndim == 1:
+            names.append(k)
+            arrays.append(pa.array(v.astype(np.float32)))
+        else:
+            meta[k] = v
+    batch = pa.RecordBatch.from_arrays(arrays, names=names)
+    schema = batch.schema.with_metadata({"payload": dumps_json(meta)})
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, schema) as writer:
+        writer.write_batch(batch)
+    return sink.getvalue().to_pybytes()
+
+def _arrow_available() -> bool:
+    try:
+        import pyarrow  # noqa: F401
+        return True
+    except Exception:
+        return False
+
+def response_format(allowed=("json", "columns")) -> str:
+    """Negotiated payload encoding: `format=` query override, else the Accept header (JSON by default)."""
+    allowed = [f for f in allowed if f != "arrow" or _arrow_available()]
+    fmt = (request.args.get("format") or "").lower()
+    if fmt in allowed:
+        return fmt
+    best = request.accept_mimetypes.best_match([RESPONSE_MIMES[f] for f in ["json"] + [f for f in allowed if f != "json"]])
+    return {COLUMNS_MIME: "columns", ARROW_MIME: "arrow"}.get(best, "json")
+
+def encode_payload(payload, fmt: str) -> bytes:
+    if fmt == "columns":
+        return encode_columns(payload)
+    if fmt == "arrow":
+        return encode_arrow(payload)
+    return dumps_json(payload)
+
+def cached_response(cache, key: tuple, build, allowed=("json", "columns")) -> Response:
+    """Serve build() through `cache` in the negotiated format with a strong ETag (If-None-Match -> 304).
+    Server-Timing reports whether this request computed the body (miss) or reused one (hit)."""
+    fmt = response_format(allowed)
+
+    def compute():
+        g.cache_status = "miss"
+        payload = build()
+        with stage("encode"):
+            return encode_payload(payload, fmt)
+
+    g.cache_status = "hit"
+    body, etag = cache.get(key + (fmt,), compute)
+    resp = Response(body, mimetype=RESPONSE_MIMES[fmt])
+    resp.set_etag(etag)
+    resp.headers["Cache-Control"] = "no-cache"
+    resp.headers["Vary"] = "Accept"
+    return resp.make_conditional(request)
+
+class ResponseCache:
+    """Bounded LRU of serialized responses with a TTL and request coalescing. Keys must include the data
+    version they were computed from and start with the site id (see invalidate); the TTL covers inputs
+    without a version (weather, background refits, residual updates). Concurrent misses on one key run a
+    single computation and the rest wait for it."""
+
+    def __init__(self, max_entries: int = 128, ttl: float = 30.0):
+        from collections import OrderedDict
+        self.max_entries = int(max_entries)
+        self.ttl = float(ttl)
+        self._entries = OrderedDict()  # key -> (expires_at, body bytes, etag)
+        self._inflight = {}  # key -> [Event, result or None, exception or None]
+        self._lock = threading.Lock()
+        self.counters = {"hits": 0, "misses": 0, "coalesced": 0, "errors": 0}
+
+    def get(self, key, compute):
+        """(body, etag) for key; compute() -> bytes runs at most once per key at a time."""
+        import hashlib
+        with self._lock:
+            hit = self._entries.get(key)
+            if hit is not None and hit[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.counters["hits"] += 1
+                return hit[1], hit[2]
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[key] = [threading.Event(), None, None]
+                self.counters["misses"] += 1
+            else:
+                self.counters["coalesced"] += 1
+        if not leader:
+            flight[0].wait()
+            if flight[2] is not None:
+                raise flight[2]
+            return flight[1]
+        try:
+            body = compute()
+            flight[1] = (body, hashlib.blake2b(body, digest_size=16).hexdigest())
+            with self._lock:
+                self._entries[key] = (time.monotonic() + self.ttl, *flight[1])
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+            return flight[1]
+        except Exception as e:
+            flight[2] = e
+            with self._lock:
+                self.counters["errors"] += 1
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            flight[0].set()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def invalidate(self, match) -> int:
+        """Drop the entries whose key satisfies match(key); returns how many."""
+        with self._lock:
+            stale = [k for k in self._entries if match(k)]
+            for k in stale:
+                del self._entries[k]
+        return len(stale)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {**self.counters, "entries": len(self._entries), "inflight": len(self._inflight)}
+
+DASHBOARD_CACHE = ResponseCache(
+    max_entries=int(os.environ.get("DASHBOARD_CACHE_SIZE", "128")),
+    ttl=float(os.environ.get("DASHBOARD_CACHE_TTL_S", "30")),
+)
+
+@app.route("/api/dashboard")
+def api_dashboard():
+    """Dashboard payload, served from DASHBOARD_CACHE keyed by the normalized parameters and the data
+    version of the source, with a strong ETag (If-None-Match -> 304). `site` selects the partition; its
+    battery/PV configuration provides the defaults of the simulation parameters."""
+    site = resolve_site(request.args.get("site"))
+    if site is None:
+        return jsonify({"error": "unknown_site", "detail": request.args.get("site")}), 404
+    source = request.args.get("source", "db").lower()
+    algo = normalize_algo(request.args.get("algo"))
+    factor = safe_float(request.args.get("factor"), 1.0)
+    pv_factor = safe_float(request.args.get("pv_factor"), site.pv_factor)
+    batt_limit = safe_float(request.args.get("batt_limit"), site.batt_limit_kw)
+    soc_init = safe_float(request.args.get("soc_init"), site.soc_init_pct)
+    mode = (request.args.get("mode") or "normal").lower()
+    goal_text = (request.args.get("goal") or "").strip()
+    soc_min = safe_float(request.args.get("soc_min"), site.soc_min_pct)
+    horizon = int(np.clip(safe_float(request.args.get("horizon"), 24), 1, 168))
+    # Clamp to sensible ranges
+    factor = float(np.clip(factor, 0.5, 1.5))
+    pv_factor = float(np.clip(pv_factor, 0.5, 2.0))
+    batt_limit = float(np.clip(batt_limit, 0.0, 10.0))
+    soc_init = float(np.clip(soc_init, 0.0, 100.0))
+    soc_min = float(np.clip(soc_min, 0.0, 80.0))
+    params = (source, algo, factor, pv_factor, batt_limit, soc_init, mode, goal_text, soc_min, horizon, site.id)
+    snap = source_snapshot(source, site.id) if source not in ("sim", "simulacao") else None
+    key = (site.id,) + params + ((snap.label, snap.version) if snap is not None else None,)
+    return cached_response(DASHBOARD_CACHE, key, lambda: dashboard_payload(*params))
+
+def dashboard_payload(source: str, algo: str, factor: float, pv_factor: float, batt_limit: float, soc_init: float,
+                      mode: str, goal_text: str, soc_min: float, horizon: int, site: Optional[str] = None) -> dict:
+    """Everything /api/dashboard returns, for already normalized parameters."""
+    goal = parse_goal(goal_text or None)
+    cfg = SITES.get(site)
+    with stage("load"):
+        df, snap = dashboard_frame(source, factor, cfg.id)
+    last = df.tail(7*24)
+    # chart traces: last 7 days by time, decimated like /api/series
+    ts_all = pd.to_datetime(df["timestamp"])
+    week = df[(ts_all > ts_all.max() - pd.Timedelta(days=7)).to_numpy()]
+    week_ns = pd.DatetimeIndex(pd.to_datetime(week["timestamp"])).asi8
+    x_load, y_load = series_xy(week_ns, week["consumption_kW"].to_numpy(dtype=np.float64), DASHBOARD_TRACE_POINTS, "lttb", 3)
+    x_temp, y_temp = series_xy(week_ns, week["temperature_C"].to_numpy(dtype=np.float64), DASHBOARD_TRACE_POINTS, "lttb", 2)
+    trace = {"x": x_load, "y": y_load, "type": "scatter", "name": "Consumo de energia (kW)", "hovertemplate": "Tempo: %{x}<br>Consumo: %{y:.2f} kW"}
+    consumption = {"data":[trace], "layout":{"title":"Consumo - últimos 7 dias", "xaxis":{"title":"timestamp"}, "yaxis":{"title":"kW"}}}
+
+    preds, algo, metrics = forecast_frame(df, snap, algo, horizon)
+
+    # Uncertainty bands: conformal p10/p90 from rolling per-step residuals; ±1.5·MAE until calibrated
     xs = [p["ts"] for p in preds]
     ys = [max(0.0, p["y"]) for p in preds]
-    y_lo = [max(0.0, y - k*mae) for y in ys]
-    y_hi = [max(0.0, y + k*mae) for y in ys]
+    bands = RESIDUALS.bands((snap.label, algo), horizon) if snap is not None else None
+    if bands is not None:
+        q_lo, q_hi, n_res = bands
+        y_lo = np.maximum(0.0, np.array([p["y"] for p in preds]) + q_lo).round(4).tolist()
+        y_hi = np.maximum(0.0, np.array([p["y"] for p in preds]) + q_hi).round(4).tolist()
+        intervals = {"method": "conformal", "coverage": 0.8, "residuals_min": int(n_res.min()), "residuals_max": int(n_res.max())}
+    else:
+        mae = float(metrics.get("mae_test", BASE_MODEL.metrics.get("mae_test", 0.5)))
+        k = 1.5
+        y_lo = [max(0.0, y - k*mae) for y in ys]
+        y_hi = [max(0.0, y + k*mae) for y in ys]
+        intervals = {"method": "mae", "k": k}
     band_lower = {"x": xs, "y": y_lo, "type": "scatter", "mode": "lines", "name": "Limite inferior (p10)", "line": {"width": 0}, "showlegend": False}
     band_upper = {"x": xs, "y": y_hi, "type": "scatter", "mode": "lines", "name": "Incerteza (p10–p90)", "fill": "tonexty", "fillcolor": "rgba(96,165,250,0.18)", "line": {"width": 0}, "showlegend": True}
     median_line = {"x": xs, "y": ys, "type": "scatter", "mode": "lines+markers", "name": "Previsão (p50)", "line": {"color": "#60a5fa", "width": 2}}
-    forecast = {"data":[band_lower, band_upper, median_line], "layout":{"title":"Previsão - próximas 24 horas", "xaxis":{"title":"timestamp"}, "yaxis":{"title":"kW"}}}
+    forecast = {"data":[band_lower, band_upper, median_line], "layout":{"title":f"Previsão - próximas {horizon} horas", "xaxis":{"title":"timestamp"}, "yaxis":{"title":"kW"}}}
 
     # Extra datasets
-    temp_trace = {"x": last["timestamp"].astype(str).tolist(), "y": last["temperature_C"].round(2).tolist(), "type": "scatter", "name": "Temperatura (°C)", "yaxis": "y2"}
+    temp_trace = {"x": x_temp, "y": y_temp, "type": "scatter", "name": "Temperatura (°C)", "yaxis": "y2"}
     daily = df.copy()
     daily["date"] = pd.to_datetime(daily["timestamp"]).dt.date
     daily_agg = daily.groupby("date")["consumption_kW"].agg(["mean","max"]).reset_index()
@@ -1075,27 +3051,43 @@ def api_dashboard():
         "y_max": daily_agg["max"].round(3).tolist(),
     }
 
-    kpis = compute_kpis(df)
-    equipment = compute_equipment_state(df, pv_factor=pv_factor, batt_power_limit_kw=batt_limit, soc_init_pct=soc_init)
-    context = generate_context(kpis, equipment)
-    alerts = compute_alerts(kpis, equipment)
-    anomalies = detect_anomalies(last)
-    costs = compute_costs(pd.to_datetime(df.sort_values("timestamp").iloc[-1]["timestamp"]), kpis.get("current_load_kw") or 0.0, preds, df_history=df)
+    with stage("analytics"):
+        kpis = compute_kpis(df)
+        equipment = compute_equipment_state(df, pv_factor=pv_factor, batt_power_limit_kw=batt_limit, soc_init_pct=soc_init, cap_kwh=cfg.cap_kwh)
+        context = generate_context(kpis, equipment)
+        alerts = compute_alerts(kpis, equipment)
+        anomalies = detect_anomalies(last)
+    with stage("costs"):
+        costs = compute_costs(pd.to_datetime(df.sort_values("timestamp").iloc[-1]["timestamp"]), kpis.get("current_load_kw") or 0.0, preds, df_history=df)
     target_daily = goal.get("daily_target") if goal else None
-    optimization = optimize_battery_adaptive(
-        preds,
-        pv_factor=pv_factor,
-        batt_limit_kw=batt_limit,
-        soc_init_pct=soc_init,
-        mode=mode,
-        target_savings_per_day=target_daily,
-        soc_min_pct=soc_min,
-    )
+    with stage("optimize"):
+        if mode in ("optimal", "otimo", "ótimo", "otimizado"):
+            mode = "optimal"
+            optimization = optimize_battery_optimal(
+                preds,
+                pv_factor=pv_factor,
+                batt_limit_kw=batt_limit,
+                soc_init_pct=soc_init,
+                cap_kwh=cfg.cap_kwh,
+                soc_min_pct=soc_min,
+            )
+        else:
+            optimization = optimize_battery_adaptive(
+                preds,
+                pv_factor=pv_factor,
+                batt_limit_kw=batt_limit,
+                soc_init_pct=soc_init,
+                mode=mode,
+                target_savings_per_day=target_daily,
+                cap_kwh=cfg.cap_kwh,
+                soc_min_pct=soc_min,
+            )
 
-    return jsonify({
+    return {
         "consumption": {**consumption, "anomalies": anomalies},
         "forecast": forecast,
         "metrics": metrics,
+        "intervals": intervals,
         "temperature": {"data":[temp_trace], "layout": {"title": "Temperatura - últimos 7 dias", "xaxis": {"title": "timestamp"}, "yaxis": {"title": "°C"}}},
         "daily": daily_series,
         "kpis": kpis,
@@ -1103,63 +3095,1000 @@ def api_dashboard():
         "context": context,
         "alerts": alerts,
         "source": source,
+        "site": cfg.to_dict(),
         "mode": mode,
         "goal": goal,
     "soc_min": soc_min,
         "algo": algo,
+        "horizon": horizon,
         "sim": ({"factor": factor, "pv_factor": pv_factor, "batt_limit": batt_limit, "soc_init": soc_init} if source in ("sim","simulacao") else None),
         "costs": costs,
         "optimization": optimization,
+    }
+
+SWEEP_MAX_POINTS = int(os.environ.get("SWEEP_MAX_POINTS", "5000"))
+SWEEP_PARALLEL_MIN = int(os.environ.get("SWEEP_PARALLEL_MIN", "256"))
+SWEEP_WORKERS = max(1, int(os.environ.get("SWEEP_WORKERS", str(min(4, os.cpu_count() or 1)))))
+_SWEEP_POOL = None
+_SWEEP_POOL_LOCK = threading.Lock()
+
+def _sweep_pool():
+    """Process pool for large sweeps and scenario runs (spawned, so forked gunicorn/gevent workers stay safe)."""
+    global _SWEEP_POOL
+    with _SWEEP_POOL_LOCK:
+        if _SWEEP_POOL is None:
+            import multiprocessing
+            from concurrent.futures import ProcessPoolExecutor
+            _SWEEP_POOL = ProcessPoolExecutor(max_workers=SWEEP_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        return _SWEEP_POOL
+
+def evaluate_dispatch_grid(load, pv, rates, cap, limit, soc0, soc_min, modes, soc_steps: int = 40):
+    """Optimized horizon cost for each parameter set (arrays of equal length B; energies in kWh).
+    load/pv/rates are (H,) shared by every set or (B, H) per set (e.g. one row per site). Heuristic modes run every threshold set of the mode through one batched simulate_battery call and keep
+    the cheapest; 'optimal' runs the batched DP in memory-bounded chunks. Returns an array of costs."""
+    load, pv, rates = (np.asarray(v, dtype=np.float64) for v in (load, pv, rates))
+    cap, limit, soc0, soc_min = (np.asarray(v, dtype=np.float64) for v in (cap, limit, soc0, soc_min))
+    modes = np.asarray(modes)
+    cost = np.full(len(cap), np.inf)
+    net = np.maximum(0.0, load - pv)
+    surplus = np.maximum(0.0, pv - load)
+    per_row = max(v.ndim for v in (load, pv, rates)) == 2
+    if per_row:
+        load, pv, rates, net, surplus = (np.broadcast_to(v, (len(cap), v.shape[-1])) for v in (load, pv, rates, net, surplus))
+    rows = (lambda v, idx: v[idx]) if per_row else (lambda v, idx: v)
+    cost_of = (lambda grid, r: np.einsum("bh,bh->b", grid, r)) if per_row else (lambda grid, r: grid @ r)
+    opt = modes == "optimal"
+    if opt.any():
+        idx = np.flatnonzero(opt)
+        K = int(soc_steps) + 1
+        chunk = max(1, int(2_000_000 // (K * K)))
+        for i in range(0, len(idx), chunk):
+            sl = idx[i:i + chunk]
+            n, sp, r = rows(net, sl), rows(surplus, sl), rows(rates, sl)
+            res = dp_dispatch(n, sp, r, cap[sl], limit[sl], soc0[sl], soc_min[sl], soc_steps=soc_steps)
+            cost[sl] = cost_of(res["grid_kw"], r)
+    for mode in set(modes[~opt].tolist()):
+        idx = np.flatnonzero(modes == mode)
+        sets = mode_thresholds(mode)
+        grid_charge = mode not in ("conforto", "confortavel")
+        rep = np.repeat(idx, len(sets))
+        d_th = np.tile([d for d, _ in sets], len(idx))
+        c_th = np.tile([c for _, c in sets], len(idx))
+        r = rows(rates, rep)
+        res = simulate_battery(rows(load, rep), rows(pv, rep), r, 1.0, cap[rep], limit[rep], soc0[rep], soc_min[rep],
+                               d_th, c_th, grid_charge)
+        cost[idx] = cost_of(res["grid_kw"], r).reshape(len(idx), len(sets)).min(axis=1)
+    return cost
+
+def _sweep_chunk(args):
+    return evaluate_dispatch_grid(*args)
+
+def _parse_grid(val, default: list) -> list:
+    """Grid values from a JSON list, 'a,b,c' or 'start:stop:step' (stop inclusive)."""
+    if val is None or val == "":
+        return list(default)
+    if isinstance(val, (list, tuple)):
+        return [float(v) for v in val]
+    val = str(val)
+    if ":" in val:
+        lo, hi, step = (float(v) for v in val.split(":"))
+        return [float(v) for v in np.arange(lo, hi + step / 2, step)] if step > 0 else [lo]
+    return [float(v) for v in val.split(",") if v.strip()]
+
+@app.route("/api/sweep", methods=["GET", "POST"])
+def api_sweep():
+    """Battery sizing sweep. One forecast is computed and every combination of capacity (cap_kwh),
+    power limit (batt_limit), SOC floor (soc_min, %) and mode is dispatched over it in array batches
+    (process pool for large grids). Returns per-combination costs, a capacity x power savings surface and
+    the smallest size reaching `target_pct` % of the best savings."""
+    body = request.get_json(silent=True) or {}
+    def arg(name, default=None):
+        return body.get(name, request.args.get(name, default))
+    site = resolve_site(arg("site"))
+    if site is None:
+        return jsonify({"error": "unknown_site", "detail": arg("site")}), 404
+    try:
+        source = str(arg("source", "db")).lower()
+        algo = normalize_algo(arg("algo"))
+        horizon = int(np.clip(safe_float(arg("horizon"), 24), 1, 168))
+        factor = float(np.clip(safe_float(arg("factor"), 1.0), 0.5, 1.5))
+        pv_factor = float(np.clip(safe_float(arg("pv_factor"), site.pv_factor), 0.5, 2.0))
+        soc_init = float(np.clip(safe_float(arg("soc_init"), site.soc_init_pct), 0.0, 100.0))
+        target_pct = float(np.clip(safe_float(arg("target_pct"), 90.0), 1.0, 100.0))
+        soc_steps = int(np.clip(safe_float(arg("soc_steps"), 40), 4, 200))
+        caps = [c for c in _parse_grid(arg("cap_kwh"), [5, 10, 15, 20]) if c > 0]
+        limits = [max(0.0, v) for v in _parse_grid(arg("batt_limit"), [1, 2, 3, 5])]
+        soc_mins = [float(np.clip(v, 0, 80)) for v in _parse_grid(arg("soc_min"), [0, 20])]
+        modes = arg("mode", "normal,optimal")
+        modes = [m.strip().lower() for m in (modes if isinstance(modes, list) else str(modes).split(",")) if m.strip()]
+        modes = ["optimal" if m in ("otimo", "ótimo", "otimizado") else m for m in modes]
+    except Exception as e:
+        return jsonify({"error": "invalid_parameters", "detail": str(e)}), 400
+    n = len(caps) * len(limits) * len(soc_mins) * len(modes)
+    if n == 0 or n > SWEEP_MAX_POINTS:
+        return jsonify({"error": "invalid_grid", "detail": f"{n} combinações (máximo {SWEEP_MAX_POINTS})"}), 400
+
+    df, snap = dashboard_frame(source, factor, site.id)
+    preds, algo, metrics = forecast_frame(df, snap, algo, horizon)
+    ts_all = pd.DatetimeIndex(pd.to_datetime([p["ts"] for p in preds]))
+    load = np.maximum(0.0, np.array([p["y"] for p in preds], dtype=np.float64))
+    pv = estimate_pv_array(ts_all, forecast_temps(ts_all), pv_factor=pv_factor)
+    rates = TARIFF.price(ts_all)[0]
+    baseline = float(np.maximum(0.0, load - pv) @ rates)
+
+    C, L, S, M = np.meshgrid(np.array(caps), np.array(limits), np.array(soc_mins), np.arange(len(modes)), indexing="ij")
+    cap, limit, smin = C.ravel(), L.ravel(), S.ravel()
+    mode_arr = np.array(modes)[M.ravel()]
+    soc0 = soc_init / 100.0 * cap
+    smin_kwh = smin / 100.0 * cap
+    cost = None
+    if n >= SWEEP_PARALLEL_MIN:
+        try:
+            pool = _sweep_pool()
+            parts = np.array_split(np.arange(n), SWEEP_WORKERS * 2)
+            futures = [pool.submit(_sweep_chunk, (load, pv, rates, cap[i], limit[i], soc0[i], smin_kwh[i], mode_arr[i], soc_steps))
+                       for i in parts if len(i)]
+            cost = np.concatenate([f.result() for f in futures])
+        except Exception:
+            cost = None
+    if cost is None:
+        cost = evaluate_dispatch_grid(load, pv, rates, cap, limit, soc0, smin_kwh, mode_arr, soc_steps)
+    savings = baseline - cost
+    per_day = 24.0 / horizon
+    results = [{
+        "cap_kwh": float(cap[i]), "batt_limit_kw": float(limit[i]), "soc_min_pct": float(smin[i]), "mode": str(mode_arr[i]),
+        "optimized_cost": round(float(cost[i]), 2), "savings": round(float(savings[i]), 2),
+        "savings_per_day": round(float(savings[i]) * per_day, 2),
+    } for i in range(n)]
+    surface = savings.reshape(len(caps), len(limits), len(soc_mins), len(modes)).max(axis=(2, 3))
+    best = float(surface.max())
+    recommended = None
+    # smallest capacity, then smallest power limit, reaching target_pct of the best savings
+    for ci, li in sorted(np.argwhere(surface >= best * target_pct / 100.0 - 1e-9).tolist(), key=lambda t: (caps[t[0]], limits[t[1]])):
+        i = int(np.argmax(np.where((cap == caps[ci]) & (limit == limits[li]), savings, -np.inf)))
+        recommended = results[i]
+        break
+    return jsonify({
+        "source": source,
+        "algo": algo,
+        "metrics": metrics,
+        "horizon": horizon,
+        "baseline_cost": round(baseline, 2),
+        "points": n,
+        "results": results,
+        "surface": {"cap_kwh": caps, "batt_limit_kw": limits, "savings": np.round(surface, 2).tolist()},
+        "best_savings": round(best, 2),
+        "target_pct": target_pct,
+        "recommended": recommended,
+    })
+
+SCENARIO_MAX = int(os.environ.get("SCENARIO_MAX", "50000"))
+SCENARIO_BLOCK = 1000  # scenarios per RNG stream / worker task; results do not depend on the worker count
+SCENARIO_PARALLEL_MIN = int(os.environ.get("SCENARIO_PARALLEL_MIN", "20000"))
+
+def _ar1(rng, n: int, h: int, rho: float = 0.8) -> np.ndarray:
+    """(n, h) standard-normal AR(1) paths (unit variance, lag-1 correlation rho)."""
+    e = rng.standard_normal((n, h))
+    x = np.empty_like(e)
+    x[:, 0] = e[:, 0]
+    k = np.sqrt(1.0 - rho * rho)
+    for t in range(1, h):
+        x[:, t] = rho * x[:, t - 1] + k * e[:, t]
+    return x
+
+def generate_scenarios(load, temp, ts_ns, n: int, seed: int = 42, block: int = 0, pv_factor: float = 1.0,
+                       load_sigma: float = 0.1, temp_sigma: float = 1.5, cloud: float = 0.25):
+    """N correlated scenarios around a base forecast as (n, H) arrays (load_kw, temp_c, pv_kw).
+    Temperature and relative load errors are AR(1) in time; load also follows temperature (+0.05 kW/°C, as the
+    'sim' source) and PV combines an AR(1) cloudiness factor with the temperature derate of estimate_pv_array.
+    Seeded per (seed, block) so each block of scenarios is reproducible wherever it runs."""
+    rng = np.random.default_rng([int(seed), int(block)])
+    load = np.asarray(load, dtype=np.float64)
+    temp = np.asarray(temp, dtype=np.float64)
+    h = len(load)
+    temp_s = temp[None, :] + temp_sigma * _ar1(rng, n, h)
+    load_s = np.maximum(0.0, load[None, :] * (1.0 + load_sigma * _ar1(rng, n, h)) + 0.05 * (temp_s - temp[None, :]))
+    sky = np.clip(1.0 - cloud * np.abs(_ar1(rng, n, h, rho=0.9)), 0.0, 1.0)
+    pv_s = sky * estimate_pv_array(pd.DatetimeIndex(np.asarray(ts_ns).astype("datetime64[ns]")), temp_s, pv_factor=pv_factor)
+    return load_s, temp_s, pv_s
+
+def evaluate_scenarios(load, temp, ts_ns, rates, n: int, seed: int, block: int, policy: dict, battery: dict, noise: dict):
+    """Generate one block of scenarios and cost it: returns (baseline_cost, optimized_cost, load) with (n,)
+    costs and (n, H) float32 loads. policy {"rule": (d_th, c_th, grid_charge)} reacts per scenario through
+    simulate_battery; {"schedule": batt_kw (H,)} applies a fixed plan (discharge beyond the scenario's net
+    load is not credited)."""
+    load_s, _, pv_s = generate_scenarios(load, temp, ts_ns, n, seed, block, **noise)
+    rates = np.asarray(rates, dtype=np.float64)
+    baseline = np.maximum(0.0, load_s - pv_s) @ rates
+    if "schedule" in policy:
+        grid = np.maximum(0.0, load_s - pv_s - np.asarray(policy["schedule"], dtype=np.float64)[None, :])
+    else:
+        d_th, c_th, grid_charge = policy["rule"]
+        grid = simulate_battery(load_s, pv_s, rates, 1.0, battery["cap_kwh"], battery["limit_kw"], battery["soc0_kwh"],
+                                battery["soc_min_kwh"], d_th, c_th, grid_charge)["grid_kw"]
+    return baseline, grid @ rates, load_s.astype(np.float32)
+
+def _scenario_block(args):
+    return evaluate_scenarios(*args)
+
+def run_scenarios(load, temp, ts_ns, rates, n: int, seed: int, policy: dict, battery: dict, noise: dict):
+    """Evaluate n scenarios in SCENARIO_BLOCK-sized blocks, on the process pool when n >= SCENARIO_PARALLEL_MIN."""
+    blocks = [(load, temp, ts_ns, rates, min(SCENARIO_BLOCK, n - i), seed, b, policy, battery, noise)
+              for b, i in enumerate(range(0, n, SCENARIO_BLOCK))]
+    parts = None
+    if n >= SCENARIO_PARALLEL_MIN and len(blocks) > 1:
+        try:
+            parts = list(_sweep_pool().map(_scenario_block, blocks))
+        except Exception:
+            parts = None
+    if parts is None:
+        parts = [evaluate_scenarios(*b) for b in blocks]
+    baseline, cost, loads = (np.concatenate(v) for v in zip(*parts))
+    return baseline, cost, loads
+
+def _quantiles(x: np.ndarray) -> dict:
+    p10, p50, p90 = np.percentile(x, [10, 50, 90])
+    return {"p10": round(float(p10), 2), "p50": round(float(p50), 2), "p90": round(float(p90), 2), "mean": round(float(x.mean()), 2)}
+
+@app.route("/api/scenarios", methods=["GET", "POST"])
+def api_scenarios():
+    """Monte Carlo view of the dashboard plan: `n` correlated load/temperature/PV scenarios around the
+    forecast (fixed `seed`), dispatched and costed in array form. Heuristic modes re-run the chosen
+    thresholds in every scenario; 'optimal' applies the forecast DP schedule. Returns P10/P50/P90 of
+    baseline cost, optimized cost and savings plus load bands per forecast hour."""
+    body = request.get_json(silent=True) or {}
+    def arg(name, default=None):
+        return body.get(name, request.args.get(name, default))
+    site = resolve_site(arg("site"))
+    if site is None:
+        return jsonify({"error": "unknown_site", "detail": arg("site")}), 404
+    try:
+        source = str(arg("source", "db")).lower()
+        algo = normalize_algo(arg("algo"))
+        mode = str(arg("mode", "normal")).lower()
+        mode = "optimal" if mode in ("otimo", "ótimo", "otimizado") else mode
+        horizon = int(np.clip(safe_float(arg("horizon"), 24), 1, 168))
+        factor = float(np.clip(safe_float(arg("factor"), 1.0), 0.5, 1.5))
+        pv_factor = float(np.clip(safe_float(arg("pv_factor"), site.pv_factor), 0.5, 2.0))
+        batt_limit = float(np.clip(safe_float(arg("batt_limit"), site.batt_limit_kw), 0.0, 10.0))
+        soc_init = float(np.clip(safe_float(arg("soc_init"), site.soc_init_pct), 0.0, 100.0))
+        soc_min = float(np.clip(safe_float(arg("soc_min"), site.soc_min_pct), 0.0, 80.0))
+        n = int(np.clip(safe_float(arg("n"), 1000), 1, SCENARIO_MAX))
+        seed = int(safe_float(arg("seed"), 42))
+        noise = {
+            "pv_factor": pv_factor,
+            "load_sigma": float(np.clip(safe_float(arg("load_sigma"), 0.1), 0.0, 1.0)),
+            "temp_sigma": float(np.clip(safe_float(arg("temp_sigma"), 1.5), 0.0, 10.0)),
+            "cloud": float(np.clip(safe_float(arg("cloud"), 0.25), 0.0, 1.0)),
+        }
+    except Exception as e:
+        return jsonify({"error": "invalid_parameters", "detail": str(e)}), 400
+    t0 = time.perf_counter()
+    df, snap = dashboard_frame(source, factor, site.id)
+    preds, algo, metrics = forecast_frame(df, snap, algo, horizon)
+    ts_all = pd.DatetimeIndex(pd.to_datetime([p["ts"] for p in preds]))
+    load = np.maximum(0.0, np.array([p["y"] for p in preds], dtype=np.float64))
+    temp = forecast_temps(ts_all)
+    rates = TARIFF.price(ts_all)[0]
+    cap_kwh = site.cap_kwh
+    if mode == "optimal":
+        plan = optimize_battery_optimal(preds, pv_factor=pv_factor, batt_limit_kw=batt_limit, soc_init_pct=soc_init,
+                                        cap_kwh=cap_kwh, soc_min_pct=soc_min)
+        policy = {"schedule": np.array([step["batt_kw"] for step in plan["plan"]], dtype=np.float64)}
+    else:
+        plan = optimize_battery_adaptive(preds, pv_factor=pv_factor, batt_limit_kw=batt_limit, soc_init_pct=soc_init,
+                                         cap_kwh=cap_kwh, mode=mode, soc_min_pct=soc_min)
+        policy = {"rule": (plan["discharge_threshold"], plan["charge_threshold"], mode not in ("conforto", "confortavel"))}
+    battery = {"cap_kwh": cap_kwh, "limit_kw": batt_limit, "soc0_kwh": soc_init / 100.0 * cap_kwh, "soc_min_kwh": soc_min / 100.0 * cap_kwh}
+    baseline, cost, loads = run_scenarios(load, temp, ts_all.asi8, rates, n, seed, policy, battery, noise)
+    savings = baseline - cost
+    bands = np.percentile(loads, [10, 50, 90], axis=0)
+    return jsonify({
+        "source": source,
+        "algo": algo,
+        "metrics": metrics,
+        "mode": mode,
+        "horizon": horizon,
+        "n": n,
+        "seed": seed,
+        "noise": noise,
+        "policy": {k: (v.round(3).tolist() if isinstance(v, np.ndarray) else v) for k, v in policy.items()},
+        "forecast_plan": {k: plan[k] for k in ("baseline_cost", "optimized_cost", "savings")},
+        "baseline_cost": _quantiles(baseline),
+        "optimized_cost": _quantiles(cost),
+        "savings": _quantiles(savings),
+        "prob_savings_positive": round(float((savings > 0).mean()), 4),
+        "load_bands": {"x": [ts.isoformat() for ts in ts_all], **{k: np.round(v, 3).tolist() for k, v in zip(("p10", "p50", "p90"), bands)}},
+        "elapsed_ms": round((time.perf_counter() - t0) * 1000.0, 1),
     })
 
+def _range_param(name: str):
+    val = request.args.get(name)
+    if not val:
+        return None
+    try:
+        ts = pd.Timestamp(val)
+        return ts.tz_convert(None) if ts.tzinfo is not None else ts
+    except Exception:
+        return None
+
+EXPORT_CHUNK = int(os.environ.get("EXPORT_CHUNK", "50000"))
+
+class _ChunkSink:
+    """Write-only file object for pyarrow writers; drain() hands back what was written since the last call."""
+    closed = False
+
+    def __init__(self):
+        self._parts, self._pos = [], 0
+
+    def writable(self):
+        return True
+
+    def write(self, data) -> int:
+        self._parts.append(bytes(data))
+        self._pos += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._pos
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+    def drain(self) -> bytes:
+        out, self._parts = b"".join(self._parts), []
+        return out
+
+def export_chunks(chunks, fmt: str = "csv"):
+    """Encode DataFrame chunks incrementally: csv (header once), parquet (one row group per chunk) or
+    arrow (IPC stream, one record batch per chunk). Yields bytes."""
+    if fmt == "csv":
+        header = True
+        for df in chunks:
+            yield df.to_csv(index=False, header=header).encode("utf-8")
+            header = False
+        return
+    import pyarrow as pa
+    sink, writer = _ChunkSink(), None
+    for df in chunks:
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        if writer is None:
+            if fmt == "parquet":
+                import pyarrow.parquet as pq
+                writer = pq.ParquetWriter(sink, table.schema, compression="snappy")
+            else:
+                writer = pa.ipc.new_stream(sink, table.schema)
+        writer.write_table(table)
+        yield sink.drain()
+    if writer is not None:
+        writer.close()
+        yield sink.drain()
+
+def _gzip_stream(parts):
+    import zlib
+    z = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits 31: gzip container
+    for part in parts:
+        out = z.compress(part)
+        if out:
+            yield out
+    yield z.flush()
+
 @app.route("/api/export")
 def api_export():
+    """Stream a source (db/consumption, ticks/live_ticks, csv) as CSV, Parquet or Arrow IPC.
+    Window: `start`/`end` (ISO) or `range` (e.g. 7d, 12h) back from the newest row. Rows are read with a
+    cursor in EXPORT_CHUNK batches and encoded as they go; `gzip=1` compresses the stream on the fly."""
+    site = resolve_site(request.args.get("site"))
+    if site is None:
+        return jsonify({"error": "unknown_site", "detail": request.args.get("site")}), 404
     source = request.args.get("source", "db").lower()
+    source = {"consumption": "db", "live_ticks": "ticks"}.get(source, source)
+    fmt = (request.args.get("format") or "csv").lower()
+    if fmt not in ("csv", "parquet", "arrow"):
+        return jsonify({"error": "invalid_format", "detail": "format: csv | parquet | arrow"}), 400
+    if fmt != "csv" and not _arrow_available():
+        return jsonify({"error": "format_unavailable", "detail": f"{fmt} requer pyarrow"}), 400
     rng = (request.args.get("range") or "7d").lower()
-    df = load_source(source)
-    df = df.sort_values("timestamp")
-    end = pd.to_datetime(df["timestamp"].iloc[-1])
-    if rng.endswith("d"):
-        days = int(rng[:-1]) if rng[:-1].isdigit() else 7
-        start = end - pd.Timedelta(days=days)
-    elif rng.endswith("h"):
-        hours = int(rng[:-1]) if rng[:-1].isdigit() else 24
-        start = end - pd.Timedelta(hours=hours)
+    start, end = _range_param("start"), _range_param("end")
+    if start is None and end is None:
+        end_ts = latest_source_timestamp(source, site.id)
+        if rng.endswith("d"):
+            days = int(rng[:-1]) if rng[:-1].isdigit() else 7
+            start = end_ts - pd.Timedelta(days=days)
+        elif rng.endswith("h"):
+            hours = int(rng[:-1]) if rng[:-1].isdigit() else 24
+            start = end_ts - pd.Timedelta(hours=hours)
+        else:
+            start = end_ts - pd.Timedelta(days=7)
+        label = rng
+    else:
+        label = "_".join(ts.strftime("%Y%m%d%H%M") if ts is not None else "all" for ts in (start, end))
+    ext = {"csv": "csv", "parquet": "parquet", "arrow": "arrows"}[fmt]
+    mimetype = {"csv": "text/csv", "parquet": "application/vnd.apache.parquet", "arrow": ARROW_MIME}[fmt]
+    body = export_chunks(iter_range(source, start, end, chunk=EXPORT_CHUNK, site=site.id), fmt)
+    if request.args.get("gzip") in ("1", "true", "yes"):
+        body, ext, mimetype = _gzip_stream(body), ext + ".gz", "application/gzip"
+    return Response(stream_with_context(body), mimetype=mimetype,
+                    headers={"Content-Disposition": f"attachment; filename=export_{'' if site.id == SiteRegistry.DEFAULT else site.id + '_'}{label}.{ext}"})
+
+INGEST_MAX_BYTES = int(os.environ.get("INGEST_MAX_BYTES", str(64 * 2**20)))
+INGEST_CHUNK = int(os.environ.get("INGEST_CHUNK", "50000"))
+INGEST_MAX_KW = float(os.environ.get("INGEST_MAX_KW", "10000"))
+NDJSON_MIMES = ("application/x-ndjson", "application/ndjson", "application/jsonl", "application/x-jsonlines")
+_NAT = np.iinfo(np.int64).min
+
+def _ingest_timestamps(values) -> np.ndarray:
+    """ISO strings (offsets converted to UTC, like _parse_timestamps) or epoch milliseconds -> int64
+    epoch-ns; NaT for anything else."""
+    arr = values if isinstance(values, np.ndarray) else np.asarray(values, dtype=object)
+    out = np.full(len(arr), _NAT, dtype=np.int64)
+    if arr.dtype.kind in "iuf":
+        retry = np.ones(len(arr), dtype=bool)
     else:
-        start = end - pd.Timedelta(days=7)
-    out = df[pd.to_datetime(df["timestamp"]) >= start]
-    csv = out.to_csv(index=False)
-    return Response(csv, mimetype="text/csv", headers={"Content-Disposition": f"attachment; filename=export_{rng}.csv"})
+        is_str = np.fromiter((isinstance(v, str) for v in arr), dtype=bool, count=len(arr))
+        if is_str.any():
+            out[is_str] = _parse_timestamps(arr[is_str])
+        retry = out == _NAT  # numbers, and strings that are not ISO (epoch-ms text from CSV)
+    if retry.any():
+        ms = pd.to_numeric(pd.Series(arr[retry], dtype=object), errors="coerce").to_numpy(dtype=np.float64)
+        ok = np.isfinite(ms)
+        part = out[retry]
+        part[ok] = (ms[ok] * 1e6).astype(np.int64)
+        out[retry] = part
+    return out
+
+def _numeric(values) -> np.ndarray:
+    if isinstance(values, np.ndarray) and values.dtype.kind in "iuf":
+        return values.astype(np.float64)
+    return pd.to_numeric(pd.Series(values, dtype=object), errors="coerce").to_numpy(dtype=np.float64)
+
+def parse_ingest(body: bytes, mimetype: str):
+    """(ts int64 epoch-ns, consumption_kW, temperature_C) arrays from an ingest body. Accepts NDJSON (one
+    {"timestamp", "consumption_kW", "temperature_C"} object per line), a JSON array of such objects, CSV
+    with those columns, or the columnar binary format (COLUMNS_MIME) with a flat payload of those keys.
+    Timestamps are ISO strings or epoch milliseconds; temperature_C is optional. Raises ValueError for a
+    malformed body and LookupError for an unsupported mimetype."""
+    if mimetype == COLUMNS_MIME:
+        cols = decode_columns(body)
+        if not isinstance(cols, dict):
+            raise ValueError("columns payload must be an object")
+    elif mimetype in ("text/csv", "application/csv"):
+        import io
+        df = pd.read_csv(io.BytesIO(body))
+        cols = {c: df[c].to_numpy() for c in df.columns}
+    elif mimetype in NDJSON_MIMES or mimetype == "application/json":
+        loads = orjson.loads if orjson is not None else json.loads
+        if mimetype == "application/json":
+            items = loads(body)
+            items = items.get("points", []) if isinstance(items, dict) else items
+        else:
+            items = [loads(line) for line in body.splitlines() if line.strip()]
+        if not isinstance(items, list) or not all(isinstance(it, dict) for it in items):
+            raise ValueError("expected JSON objects with timestamp and consumption_kW")
+        cols = {k: [it.get(k) for it in items] for k in ("timestamp", "consumption_kW", "temperature_C")}
+        if all(t is None for t in cols["temperature_C"]):
+            del cols["temperature_C"]
+    else:
+        raise LookupError(mimetype)
+    if cols.get("timestamp") is None or cols.get("consumption_kW") is None:
+        raise ValueError("timestamp and consumption_kW are required")
+    ts = _ingest_timestamps(cols["timestamp"])
+    load = _numeric(cols["consumption_kW"])
+    temp = _numeric(cols["temperature_C"]) if cols.get("temperature_C") is not None else np.full(len(ts), np.nan)
+    if not (len(ts) == len(load) == len(temp)):
+        raise ValueError("columns differ in length")
+    return ts, load, temp
+
+def validate_ingest(ts: np.ndarray, load: np.ndarray, temp: np.ndarray):
+    """Drop invalid rows (no timestamp, load outside [0, INGEST_MAX_KW], temperature outside [-60, 70] °C;
+    a missing temperature becomes 24 °C as elsewhere) and duplicate timestamps (the last one wins).
+    Returns sorted (ts, load, temp) and the counts of both."""
+    temp = np.where(np.isnan(temp), 24.0, temp)
+    ok = (ts != _NAT) & np.isfinite(load) & (load >= 0) & (load <= INGEST_MAX_KW) & np.isfinite(temp) & (temp >= -60) & (temp <= 70)
+    ts, load, temp = ts[ok], load[ok], temp[ok]
+    _, last = np.unique(ts[::-1], return_index=True)  # sorted unique timestamps, index of their last row
+    keep = len(ts) - 1 - last
+    return ts[keep], load[keep], temp[keep], {"invalid": int((~ok).sum()), "duplicates": int(len(ts) - len(keep))}
+
+def _format_timestamps(ts_ns: np.ndarray, iso_t: bool) -> np.ndarray:
+    s = np.datetime_as_string(ts_ns.view("datetime64[ns]"), unit="s" if not (ts_ns % 1_000_000_000).any() else "us")
+    return s if iso_t else np.char.replace(s, "T", " ")
+
+def ingest_rows(site: Site, source: str, ts: np.ndarray, load: np.ndarray, temp: np.ndarray) -> dict:
+    """Insert validated rows into the site's table for `source` ('db' -> consumption, 'ticks' ->
+    live_ticks), skipping timestamps it already holds. One transaction per call, written with executemany
+    in INGEST_CHUNK row batches; timestamps use the table's text format so range scans stay ordered."""
+    table = TimeSeriesStore.TABLES[source]
+    conn = sqlite3.connect(site.db_path, timeout=30)
+    try:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        if table == "live_ticks":
+            conn.execute("CREATE TABLE IF NOT EXISTS live_ticks (timestamp TEXT PRIMARY KEY, consumption_kW REAL, temperature_C REAL)")
+            iso_t = True  # LiveTickWriter's isoformat()
+        else:
+            conn.execute('CREATE TABLE IF NOT EXISTS consumption ("timestamp" TIMESTAMP, "consumption_kW" REAL, "temperature_C" REAL)')
+            row = conn.execute("SELECT timestamp FROM consumption LIMIT 1").fetchone()
+            iso_t = bool(row and isinstance(row[0], str) and len(row[0]) > 10 and row[0][10] == "T")
+        _ensure_timestamp_index(conn, table, site.db_path)
+        existing = 0
+        if len(ts):
+            lo, hi = _format_timestamps(ts[[0, -1]], iso_t)
+            stored = conn.execute(f"SELECT timestamp FROM {table} WHERE timestamp >= ? AND timestamp <= ?", (str(lo), str(hi))).fetchall()
+            if stored:
+                fresh = ~np.isin(ts, _parse_timestamps([r[0] for r in stored]))
+                existing = int(len(ts) - fresh.sum())
+                ts, load, temp = ts[fresh], load[fresh], temp[fresh]
+        verb = "INSERT OR IGNORE" if table == "live_ticks" else "INSERT"
+        for i in range(0, len(ts), INGEST_CHUNK):
+            sl = slice(i, i + INGEST_CHUNK)
+            conn.executemany(f"{verb} INTO {table} (timestamp, consumption_kW, temperature_C) VALUES (?, ?, ?)",
+                             zip(_format_timestamps(ts[sl], iso_t).tolist(), load[sl].tolist(), temp[sl].tolist()))
+        conn.commit()
+        _TS_FORMATS[(site.db_path, table)] = iso_t
+    finally:
+        conn.close()
+    return {"existing": existing, "inserted": int(len(ts)), "ts": ts, "load": load, "temp": temp}
+
+def notify_ingest(site: Site, source: str, ts: np.ndarray, load: np.ndarray, temp: np.ndarray):
+    """Bring in-process consumers up to date with rows just ingested: drop the site's cached responses,
+    score pending forecasts against the new actuals and feed the site's running streams. The store picks
+    the rows up on its next read (PRAGMA data_version), and its new version retires registry models."""
+    for cache in (DASHBOARD_CACHE, SERIES_CACHE):
+        cache.invalidate(lambda key: key[0] == site.id)
+    RESIDUALS.observe(ts, load, site.id)
+    STREAM_HUB.notify(site.id, ts, load, temp)
+
+@app.route("/api/ingest", methods=["POST"])
+def api_ingest():
+    """Bulk meter data for a site (`site`) into `source=ticks` (live_ticks, default) or `db` (consumption).
+    Body: NDJSON, JSON array, CSV or columnar binary (see parse_ingest), optionally `Content-Encoding: gzip`.
+    Rows are validated and deduplicated in numpy, rows already stored are skipped, and the rest is written
+    in one transaction. When INGEST_TOKEN is set, requests need `Authorization: Bearer <token>`."""
+    import hmac
+    token = os.environ.get("INGEST_TOKEN")
+    if token and not hmac.compare_digest(request.headers.get("Authorization", ""), f"Bearer {token}"):
+        return jsonify({"error": "unauthorized"}), 401
+    site = resolve_site(request.args.get("site"))
+    if site is None:
+        return jsonify({"error": "unknown_site", "detail": request.args.get("site")}), 404
+    source = request.args.get("source", "ticks").lower()
+    source = {"consumption": "db", "live_ticks": "ticks"}.get(source, source)
+    if source not in TimeSeriesStore.TABLES:
+        return jsonify({"error": "invalid_source", "detail": "source: ticks | db"}), 400
+    if (request.content_length or 0) > INGEST_MAX_BYTES:
+        return jsonify({"error": "payload_too_large", "detail": f"max {INGEST_MAX_BYTES} bytes"}), 413
+    body = request.get_data(cache=False)
+    if request.headers.get("Content-Encoding", "").lower() == "gzip":
+        import zlib
+        inflate = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        try:
+            body = inflate.decompress(body, INGEST_MAX_BYTES)
+        except zlib.error as e:
+            return jsonify({"error": "bad_payload", "detail": str(e)}), 400
+        if inflate.unconsumed_tail:
+            return jsonify({"error": "payload_too_large", "detail": f"max {INGEST_MAX_BYTES} bytes decompressed"}), 413
+    with stage("parse"):
+        try:
+            ts, load, temp = parse_ingest(body, request.mimetype)
+        except LookupError:
+            return jsonify({"error": "unsupported_media_type",
+                            "detail": f"use {NDJSON_MIMES[0]}, application/json, text/csv or {COLUMNS_MIME}"}), 415
+        except Exception as e:
+            return jsonify({"error": "bad_payload", "detail": str(e)}), 400
+    with stage("validate"):
+        received = len(ts)
+        ts, load, temp, counts = validate_ingest(ts, load, temp)
+    with stage("write"):
+        written = ingest_rows(site, source, ts, load, temp)
+    if written["inserted"]:
+        with stage("notify"):
+            notify_ingest(site, source, written["ts"], written["load"], written["temp"])
+    return jsonify({
+        "site": site.id,
+        "source": source,
+        "received": received,
+        **counts,
+        "existing": written["existing"],
+        "inserted": written["inserted"],
+        "first": pd.Timestamp(int(written["ts"][0])).isoformat() if written["inserted"] else None,
+        "last": pd.Timestamp(int(written["ts"][-1])).isoformat() if written["inserted"] else None,
+    })
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, points: int) -> np.ndarray:
+    """Largest-Triangle-Three-Buckets: indices of `points` samples (first and last always kept) that
+    preserve the visual shape of (x, y). One pass over the buckets, numpy within each bucket."""
+    n = len(y)
+    if points >= n or points < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=np.float64)
+    x = x - x[0]
+    y = np.asarray(y, dtype=np.float64)
+    edges = (np.arange(points - 1) * ((n - 2) / (points - 2))).astype(np.intp) + 1
+    edges[-1] = n - 1
+    out = np.empty(points, dtype=np.intp)
+    out[0], out[-1] = 0, n - 1
+    a = 0
+    for i in range(points - 2):
+        lo, hi = edges[i], edges[i + 1]
+        nlo, nhi = hi, (edges[i + 2] if i + 2 < len(edges) else n)
+        xc, yc = x[nlo:nhi].mean(), y[nlo:nhi].mean()
+        xa, ya = x[a], y[a]
+        area = np.abs((xa - xc) * (y[lo:hi] - ya) - (xa - x[lo:hi]) * (yc - ya))
+        a = lo + int(np.argmax(area))
+        out[i + 1] = a
+    return out
+
+def minmax_indices(y: np.ndarray, points: int) -> np.ndarray:
+    """Min and max sample of each of ~points/2 equal-count buckets, in time order."""
+    n = len(y)
+    if points >= n or points < 2:
+        return np.arange(n)
+    size = -(-n // (points // 2))
+    nb = -(-n // size)
+    base = np.arange(nb) * size
+    padded = np.full(nb * size, np.inf)
+    padded[:n] = y
+    lo = padded.reshape(nb, size).argmin(axis=1)
+    padded[n:] = -np.inf
+    hi = padded.reshape(nb, size).argmax(axis=1)
+    return np.unique(np.concatenate([base + lo, base + hi]))
+
+def downsample_indices(ts_ns: np.ndarray, y: np.ndarray, points: Optional[int], method: str = "lttb") -> np.ndarray:
+    if not points or points >= len(y):
+        return np.arange(len(y))
+    if method == "minmax":
+        return minmax_indices(y, points)
+    return lttb_indices(ts_ns, y, points)
+
+def series_xy(ts_ns: np.ndarray, y: np.ndarray, points: Optional[int] = None, method: str = "lttb", decimals: int = 3):
+    """(TsArray x, rounded y ndarray) for a chart trace, decimated to at most `points` samples (NaNs dropped)."""
+    ok = ~np.isnan(y)
+    ts_ns, y = ts_ns[ok], y[ok]
+    idx = downsample_indices(ts_ns, y, points, method)
+    return TsArray(ts_ns[idx]), np.round(y[idx], decimals)
+
+DASHBOARD_TRACE_POINTS = int(os.environ.get("DASHBOARD_TRACE_POINTS", "1000"))
+SERIES_CACHE = ResponseCache(max_entries=int(os.environ.get("SERIES_CACHE_SIZE", "256")), ttl=300.0)
 
 @app.route("/api/series")
 def api_series():
+    """Series for charts; optional `start`/`end` (ISO timestamps) restrict the window in the query and
+    `points` decimates it (`method` lttb (default) or minmax). Responses are cached per
+    (site, window, points, method) and the latest timestamp of the source, with ETag/304."""
+    site = resolve_site(request.args.get("site"))
+    if site is None:
+        return jsonify({"error": "unknown_site", "detail": request.args.get("site")}), 404
     name = (request.args.get("name") or "consumption").lower()
     source = request.args.get("source", "db")
-    df = load_source(source)
-    df = df.sort_values("timestamp")
+    start, end = _range_param("start"), _range_param("end")
+    points = int(np.clip(safe_float(request.args.get("points"), 0), 0, 100_000)) or None
+    method = "minmax" if (request.args.get("method") or "").lower() == "minmax" else "lttb"
+    try:
+        latest = latest_source_timestamp(source, site.id)
+    except Exception:
+        latest = None
+    key = (site.id, name, source.lower(), latest, start, end, points, method)
+    return cached_response(SERIES_CACHE, key, lambda: series_payload(name, source, start, end, points, method, site.id),
+                           allowed=("json", "columns", "arrow"))
+
+def series_payload(name: str, source: str, start=None, end=None, points: Optional[int] = None, method: str = "lttb",
+                   site: Optional[str] = None) -> dict:
     if name == "temperature":
-        return jsonify({
-            "x": df["timestamp"].astype(str).tolist(),
-            "y": df["temperature_C"].round(2).tolist(),
-            "unit": "°C",
-        })
+        df = load_range(source, start, end, columns=["temperature_C"], site=site)
+        x, y = series_xy(pd.DatetimeIndex(df["timestamp"]).asi8, df["temperature_C"].to_numpy(dtype=np.float64), points, method, 2)
+        return {"x": x, "y": y, "unit": "°C", "total": len(df)}
+    df = load_range(source, start, end, columns=["consumption_kW"], site=site)
     if name == "daily":
         daily = df.copy()
         daily["date"] = pd.to_datetime(daily["timestamp"]).dt.date
         agg = daily.groupby("date")["consumption_kW"].agg(["mean","max"]).reset_index()
-        return jsonify({
-            "x": agg["date"].astype(str).tolist(),
-            "y_mean": agg["mean"].round(3).tolist(),
-            "y_max": agg["max"].round(3).tolist(),
+        return {
+            "x": TsArray(pd.DatetimeIndex(pd.to_datetime(agg["date"])).asi8, "date"),
+            "y_mean": agg["mean"].round(3).to_numpy(),
+            "y_max": agg["max"].round(3).to_numpy(),
             "unit": "kW",
-        })
+        }
     # default: consumption
+    x, y = series_xy(pd.DatetimeIndex(df["timestamp"]).asi8, df["consumption_kW"].to_numpy(dtype=np.float64), points, method, 3)
+    return {"x": x, "y": y, "unit": "kW", "total": len(df)}
+
+REPLAY_CHUNK = int(os.environ.get("REPLAY_CHUNK", "100000"))
+
+def replay_battery(ts_ns: np.ndarray, load: np.ndarray, temp: np.ndarray, *, cap_kwh: float = 10.0, limit_kw: float = 2.0,
+                   soc0_kwh: float = 5.0, soc_min_kwh: float = 0.0, pv_factor: float = 1.0, mode: str = "self",
+                   chunk: int = REPLAY_CHUNK) -> dict:
+    """Run simulate_battery over a whole stored history in fixed-size chunks, carrying SOC across chunks.
+    Memory is bounded by `chunk`; only running totals and per-day bincount aggregates are kept.
+    mode 'self' is the self-consumption rule of compute_equipment_state; other modes use the first
+    threshold set of mode_thresholds (grid charging except in conforto)."""
+    n = len(ts_ns)
+    if mode == "self":
+        d_th, c_th, grid_charge = -np.inf, -np.inf, False
+    else:
+        (d_th, c_th), grid_charge = mode_thresholds(mode)[0], mode not in ("conforto", "confortavel")
+    day0 = int(ts_ns[0] // 86_400_000_000_000) if n else 0
+    ndays = int(ts_ns[-1] // 86_400_000_000_000) - day0 + 1 if n else 0
+    keys = ("load_kwh", "pv_kwh", "grid_base_kwh", "grid_kwh", "cost_base", "cost")
+    daily = {k: np.zeros(ndays) for k in keys}
+    daily_soc = np.zeros(ndays)
+    tot = dict.fromkeys(keys + ("charge_kwh", "discharge_kwh", "soc_sum"), 0.0)
+    by_period = np.zeros(len(TariffSchedule.PERIODS))
+    soc, soc_lo = float(soc0_kwh), float(soc0_kwh)
+    dt_default = float(np.clip(np.median(np.diff(ts_ns[:1000])) / 3.6e12, 1e-6, 1.0)) if n > 1 else 1.0
+    for lo in range(0, n, max(1, int(chunk))):
+        hi = min(n, lo + int(chunk))
+        ns = ts_ns[lo:hi]
+        # step i spans until the next sample; the last one reuses the typical step. Gaps cap at 1h.
+        dt = np.diff(ts_ns[lo:hi + 1]) / 3.6e12
+        dt = np.clip(dt if hi < n else np.append(dt, dt_default), 1e-6, 1.0)
+        pv = estimate_pv_array(pd.DatetimeIndex(ns.astype("datetime64[ns]")), temp[lo:hi], pv_factor=pv_factor)
+        ld = np.maximum(0.0, load[lo:hi])
+        rates, period = TARIFF.price(ns)
+        res = simulate_battery(ld, pv, rates, dt, cap_kwh, limit_kw, soc, soc_min_kwh, d_th, c_th, grid_charge)
+        batt, grid, socs = res["batt_kw"][0], res["grid_kw"][0], res["soc_kwh"][0]
+        soc = float(socs[-1])
+        soc_lo = min(soc_lo, float(socs.min()))
+        base = np.maximum(0.0, ld - pv)
+        day = (ns // 86_400_000_000_000 - day0).astype(np.intp)
+        for k, v in (("load_kwh", ld * dt), ("pv_kwh", pv * dt), ("grid_base_kwh", base * dt), ("grid_kwh", grid * dt),
+                     ("cost_base", base * dt * rates), ("cost", grid * dt * rates)):
+            daily[k] += np.bincount(day, weights=v, minlength=ndays)
+            tot[k] += float(v.sum())
+        by_period += np.bincount(period, weights=grid * dt * rates, minlength=len(by_period))
+        tot["charge_kwh"] += float(-np.minimum(batt, 0.0) @ dt)
+        tot["discharge_kwh"] += float(np.maximum(batt, 0.0) @ dt)
+        tot["soc_sum"] += float(socs.sum())
+        # SOC at the last sample of each day present in this chunk
+        last = np.flatnonzero(np.diff(day, append=-1))
+        daily_soc[day[last]] = socs[last]
+    seen = daily["load_kwh"] > 0
+    pct = 100.0 / cap_kwh if cap_kwh > 0 else 0.0
+    return {
+        "rows": n,
+        "start": pd.Timestamp(int(ts_ns[0])).isoformat() if n else None,
+        "end": pd.Timestamp(int(ts_ns[-1])).isoformat() if n else None,
+        "totals": {
+            **{k: round(tot[k], 3) for k in keys},
+            "savings": round(tot["cost_base"] - tot["cost"], 3),
+            "charge_kwh": round(tot["charge_kwh"], 3),
+            "discharge_kwh": round(tot["discharge_kwh"], 3),
+        },
+        "cost_by_period": {p: round(float(v), 3) for p, v in zip(TariffSchedule.PERIODS, by_period)},
+        "soc": {
+            "final_pct": round(soc * pct, 1),
+            "min_pct": round(soc_lo * pct, 1),
+            "mean_pct": round(tot["soc_sum"] / n * pct, 1) if n else None,
+        },
+        "daily": {
+            "date": [str(pd.Timestamp((day0 + i) * 86_400_000_000_000).date()) for i in np.flatnonzero(seen)],
+            **{k: np.round(v[seen], 3).tolist() for k, v in daily.items()},
+            "soc_end_pct": np.round(daily_soc[seen] * pct, 1).tolist(),
+        },
+    }
+
+@app.route("/api/replay")
+def api_replay():
+    """Replay the battery rule over the stored history of a source (optionally `start`/`end`)
+    and return realized grid import, cost and SOC totals plus daily aggregates. Battery/PV parameters
+    default to the `site` configuration."""
+    site = resolve_site(request.args.get("site"))
+    if site is None:
+        return jsonify({"error": "unknown_site", "detail": request.args.get("site")}), 404
+    source = (request.args.get("source") or "db").lower()
+    start, end = _range_param("start"), _range_param("end")
+    mode = (request.args.get("mode") or "self").lower()
+    cap_kwh = float(np.clip(safe_float(request.args.get("cap_kwh"), site.cap_kwh), 0.1, 1000.0))
+    limit = float(np.clip(safe_float(request.args.get("batt_limit"), site.batt_limit_kw), 0.0, 1000.0))
+    soc_init = float(np.clip(safe_float(request.args.get("soc_init"), site.soc_init_pct), 0.0, 100.0))
+    soc_min = float(np.clip(safe_float(request.args.get("soc_min"), site.soc_min_pct), 0.0, 80.0))
+    pv_factor = float(np.clip(safe_float(request.args.get("pv_factor"), site.pv_factor), 0.5, 2.0))
+    snap = source_snapshot(source, site.id)
+    if snap is None:
+        return jsonify({"error": "no_data", "detail": f"fonte '{source}' sem histórico"}), 404
+    lo = int(np.searchsorted(snap.ts, _to_epoch_ns(start)[0], "left")) if start is not None else 0
+    hi = int(np.searchsorted(snap.ts, _to_epoch_ns(end)[0], "right")) if end is not None else len(snap.ts)
+    t0 = time.perf_counter()
+    out = replay_battery(
+        snap.ts[lo:hi], snap.consumption_kW[lo:hi], snap.temperature_C[lo:hi],
+        cap_kwh=cap_kwh, limit_kw=limit, soc0_kwh=soc_init / 100.0 * cap_kwh, soc_min_kwh=soc_min / 100.0 * cap_kwh,
+        pv_factor=pv_factor, mode=mode,
+    )
     return jsonify({
-        "x": df["timestamp"].astype(str).tolist(),
-        "y": df["consumption_kW"].round(3).tolist(),
-        "unit": "kW",
+        "source": snap.source,
+        "site": site.id,
+        "mode": mode,
+        "params": {"cap_kwh": cap_kwh, "batt_limit_kw": limit, "soc_init_pct": soc_init, "soc_min_pct": soc_min, "pv_factor": pv_factor},
+        "elapsed_ms": round((time.perf_counter() - t0) * 1000.0, 1),
+        **out,
     })
 
+@app.route("/api/sites")
+def api_sites():
+    """Configured sites and their battery/PV defaults."""
+    return jsonify({"default": SiteRegistry.DEFAULT, "sites": [SITES.get(s).to_dict() for s in SITES.ids()]})
+
+FLEET_SOC_STEPS = int(os.environ.get("FLEET_SOC_STEPS", "40"))
+
+@app.route("/api/fleet")
+def api_fleet():
+    """Forecast and battery dispatch for many sites in one pass (`sites`: comma list, default all).
+    Histories and models are per site; the recursive forecast runs once for all sites
+    (forecast_recursive_batch) and the dispatch is one evaluate_dispatch_grid call with a row per site,
+    each with its own capacity, power limit, PV factor and SOC settings."""
+    ids = [s.strip() for s in (request.args.get("sites") or "").split(",") if s.strip()] or SITES.ids()
+    unknown = [s for s in ids if s not in SITES]
+    if unknown:
+        return jsonify({"error": "unknown_site", "detail": ",".join(unknown)}), 404
+    source = (request.args.get("source") or "db").lower()
+    algo = normalize_algo(request.args.get("algo"))
+    horizon = int(np.clip(safe_float(request.args.get("horizon"), 24), 1, 168))
+    mode = (request.args.get("mode") or "normal").lower()
+    mode = "optimal" if mode in ("otimo", "ótimo", "otimizado") else mode
+    t0 = time.perf_counter()
+    sites = [SITES.get(s) for s in ids]
+    models, rows, algos, snaps, features = [], [], [], [], None
+    for cfg in sites:
+        df, snap = dashboard_frame(source, 1.0, cfg.id)
+        model, site_algo, _, features, df_feat = forecast_model(df, snap, algo)
+        models.append(model)
+        rows.append(df_feat.tail(1).iloc[0])
+        algos.append(site_algo)
+        snaps.append(snap)
+    targets, yhat = forecast_recursive_batch(models, features, rows, horizon=horizon, temps_fn=forecast_temps)
+    for snap, site_algo, t, y in zip(snaps, algos, targets, yhat):
+        if snap is not None:
+            RESIDUALS.record((snap.label, site_algo), t.view(np.int64), y)
+    S, H = yhat.shape
+    t_idx = pd.DatetimeIndex(targets.ravel())
+    load = np.maximum(0.0, yhat)
+    pv_factor = np.array([cfg.pv_factor for cfg in sites])
+    pv = estimate_pv_array(t_idx, forecast_temps(t_idx)).reshape(S, H) * pv_factor[:, None]
+    rates = TARIFF.price(t_idx)[0].reshape(S, H)
+    cap = np.array([cfg.cap_kwh for cfg in sites])
+    limit = np.array([cfg.batt_limit_kw for cfg in sites])
+    soc0 = np.array([cfg.soc_init_pct for cfg in sites]) / 100.0 * cap
+    soc_min = np.array([cfg.soc_min_pct for cfg in sites]) / 100.0 * cap
+    baseline = np.einsum("sh,sh->s", np.maximum(0.0, load - pv), rates)
+    cost = evaluate_dispatch_grid(load, pv, rates, cap, limit, soc0, soc_min, np.full(S, mode), FLEET_SOC_STEPS)
+    per_day = 24.0 / horizon
+    results = [{
+        "site": cfg.id,
+        "name": cfg.name,
+        "algo": algos[i],
+        "forecast_kwh": round(float(load[i].sum()), 3),
+        "peak_kw": round(float(load[i].max()), 3),
+        "baseline_cost": round(float(baseline[i]), 2),
+        "optimized_cost": round(float(cost[i]), 2),
+        "savings": round(float(baseline[i] - cost[i]), 2),
+        "savings_per_day": round(float(baseline[i] - cost[i]) * per_day, 2),
+    } for i, cfg in enumerate(sites)]
+    return jsonify({
+        "source": source,
+        "mode": mode,
+        "horizon": horizon,
+        "sites": results,
+        "totals": {
+            "forecast_kwh": round(float(load.sum()), 3),
+            "baseline_cost": round(float(baseline.sum()), 2),
+            "optimized_cost": round(float(cost.sum()), 2),
+            "savings": round(float((baseline - cost).sum()), 2),
+        },
+        "elapsed_ms": round((time.perf_counter() - t0) * 1000.0, 1),
+    })
+
+def _rss_mb() -> Optional[float]:
+    """Resident set size of this process (Linux /proc; peak RSS from getrusage elsewhere)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return round(int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20, 1)
+    except Exception:
+        try:
+            import resource, sys
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            return round(peak / (2**20 if sys.platform == "darwin" else 2**10), 1)
+        except Exception:
+            return None
+
+class WarmUp:
+    """Loads what the first dashboard request would otherwise pay for (pretrained model, scikit-learn for
+    the linear fits, the default site's data) on a background thread after import, so cold starts serve
+    `/` immediately. Progress per stage is reported by /api/ready."""
+
+    def __init__(self):
+        self.stages = [
+            ("model", lambda: BASE_MODEL.model),
+            ("sklearn", lambda: __import__("sklearn.linear_model")),
+            ("data", lambda: source_snapshot("db")),
+        ]
+        self.status = {name: {"state": "pending"} for name, _ in self.stages}
+        self.import_ms = None
+        self.started = time.time()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="warmup", daemon=True)
+                self._thread.start()
+
+    def skip(self):
+        """Warm-up disabled: everything loads lazily on first use, so the process is ready right away."""
+        for name, _ in self.stages:
+            self.status[name] = {"state": "skipped"}
+
+    def _run(self):
+        for name, fn in self.stages:
+            self.status[name] = {"state": "running"}
+            t0 = time.perf_counter()
+            try:
+                fn()
+                self.status[name] = {"state": "done", "ms": round((time.perf_counter() - t0) * 1000.0, 1)}
+            except Exception as e:
+                self.status[name] = {"state": "failed", "ms": round((time.perf_counter() - t0) * 1000.0, 1), "error": str(e)}
+
+    def report(self) -> dict:
+        states = [st["state"] for st in self.status.values()]
+        return {
+            "ready": all(s in ("done", "failed", "skipped") for s in states),
+            "ok": all(s == "done" for s in states),
+            "stages": dict(self.status),
+            "import_ms": self.import_ms,
+            "model_loaded": BASE_MODEL.loaded,
+            "model_load_ms": BASE_MODEL.load_ms,
+            "uptime_s": round(time.time() - self.started, 1),
+            "rss_mb": _rss_mb(),
+        }
+
+WARMUP = WarmUp()
+
+@app.route("/api/ready")
+def api_ready():
+    """Readiness probe: 200 once every warm-up stage has finished (a failed stage is reported but does not
+    block; its work is retried lazily on first use), 503 while warming up. With WARMUP=0 it is 200 at once."""
+    report = WARMUP.report()
+    return jsonify(report), (200 if report["ready"] else 503)
+
+def _cache_counters() -> dict:
+    out = {}
+    for name, cache in (("dashboard", DASHBOARD_CACHE), ("series", SERIES_CACHE)):
+        for result, n in cache.stats().items():
+            if result in ("hits", "misses", "coalesced", "errors"):
+                out[(("cache", name), ("result", result))] = n
+    return out
+
+TELEMETRY.gauge("microgrid_sse_subscribers", "Connected /api/stream clients by source and site.", STREAM_HUB.subscriber_counts)
+TELEMETRY.gauge("microgrid_sse_producers", "Running SSE producer threads.", lambda: {(): STREAM_HUB.stats()["producers"]})
+TELEMETRY.gauge("microgrid_sse_dropped_total", "SSE events dropped for slow clients (connected clients only).",
+                lambda: {(): STREAM_HUB.stats()["dropped"]}, kind="counter")
+TELEMETRY.gauge("microgrid_sqlite_write_queue_depth", "Live ticks waiting for the default site's writer.",
+                lambda: {(): LIVE_WRITER.stats()["queue_depth"]})
+TELEMETRY.gauge("microgrid_response_cache_total", "Response cache lookups by cache and result.", _cache_counters, kind="counter")
+def _poller_stats(field) -> dict:
+    from urllib.parse import urlsplit
+    with _LIVE_POLLERS_LOCK:
+        pollers = list(_LIVE_POLLERS.values())
+    return {(("upstream", urlsplit(p.url).netloc),): field(p) for p in pollers}
+
+TELEMETRY.gauge("microgrid_live_poller_breaker_open", "1 while the live upstream's circuit breaker is open.",
+                lambda: _poller_stats(lambda p: int(p.state == "open")))
+TELEMETRY.gauge("microgrid_live_poller_delay_seconds", "Current delay between polls of the live upstream.",
+                lambda: _poller_stats(lambda p: p.delay))
+TELEMETRY.gauge("microgrid_live_points_total", "Distinct upstream live points published to streams.",
+                lambda: _poller_stats(lambda p: p.seq), kind="counter")
+TELEMETRY.gauge("microgrid_model_loaded", "1 once the base model is loaded.", lambda: {(): int(BASE_MODEL.loaded)})
+
+@app.route("/metrics")
+def metrics():
+    """Prometheus text exposition of TELEMETRY: request and stage latency histograms (the stages also come
+    back per request in the Server-Timing header), SSE subscribers and tick timing, SQLite write latency,
+    external API latency/errors and response cache counters."""
+    return Response(TELEMETRY.render(), mimetype="text/plain; version=0.0.4")
+
 def _find_free_port(candidates=(5000, 5050, 8000, 8080)):
     # Respect env var first
     if os.environ.get("PORT"):
@@ -1181,6 +4110,14 @@ def _find_free_port(candidates=(5000, 5050, 8000, 8080)):
         s.bind(("0.0.0.0", 0))
         return s.getsockname()[1]
 
+WARMUP.import_ms = round((time.perf_counter() - _IMPORT_T0) * 1000.0, 1)
+import multiprocessing
+# sweep/scenario pool workers (spawned, so they re-import this module) only evaluate slices: no warm-up there
+if os.environ.get("WARMUP", "1") not in ("0", "false", "no") and multiprocessing.parent_process() is None:
+    WARMUP.start()
+else:
+    WARMUP.skip()
+
 if __name__ == "__main__":
     port = _find_free_port()
     print(f"Starting Flask on port {port} (set PORT env var to override)")
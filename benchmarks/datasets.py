@@ -0,0 +1,75 @@
+"""Deterministic synthetic datasets for the benchmarks.
+
+Same columns and shape as data/consumption.db (timestamp, consumption_kW, temperature_C), generated from
+a seeded RNG so every run of a given (rows, freq, seed) produces identical data. Series end at a fixed
+anchor so forecasts, tariffs and the stubbed weather line up between runs.
+"""
+import json
+import os
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+ANCHOR = pd.Timestamp("2025-06-30 23:00:00")
+FREQS = {"h": "h", "hourly": "h", "min": "min", "minute": "min"}
+SIZES = {"1k": 1_000, "10k": 10_000, "100k": 100_000, "1m": 1_000_000}
+
+
+def parse_size(val) -> int:
+    """'10k' / '1m' / '2500' -> rows."""
+    val = str(val).strip().lower()
+    if val in SIZES:
+        return SIZES[val]
+    if val.endswith("k"):
+        return int(float(val[:-1]) * 1_000)
+    if val.endswith("m"):
+        return int(float(val[:-1]) * 1_000_000)
+    return int(val)
+
+
+def make_dataset(rows: int, freq: str = "h", seed: int = 0) -> pd.DataFrame:
+    """`rows` points at hourly ('h') or minute ('min') resolution ending at ANCHOR: daily and weekly load
+    cycles, a temperature-driven component and AR(1) noise, like the shipped synthetic CSV."""
+    freq = FREQS[freq]
+    rng = np.random.default_rng(seed)
+    idx = pd.date_range(end=ANCHOR, periods=int(rows), freq=freq)
+    hours = (idx.hour + idx.minute / 60.0).to_numpy()
+    dow = idx.dayofweek.to_numpy()
+    doy = idx.dayofyear.to_numpy()
+    temp = 24 + 4 * np.sin((doy - 30) / 365 * 2 * np.pi) + 3 * np.sin((hours - 9) / 24 * 2 * np.pi)
+    temp = temp + rng.normal(0, 0.4, size=len(idx))
+    base = 2.5 + 0.8 * (1 + np.sin((hours - 6) / 24 * 2 * np.pi)) + 0.2 * np.sin(hours / 24 * 4 * np.pi)
+    base = base * np.where(dow >= 5, 0.85, 1.0) + 0.05 * (temp - 24)
+    noise = rng.normal(0, 0.08, size=len(idx))
+    for i in range(1, len(noise)):
+        noise[i] += 0.6 * noise[i - 1]
+    load = np.maximum(0.2, base + noise)
+    return pd.DataFrame({"timestamp": idx, "consumption_kW": load, "temperature_C": temp})
+
+
+def write_sqlite(df: pd.DataFrame, path: str):
+    """Write `df` as the `consumption` table the app reads (timestamps as 'YYYY-MM-DD HH:MM:SS' text)."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    if os.path.exists(path):
+        os.remove(path)
+    conn = sqlite3.connect(path)
+    try:
+        conn.execute('CREATE TABLE consumption ("timestamp" TIMESTAMP, "consumption_kW" REAL, "temperature_C" REAL)')
+        ts = df["timestamp"].dt.strftime("%Y-%m-%d %H:%M:%S").tolist()
+        conn.executemany("INSERT INTO consumption VALUES (?, ?, ?)",
+                         zip(ts, df["consumption_kW"].tolist(), df["temperature_C"].tolist()))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def write_weather(path: str, start: pd.Timestamp = ANCHOR, days: int = 10, seed: int = 0):
+    """Hourly weather forecast file in the format WEATHER_API_URL accepts (file://...)."""
+    rng = np.random.default_rng(seed)
+    idx = pd.date_range(start=start, periods=days * 24, freq="h")
+    hours = idx.hour.to_numpy()
+    temp = 25 + 3 * np.sin((hours - 9) / 24 * 2 * np.pi) + rng.normal(0, 0.3, size=len(idx))
+    with open(path, "w") as f:
+        json.dump({"forecast": [{"timestamp": t.isoformat(), "temperature_C": round(float(v), 2)}
+                                for t, v in zip(idx, temp)]}, f)
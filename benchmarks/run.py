@@ -0,0 +1,232 @@
+"""Hot-path benchmarks for app.py: functions and endpoints over synthetic datasets of 1k-1M rows.
+
+Each dataset becomes a site (SITES_CONFIG) with its own SQLite file in a scratch directory, so the real
+data/ files are never touched. The weather API is a local forecast file and the live upstream is unset
+(stream ticks are simulated), so runs are offline and repeatable. Endpoints go through the Flask test client with the response
+caches cleared before every repetition (the model registry is kept warm, as in production).
+
+    python -m benchmarks.run                                  # 1k,10k,100k rows, hourly and minute data
+    python -m benchmarks.run --sizes 1k,1m --freqs h -k dashboard
+    python -m benchmarks.run --save-baseline                  # refresh benchmarks/baseline.json
+
+Results are written as JSON (--out) and compared with the baseline by best-of-run time (min_ms, the
+estimate least disturbed by other load on the machine); the exit status is 1 when any benchmark is slower
+than the baseline by more than --threshold (fraction, default 0.25), after scaling the baseline by the
+ratio of the two runs' calibration workload times. Suspected regressions are re-measured (--recheck)
+before they are reported.
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.datasets import make_dataset, parse_size, write_sqlite, write_weather
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+BASELINE_PATH = os.path.join(HERE, "baseline.json")
+
+
+def prepare(workdir: str, datasets: list, seed: int) -> dict:
+    """Write every dataset and the weather file, point the app's environment at them; returns site id -> frame."""
+    frames, sites = {}, []
+    for freq, rows in datasets:
+        sid = f"{freq}_{rows}"
+        df = make_dataset(rows, freq, seed)
+        write_sqlite(df, os.path.join(workdir, f"{sid}.db"))
+        frames[sid] = df
+        sites.append({"id": sid, "name": f"bench {sid}"})
+    with open(os.path.join(workdir, "sites.json"), "w") as f:
+        json.dump({"data_dir": workdir, "sites": sites}, f)
+    write_weather(os.path.join(workdir, "weather.json"), seed=seed)
+    os.environ["SITES_CONFIG"] = os.path.join(workdir, "sites.json")
+    os.environ["WEATHER_API_URL"] = "file://" + os.path.join(workdir, "weather.json")
+    os.environ.pop("LIVE_API_URL", None)
+    os.environ.pop("LIVE_API_TOKEN", None)
+    os.environ["WARMUP"] = "0"
+    return frames
+
+
+def measure(fn, setup=None, min_time: float = 0.5, min_reps: int = 3, max_reps: int = 200) -> dict:
+    """Time fn() after one untimed warm-up call; setup() runs before every call and is not timed.
+    The garbage collector is paused while timing, as timeit does."""
+    if setup:
+        setup()
+    fn()
+    times = []
+    gc.collect()
+    gc.disable()
+    try:
+        t_end = time.perf_counter() + min_time
+        while len(times) < min_reps or (time.perf_counter() < t_end and len(times) < max_reps):
+            if setup:
+                setup()
+            t0 = time.perf_counter()
+            fn()
+            times.append((time.perf_counter() - t0) * 1000.0)
+    finally:
+        gc.enable()
+    return {"median_ms": round(statistics.median(times), 4), "min_ms": round(min(times), 4),
+            "mean_ms": round(statistics.fmean(times), 4), "reps": len(times)}
+
+
+def calibrate() -> float:
+    """Best-of time (ms) of a fixed numpy + pure-Python workload. Stored with every run so a comparison can
+    factor out machine speed (different host, CPU throttling, noisy neighbours)."""
+    rng = np.random.default_rng(0)
+    x = rng.random(200_000)
+
+    def work():
+        np.sort(x)
+        np.cumsum(x)
+        sum(i * i for i in range(50_000))
+
+    return measure(work, min_time=0.5, min_reps=10)["min_ms"]
+
+
+def cases(app, sid: str, df: pd.DataFrame) -> list:
+    """(name, fn, setup) for one dataset."""
+    def settle():
+        # first forecasts per (site, algo) queue a residual backtest; let it finish outside the timed calls
+        app.RESIDUALS._executor.submit(lambda: None).result()
+
+    client = app.app.test_client()
+    snap = app.source_snapshot("db", sid)
+    frame = snap.frame()
+    preds, _, _ = app.forecast_frame(frame, snap, "rf", 24)
+    last_ts = pd.Timestamp(frame["timestamp"].iloc[-1])
+    last_kw = float(frame["consumption_kW"].iloc[-1])
+    stream = app._LiveStream("sim", 1.0, 1.0, 2.0, 50.0, sid)
+    settle()
+
+    def get(url):
+        def call():
+            r = client.get(url)
+            assert r.status_code == 200, (url, r.status_code)
+        return call
+
+    def clear_caches():
+        app.DASHBOARD_CACHE.clear()
+        app.SERIES_CACHE.clear()
+        settle()
+
+    return [
+        ("make_lag_features", lambda: app.make_lag_features(frame, n_lags=24), None),
+        ("detect_anomalies", lambda: app.detect_anomalies(frame), None),
+        ("compute_costs", lambda: app.compute_costs(last_ts, last_kw, preds, df_history=frame), None),
+        ("optimize_battery_adaptive", lambda: app.optimize_battery_adaptive(preds), None),
+        ("optimize_battery_optimal", lambda: app.optimize_battery_optimal(preds), None),
+        ("forecast_frame[rf]", lambda: app.forecast_frame(frame, snap, "rf", 24), None),
+        ("stream_tick", stream.next_event, None),
+        ("GET /api/dashboard[rf]", get(f"/api/dashboard?site={sid}&algo=rf"), clear_caches),
+        ("GET /api/dashboard[linear,optimal]", get(f"/api/dashboard?site={sid}&algo=linear&mode=optimal"), clear_caches),
+        ("GET /api/series[points=1000]", get(f"/api/series?site={sid}&points=1000"), clear_caches),
+    ]
+
+
+def compare(results: dict, baseline: dict, threshold: float, speed: float = 1.0) -> list:
+    """Benchmarks whose min_ms exceeds the baseline's (times `speed`, this machine's calibration relative to
+    the baseline's) by more than `threshold` and 0.05 ms."""
+    slower = []
+    for key, cur in results.items():
+        ref = baseline.get(key)
+        if not ref or not ref.get("min_ms"):
+            continue
+        ref_ms = ref["min_ms"] * speed
+        ratio = cur["min_ms"] / ref_ms
+        cur["baseline_ms"] = round(ref_ms, 4)
+        cur["ratio"] = round(ratio, 3)
+        if ratio > 1.0 + threshold and cur["min_ms"] - ref_ms > 0.05:
+            slower.append(key)
+    return slower
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    ap.add_argument("--sizes", default="1k,10k,100k", help="rows per dataset: 1k,10k,100k,1m or plain numbers")
+    ap.add_argument("--freqs", default="h,min", help="h (hourly) and/or min (minute) resolution")
+    ap.add_argument("-k", "--filter", default="", help="only benchmarks whose name contains this text")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--min-time", type=float, default=0.5, help="seconds spent per benchmark (at least 3 runs)")
+    ap.add_argument("--out", default=os.path.join(HERE, "results", "latest.json"))
+    ap.add_argument("--baseline", default=BASELINE_PATH)
+    ap.add_argument("--threshold", type=float, default=0.25, help="allowed slowdown vs baseline (0.25 = +25%%)")
+    ap.add_argument("--save-baseline", action="store_true", help="write the results to --baseline instead of comparing")
+    ap.add_argument("--recheck", type=int, default=2, help="times a suspected regression is re-measured before it is reported")
+    ap.add_argument("--no-calibration", action="store_true", help="compare raw times, without scaling by machine speed")
+    args = ap.parse_args(argv)
+
+    datasets = [(f.strip(), parse_size(s)) for f in args.freqs.split(",") if f.strip() for s in args.sizes.split(",") if s.strip()]
+    workdir = tempfile.mkdtemp(prefix="mg-bench-")
+    frames = prepare(workdir, datasets, args.seed)
+    os.chdir(ROOT)  # app.py resolves models/ and templates/ relative to the project root
+    sys.path.insert(0, ROOT)
+    import app
+
+    calibration = calibrate()
+    results, runners = {}, {}
+    for sid, df in frames.items():
+        for name, fn, setup in cases(app, sid, df):
+            if args.filter and args.filter not in name:
+                continue
+            key = f"{name}[{sid}]"
+            runners[key] = (fn, setup)
+            results[key] = measure(fn, setup, min_time=args.min_time)
+            print(f"{key:<58} {results[key]['median_ms']:>10.3f} ms  (n={results[key]['reps']})", flush=True)
+    calibration = min(calibration, calibrate())  # best of before/after: one slow phase cannot skew the scale
+
+    report = {
+        "meta": {
+            "created": pd.Timestamp.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(), "platform": platform.platform(), "machine": platform.machine(),
+            "numpy": np.__version__, "pandas": pd.__version__,
+            "sizes": args.sizes, "freqs": args.freqs, "seed": args.seed,
+            "calibration_ms": calibration,
+        },
+        "results": results,
+    }
+    status = 0
+    if args.save_baseline:
+        target = args.baseline
+    else:
+        target = args.out
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+            base_cal = baseline.get("meta", {}).get("calibration_ms")
+            speed = calibration / base_cal if base_cal and not args.no_calibration else 1.0
+            print(f"machine speed vs baseline: x{1 / speed:.2f}")
+            slower = compare(results, baseline.get("results", {}), args.threshold, speed)
+            for _ in range(args.recheck):
+                if not slower:
+                    break
+                # re-measure suspects and keep the best run, so a transient slow phase is not reported
+                for key in slower:
+                    again = measure(*runners[key], min_time=args.min_time)
+                    if again["min_ms"] < results[key]["min_ms"]:
+                        results[key] = again
+                slower = compare({k: results[k] for k in slower}, baseline.get("results", {}), args.threshold, speed)
+            for key in slower:
+                r = results[key]
+                print(f"REGRESSION {key}: {r['min_ms']:.3f} ms vs {r['baseline_ms']:.3f} ms (x{r['ratio']})")
+            report["regressions"] = slower
+            status = 1 if slower else 0
+    for sid in frames:
+        app.SITES.writer(sid).close()
+    os.makedirs(os.path.dirname(target) or ".", exist_ok=True)
+    with open(target, "w") as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+    print(f"wrote {target}")
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,205 @@
+"""Load generator for the SSE endpoints: opens many concurrent /api/stream clients and reports connect
+latency, tick delivery and the server's memory per connection.
+
+By default it starts `python -m stream_service` on a free local port over a scratch synthetic site (so
+data/ is never written) and reads the server's RSS from /healthz before and after connecting:
+
+    python -m benchmarks.sse_load --clients 10000 --duration 20
+    python -m benchmarks.sse_load --url http://127.0.0.1:8001/api/stream?source=sim --clients 2000
+
+Each client is a bare asyncio protocol that counts `event: tick` frames, so the generator itself stays
+light enough to run next to the server. Many clients need a matching open-file limit (`ulimit -n`) on both
+sides; the generator raises its soft limit to the hard limit when it can.
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from urllib.parse import urlsplit
+
+from benchmarks.datasets import make_dataset, write_sqlite
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+MARK = b"event: tick"
+
+
+class _Client(asyncio.Protocol):
+    __slots__ = ("request", "t0", "connected", "first_tick", "ticks", "tail", "status", "lost")
+
+    def __init__(self, request: bytes):
+        self.request = request
+        self.t0 = time.perf_counter()
+        self.connected = asyncio.get_running_loop().create_future()
+        self.first_tick = None
+        self.ticks = 0
+        self.tail = b""
+        self.status = None
+        self.lost = False
+
+    def connection_made(self, transport):
+        transport.write(self.request)
+
+    def data_received(self, data: bytes):
+        if self.status is None:
+            self.status = int(data.split(b" ", 2)[1]) if data.startswith(b"HTTP/") else 0
+            if not self.connected.done():
+                self.connected.set_result(time.perf_counter() - self.t0)
+        chunk = self.tail + data
+        n = chunk.count(MARK)
+        if n:
+            self.ticks += n
+            if self.first_tick is None:
+                self.first_tick = time.perf_counter() - self.t0
+        self.tail = chunk[-(len(MARK) - 1):]
+
+    def connection_lost(self, exc):
+        self.lost = True
+        if not self.connected.done():
+            self.connected.set_exception(exc or ConnectionError("closed before the response"))
+
+
+def _get_json(host: str, port: int, path: str, timeout: float = 10.0) -> dict:
+    with socket.create_connection((host, port), timeout=timeout) as s:
+        s.sendall(f"GET {path} HTTP/1.1\r\nHost: {host}\r\nConnection: close\r\n\r\n".encode())
+        raw = b""
+        while True:
+            part = s.recv(65536)
+            if not part:
+                break
+            raw += part
+    return json.loads(raw.partition(b"\r\n\r\n")[2])
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _raise_fd_limit():
+    try:
+        import resource
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+        return hard
+    except Exception:
+        return None
+
+
+def start_server(interval: float):
+    """Start stream_service over a scratch site 'load'; returns (process, base URL)."""
+    workdir = tempfile.mkdtemp(prefix="mg-sse-")
+    write_sqlite(make_dataset(2_000, "min"), os.path.join(workdir, "load.db"))
+    with open(os.path.join(workdir, "sites.json"), "w") as f:
+        json.dump({"data_dir": workdir, "sites": [{"id": "load", "name": "load test"}]}, f)
+    port = _free_port()
+    env = {**os.environ, "SITES_CONFIG": os.path.join(workdir, "sites.json"), "STREAM_INTERVAL_S": str(interval),
+           "WARMUP": "0", "PYTHONUNBUFFERED": "1"}
+    env.pop("LIVE_API_URL", None)
+    proc = subprocess.Popen([sys.executable, "-m", "stream_service", "--host", "127.0.0.1", "--port", str(port)],
+                            cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.STDOUT)
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        try:
+            _get_json("127.0.0.1", port, "/healthz", timeout=1.0)
+            return proc, f"http://127.0.0.1:{port}/api/stream?source=sim&site=load"
+        except OSError:
+            if proc.poll() is not None:
+                raise RuntimeError("stream_service exited during startup")
+            time.sleep(0.2)
+    proc.kill()
+    raise RuntimeError("stream_service did not start within 60 s")
+
+
+async def run(url: str, clients: int, duration: float, ramp: int, health: bool) -> dict:
+    parts = urlsplit(url)
+    host, port = parts.hostname, parts.port or 80
+    target = parts.path + (f"?{parts.query}" if parts.query else "")
+    request = f"GET {target} HTTP/1.1\r\nHost: {parts.netloc}\r\nAccept: text/event-stream\r\n\r\n".encode()
+    loop = asyncio.get_running_loop()
+    before = await loop.run_in_executor(None, _get_json, host, port, "/healthz") if health else None
+
+    gate = asyncio.Semaphore(ramp)
+    conns, protos, errors = [], [], 0
+
+    async def connect():
+        nonlocal errors
+        async with gate:
+            try:
+                transport, proto = await loop.create_connection(lambda: _Client(request), host, port)
+                await asyncio.wait_for(proto.connected, 30)
+                conns.append(transport)
+                protos.append(proto)
+            except Exception:
+                errors += 1
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(connect() for _ in range(clients)))
+    connect_s = time.perf_counter() - t0
+    after_connect = await loop.run_in_executor(None, _get_json, host, port, "/healthz") if health else None
+    start_ticks = sum(p.ticks for p in protos)
+    await asyncio.sleep(duration)
+    ticks = sum(p.ticks for p in protos) - start_ticks
+    after = await loop.run_in_executor(None, _get_json, host, port, "/healthz") if health else None
+    for t in conns:
+        t.close()
+
+    latencies = sorted(p.connected.result() * 1000.0 for p in protos)
+    firsts = sorted(p.first_tick * 1000.0 for p in protos if p.first_tick is not None)
+    ok = [p for p in protos if p.status == 200 and not p.lost]
+    report = {
+        "clients": clients, "connected": len(ok), "errors": errors + (len(protos) - len(ok)),
+        "connect_s": round(connect_s, 2),
+        "connect_ms": {"p50": round(statistics.median(latencies), 2), "p99": round(latencies[int(0.99 * (len(latencies) - 1))], 2)} if latencies else None,
+        "first_tick_ms_p50": round(statistics.median(firsts), 1) if firsts else None,
+        "ticks_per_client_per_s": round(ticks / max(1, len(ok)) / duration, 3),
+        "clients_without_ticks": sum(1 for p in ok if p.ticks == 0),
+    }
+    if health:
+        rss0, rss1 = before["rss_mb"], after_connect["rss_mb"]
+        report["server"] = {
+            "rss_mb_idle": rss0, "rss_mb_connected": rss1, "rss_mb_end": after["rss_mb"],
+            "kb_per_connection": round((rss1 - rss0) * 1024.0 / max(1, len(ok)), 2) if rss0 and rss1 else None,
+            "streams": after["streams"], "dropped": after["dropped"],
+        }
+    return report
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    ap.add_argument("--url", help="stream URL to load; default: start stream_service locally")
+    ap.add_argument("--clients", type=int, default=10_000)
+    ap.add_argument("--duration", type=float, default=20.0, help="seconds to hold the connections after connecting")
+    ap.add_argument("--ramp", type=int, default=500, help="connection attempts in flight at once")
+    ap.add_argument("--interval", type=float, default=2.0, help="tick interval of the started server")
+    ap.add_argument("--no-health", action="store_true", help="target has no /healthz (e.g. the Flask app)")
+    ap.add_argument("--out", help="also write the report as JSON")
+    args = ap.parse_args(argv)
+
+    _raise_fd_limit()
+    proc = None
+    url = args.url
+    if not url:
+        proc, url = start_server(args.interval)
+    try:
+        report = asyncio.run(run(url, args.clients, args.duration, args.ramp, not args.no_health))
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait(10)
+    print(json.dumps(report, indent=2))
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+    return 0 if report["connected"] == args.clients else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
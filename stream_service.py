@@ -0,0 +1,364 @@
+"""Asyncio-native server for /api/stream, for thousands of concurrent SSE clients per process.
+
+Serves the same events as the Flask endpoint (a `retry:` preamble, then `event: tick` frames built by
+app._LiveStream, or `event: stream_error` while a stream cannot start) without a thread or greenlet per
+client:
+
+- one producer task per (source, parameters, site) key computes each tick once. The pandas/SQLite work of
+  a tick runs in a small thread pool (STREAM_WORKERS) and live points come from the shared
+  app.LivePoller thread, so the event loop never waits on either;
+- clients are plain asyncio protocols registered on their channel; a tick is fanned out with one
+  non-blocking transport.write per client. A client whose unsent data is above STREAM_MAX_BUFFER bytes
+  skips ticks until it catches up, like the bounded queues of the Flask hub.
+
+Run it next to the Flask app and send /api/stream to it, through a reverse proxy or by pointing the
+dashboard at it with STREAM_URL (e.g. STREAM_URL=http://localhost:8001/api/stream):
+
+    python -m stream_service --port 8001
+
+`app` is the same service as an ASGI application, for an ASGI server (`uvicorn stream_service:app`) or to
+mount under a path of an ASGI stack. /healthz reports connections and memory; /metrics is the Prometheus
+text of this process. benchmarks/sse_load.py is the matching load generator.
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs
+
+os.environ.setdefault("WARMUP", "0")  # streams never use the forecasting model; don't load it here
+import app as core
+
+PREAMBLE = b"retry: 2000\n\n"
+KEEPALIVE = b": keep-alive\n\n"
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 431: "Request Header Fields Too Large"}
+
+
+class _Channel:
+    """One stream key: its producer task, connected clients and the last event."""
+    __slots__ = ("key", "make_state", "clients", "last", "task", "idle_since")
+
+    def __init__(self, key: tuple, make_state):
+        self.key = key
+        self.make_state = make_state
+        self.clients = set()  # anything with push(bytes) -> bool
+        self.last = None
+        self.task = None
+        self.idle_since = None
+
+
+class StreamService:
+    """Channels, producers and routing shared by the socket server and the ASGI app. Producers stop once
+    their channel has had no clients for `idle_grace` seconds; a producer whose state cannot be built (e.g.
+    the database is unavailable) sends its clients a `stream_error` event and retries with backoff up to
+    `max_backoff` seconds, like the Flask hub."""
+
+    def __init__(self, interval: float = 2.0, idle_grace: float = 10.0, keepalive: float = 15.0,
+                 workers: int = 4, max_buffer: int = 64 * 1024, allow_origin: str = "*", max_backoff: float = 30.0):
+        self.interval = float(interval)
+        self.max_backoff = float(max_backoff)
+        self.idle_grace = float(idle_grace)
+        self.keepalive = float(keepalive)
+        self.max_buffer = int(max_buffer)
+        self.allow_origin = allow_origin
+        self.executor = ThreadPoolExecutor(max_workers=int(workers), thread_name_prefix="sse-tick")
+        self.channels = {}
+        self.counters = {"connections": 0, "streams": 0, "dropped": 0}
+
+    def stream_params(self, query: str):
+        """(key, make_state, None) for the query string of a stream request, or (None, None, (status, body))."""
+        q = {k: v[-1] for k, v in parse_qs(query).items()}
+        site = core.resolve_site(q.get("site"))
+        if site is None:
+            return None, None, (404, {"error": "unknown_site", "detail": q.get("site")})
+        source = q.get("source", "live").lower()
+        try:
+            factor = float(q.get("factor", 1.0))
+            pv_factor = float(q.get("pv_factor", site.pv_factor))
+            batt_limit = float(q.get("batt_limit", site.batt_limit_kw))
+            soc_init = float(q.get("soc_init", site.soc_init_pct))
+        except ValueError as e:
+            return None, None, (400, {"error": "bad_request", "detail": str(e)})
+        key = (source, factor, pv_factor, batt_limit, soc_init, site.id)
+
+        def make_state():
+            return core._LiveStream(source, factor, pv_factor, batt_limit, soc_init, site.id)
+
+        return key, make_state, None
+
+    def route(self, method: str, path: str, query: str):
+        """("stream", key, make_state) or (status, body bytes, content type) for a request."""
+        if method != "GET":
+            return 405, b'{"error": "method_not_allowed"}', "application/json"
+        if path == "/api/stream":
+            key, make_state, err = self.stream_params(query)
+            if err is not None:
+                return err[0], json.dumps(err[1]).encode(), "application/json"
+            return "stream", key, make_state
+        if path == "/healthz":
+            return 200, json.dumps(self.stats()).encode(), "application/json"
+        if path == "/metrics":
+            return 200, core.TELEMETRY.render().encode(), "text/plain; version=0.0.4; charset=utf-8"
+        return 404, b'{"error": "not_found"}', "application/json"
+
+    def stream_headers(self) -> list:
+        headers = [("Content-Type", "text/event-stream"), ("Cache-Control", "no-cache"), ("X-Accel-Buffering", "no")]
+        if self.allow_origin:
+            headers.append(("Access-Control-Allow-Origin", self.allow_origin))
+        return headers
+
+    def subscribe(self, key: tuple, make_state, client) -> _Channel:
+        chan = self.channels.get(key)
+        if chan is None:
+            chan = self.channels[key] = _Channel(key, make_state)
+            chan.task = asyncio.get_running_loop().create_task(self._run(chan))
+        chan.clients.add(client)
+        chan.idle_since = None
+        self.counters["streams"] += 1
+        if chan.last is not None:
+            client.push(chan.last)  # new clients see the current state right away
+        return chan
+
+    def unsubscribe(self, chan: _Channel, client):
+        if client in chan.clients:
+            chan.clients.discard(client)
+            self.counters["streams"] -= 1
+            if not chan.clients:
+                chan.idle_since = time.monotonic()
+
+    def publish(self, chan: _Channel, data: bytes):
+        for client in tuple(chan.clients):
+            if not client.push(data):
+                self.counters["dropped"] += 1
+
+    async def _run(self, chan: _Channel):
+        loop = asyncio.get_running_loop()
+        state, due = None, None
+        backoff = self.interval
+        last_sent = time.monotonic()
+        while True:
+            delay = self.interval
+            if state is None:
+                # same failure semantics as app.StreamHub: a stream_error event, then retries with backoff
+                try:
+                    state = await loop.run_in_executor(self.executor, chan.make_state)
+                    backoff = self.interval
+                except Exception as e:
+                    core.TELEMETRY.inc("microgrid_stream_errors_total", (("stage", "state"),))
+                    self.publish(chan, core.stream_error_event(e, backoff).encode())
+                    last_sent = time.monotonic()
+                    delay, backoff = backoff, min(backoff * 2, self.max_backoff)
+            if state is not None:
+                t0 = time.monotonic()
+                if due is not None:
+                    core.TELEMETRY.observe("microgrid_stream_tick_lag_seconds", max(0.0, t0 - due))
+                try:
+                    event = await loop.run_in_executor(self.executor, state.next_event)
+                except Exception:
+                    core.TELEMETRY.inc("microgrid_stream_errors_total", (("stage", "tick"),))
+                    event = None
+                core.TELEMETRY.observe("microgrid_stream_tick_seconds", time.monotonic() - t0)
+                if event is not None:
+                    chan.last = event.encode()
+                    self.publish(chan, chan.last)
+                    last_sent = time.monotonic()
+            if time.monotonic() - last_sent >= self.keepalive:
+                self.publish(chan, KEEPALIVE)
+                last_sent = time.monotonic()
+            if not chan.clients and chan.idle_since is not None and time.monotonic() - chan.idle_since >= self.idle_grace:
+                break
+            due = time.monotonic() + delay
+            await asyncio.sleep(delay)
+        # no await since the check above: nobody can have subscribed in between
+        del self.channels[chan.key]
+
+    def stats(self) -> dict:
+        return {
+            **self.counters,
+            "channels": len(self.channels),
+            "rss_mb": core._rss_mb(),
+            "interval_s": self.interval,
+        }
+
+    def subscriber_counts(self) -> dict:
+        counts = {}
+        for key, chan in self.channels.items():
+            labels = (("source", key[0]), ("site", key[-1]))
+            counts[labels] = counts.get(labels, 0) + len(chan.clients)
+        return counts
+
+
+class SSEProtocol(asyncio.Protocol):
+    """One client connection of the built-in server: reads the request head, then streams its channel or
+    answers a small route and closes. No coroutine or queue per client, which keeps idle clients cheap."""
+    __slots__ = ("service", "transport", "buf", "chan")
+
+    def __init__(self, service: StreamService):
+        self.service = service
+        self.transport = None
+        self.buf = b""
+        self.chan = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.service.counters["connections"] += 1
+
+    def data_received(self, data: bytes):
+        if self.chan is not None or self.transport.is_closing():
+            return  # nothing more is expected from a streaming client
+        self.buf += data
+        if b"\r\n\r\n" not in self.buf:
+            if len(self.buf) > 16 * 1024:
+                self._reply(431, b'{"error": "headers_too_large"}', "application/json")
+            return
+        line = self.buf.split(b"\r\n", 1)[0].decode("latin-1")
+        self.buf = b""
+        try:
+            method, target, _ = line.split(" ", 2)
+        except ValueError:
+            self._reply(400, b'{"error": "bad_request"}', "application/json")
+            return
+        path, _, query = target.partition("?")
+        routed = self.service.route(method, path, query)
+        if routed[0] != "stream":
+            self._reply(*routed)
+            return
+        head = "HTTP/1.1 200 OK\r\n" + "".join(f"{k}: {v}\r\n" for k, v in self.service.stream_headers()) + "\r\n"
+        self.transport.write(head.encode("latin-1") + PREAMBLE)
+        self.chan = self.service.subscribe(routed[1], routed[2], self)
+
+    def push(self, data: bytes) -> bool:
+        transport = self.transport
+        if transport.is_closing() or transport.get_write_buffer_size() > self.service.max_buffer:
+            return False
+        transport.write(data)
+        return True
+
+    def _reply(self, status: int, body: bytes, content_type: str):
+        head = f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\nContent-Type: {content_type}\r\nContent-Length: {len(body)}\r\n"
+        if self.service.allow_origin:
+            head += f"Access-Control-Allow-Origin: {self.service.allow_origin}\r\n"
+        self.transport.write((head + "Connection: close\r\n\r\n").encode("latin-1") + body)
+        self.transport.close()
+
+    def connection_lost(self, exc):
+        if self.chan is not None:
+            self.service.unsubscribe(self.chan, self)
+            self.chan = None
+        self.service.counters["connections"] -= 1
+
+
+class _AsgiClient:
+    __slots__ = ("pending", "wake", "closed")
+
+    def __init__(self):
+        self.pending = []
+        self.wake = asyncio.Event()
+        self.closed = False
+
+    def push(self, data: bytes) -> bool:
+        self.pending.append(data)
+        self.wake.set()
+        if len(self.pending) > 8:
+            del self.pending[0]  # slow client: skip to the newest ticks
+            return False
+        return True
+
+
+def make_asgi(service: StreamService):
+    """The service as an ASGI 3 application (http and lifespan scopes)."""
+
+    async def asgi(scope, receive, send):
+        if scope["type"] == "lifespan":
+            while True:
+                message = await receive()
+                if message["type"] == "lifespan.startup":
+                    await send({"type": "lifespan.startup.complete"})
+                elif message["type"] == "lifespan.shutdown":
+                    service.executor.shutdown(wait=False)
+                    await send({"type": "lifespan.shutdown.complete"})
+                    return
+        if scope["type"] != "http":
+            return
+        service.counters["connections"] += 1
+        try:
+            routed = service.route(scope["method"], scope["path"], scope.get("query_string", b"").decode("latin-1"))
+            if routed[0] != "stream":
+                status, body, content_type = routed
+                headers = [(b"content-type", content_type.encode())]
+                if service.allow_origin:
+                    headers.append((b"access-control-allow-origin", service.allow_origin.encode()))
+                await send({"type": "http.response.start", "status": status, "headers": headers})
+                await send({"type": "http.response.body", "body": body})
+                return
+            client = _AsgiClient()
+            headers = [(k.lower().encode(), v.encode()) for k, v in service.stream_headers()]
+            await send({"type": "http.response.start", "status": 200, "headers": headers})
+            await send({"type": "http.response.body", "body": PREAMBLE, "more_body": True})
+            chan = service.subscribe(routed[1], routed[2], client)
+
+            async def watch_disconnect():
+                while (await receive())["type"] != "http.disconnect":
+                    pass
+                client.closed = True
+                client.wake.set()
+
+            watcher = asyncio.ensure_future(watch_disconnect())
+            try:
+                while True:
+                    await client.wake.wait()
+                    client.wake.clear()
+                    if client.closed:
+                        break
+                    data, client.pending = b"".join(client.pending), []
+                    await send({"type": "http.response.body", "body": data, "more_body": True})
+            finally:
+                watcher.cancel()
+                service.unsubscribe(chan, client)
+        finally:
+            service.counters["connections"] -= 1
+
+    return asgi
+
+
+SERVICE = StreamService(
+    interval=float(os.environ.get("STREAM_INTERVAL_S", "2")),
+    workers=int(os.environ.get("STREAM_WORKERS", "4")),
+    max_buffer=int(os.environ.get("STREAM_MAX_BUFFER", str(64 * 1024))),
+    allow_origin=os.environ.get("STREAM_ALLOW_ORIGIN", "*"),
+)
+app = make_asgi(SERVICE)
+
+# /metrics of this process reports its own clients under the same names as the Flask hub
+core.TELEMETRY.gauge("microgrid_sse_subscribers", "Connected /api/stream clients by source and site.", SERVICE.subscriber_counts)
+core.TELEMETRY.gauge("microgrid_sse_producers", "Running SSE producer tasks.", lambda: {(): len(SERVICE.channels)})
+core.TELEMETRY.gauge("microgrid_sse_dropped_total", "SSE events skipped for slow clients.",
+                     lambda: {(): SERVICE.counters["dropped"]}, kind="counter")
+
+
+async def serve(host: str = "0.0.0.0", port: int = 8001, service: StreamService = SERVICE, backlog: int = 4096):
+    loop = asyncio.get_running_loop()
+    server = await loop.create_server(lambda: SSEProtocol(service), host, port, backlog=backlog, reuse_address=True)
+    print(f"stream service on http://{host}:{port}/api/stream", flush=True)
+    async with server:
+        await server.serve_forever()
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    ap.add_argument("--host", default="0.0.0.0")
+    ap.add_argument("--port", type=int, default=int(os.environ.get("STREAM_PORT", "8001")))
+    ap.add_argument("--backlog", type=int, default=4096)
+    args = ap.parse_args(argv)
+    try:
+        asyncio.run(serve(args.host, args.port, backlog=args.backlog))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        SERVICE.executor.shutdown(wait=False)
+
+
+if __name__ == "__main__":
+    main()